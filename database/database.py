@@ -1,6 +1,7 @@
 from tortoise import Tortoise
 
 from database import MODELS_PATHS
+from database.migrate import check_indexes, migrate
 
 
 async def init_database(database_url: str):
@@ -10,4 +11,5 @@ async def init_database(database_url: str):
         modules=dict(models=MODELS_PATHS),
     )
 
-    await Tortoise.generate_schemas()
+    await migrate()
+    await check_indexes()
@@ -0,0 +1,147 @@
+"""Applies the schema migrations in database/migrations and reports missing indexes.
+
+    python -m database.migrate            # apply the pending migrations
+    python -m database.migrate status     # list the migrations and whether they are applied
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import pkgutil
+import re
+from dataclasses import dataclass
+from types import ModuleType
+
+from dotenv import load_dotenv
+from tortoise import Tortoise, connections, timezone
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+
+from database import MODELS_PATHS
+from database import migrations as migrations_package
+from database.migrations import to_dialect
+
+# Held while migrating, so processes starting together apply each migration once
+MIGRATION_LOCK_ID = 720_431
+
+CREATE_MIGRATIONS_TABLE_SQL = """CREATE TABLE IF NOT EXISTS "schema_migrations" (
+    "version" INT NOT NULL PRIMARY KEY,
+    "name" TEXT NOT NULL,
+    "applied_at" {timestamp} NOT NULL
+)"""
+
+POSTGRES_INDEXES_SQL = 'SELECT tablename AS "table", indexname AS name FROM pg_indexes'
+# Full-text tables are counted too, they are SQLite's only way to index text search
+SQLITE_INDEXES_SQL = """SELECT tbl_name AS "table", name FROM sqlite_master
+WHERE type = 'index' OR sql LIKE 'CREATE VIRTUAL TABLE%'"""
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    module: ModuleType
+
+
+def load_migrations() -> list[Migration]:
+    """Every migration module, ordered by version."""
+    found: list[Migration] = []
+    for info in pkgutil.iter_modules(migrations_package.__path__):
+        match = re.fullmatch(r"m(\d+)_(\w+)", info.name)
+        if match:
+            module = importlib.import_module(f"{migrations_package.__name__}.{info.name}")
+            found.append(Migration(int(match[1]), match[2], module))
+
+    found.sort(key=lambda m: m.version)
+    versions = [m.version for m in found]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Two migrations share a version: {versions}")
+    return found
+
+
+async def applied_versions(conn) -> set[int]:
+    rows = await conn.execute_query_dict('SELECT "version" FROM "schema_migrations"')
+    return {row["version"] for row in rows}
+
+
+async def migrate(connection_name: str = "default") -> list[Migration]:
+    """Applies the pending migrations in a single transaction, returning the ones applied."""
+    dialect = connections.get(connection_name).capabilities.dialect
+    timestamp = "TIMESTAMPTZ" if dialect == "postgres" else "TIMESTAMP"
+    async with in_transaction(connection_name) as conn:
+        if dialect == "postgres":
+            await conn.execute_query("SELECT pg_advisory_xact_lock($1)", [MIGRATION_LOCK_ID])
+        await conn.execute_query(CREATE_MIGRATIONS_TABLE_SQL.format(timestamp=timestamp))
+
+        applied = await applied_versions(conn)
+        pending = [m for m in load_migrations() if m.version not in applied]
+        for migration in pending:
+            logger.info(f"Applying migration {migration.version} {migration.name}")
+            await migration.module.upgrade(conn, dialect)
+            await conn.execute_query(
+                to_dialect(
+                    'INSERT INTO "schema_migrations" ("version", "name", "applied_at") '
+                    "VALUES (?, ?, ?)",
+                    dialect,
+                ),
+                [migration.version, migration.name, timezone.now()],
+            )
+
+    return pending
+
+
+async def missing_indexes(connection_name: str = "default") -> list[tuple[str, str]]:
+    """The (table, index) pairs created by the migrations that the database does not have."""
+    conn = connections.get(connection_name)
+    dialect = conn.capabilities.dialect
+    sql = POSTGRES_INDEXES_SQL if dialect == "postgres" else SQLITE_INDEXES_SQL
+    existing = {(row["table"], row["name"]) for row in await conn.execute_query_dict(sql)}
+    expected = []
+    for migration in load_migrations():
+        indexes = getattr(migration.module, "INDEXES", [])
+        # Indexes that differ between the databases are listed by dialect
+        if isinstance(indexes, dict):
+            indexes = indexes.get(dialect, [])
+        expected.extend(indexes)
+    return [index for index in expected if index not in existing]
+
+
+async def check_indexes(connection_name: str = "default") -> bool:
+    """Logs an error for every missing index, returning whether all of them exist."""
+    missing = await missing_indexes(connection_name)
+    for table, name in missing:
+        logger.error(f"Index '{name}' on '{table}' is missing, lookups on it will scan the table")
+    return not missing
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("command", nargs="?", choices=["up", "status"], default="up")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    await Tortoise.init(db_url=os.getenv("DATABASE_URL"), modules=dict(models=MODELS_PATHS))
+    try:
+        if args.command == "up":
+            applied = await migrate()
+            print(f"Applied {len(applied)} migrations")
+            await check_indexes()
+        else:
+            try:
+                applied = await applied_versions(connections.get("default"))
+            except OperationalError:
+                # Nothing has been migrated yet
+                applied = set()
+            for migration in load_migrations():
+                state = "applied" if migration.version in applied else "pending"
+                print(f"{migration.version:04} {migration.name:<40} {state}")
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
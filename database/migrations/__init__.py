@@ -0,0 +1,72 @@
+"""Versioned schema migrations, applied in order by database.migrate.
+
+Each module is named m<version>_<name>.py and defines an async upgrade(conn, dialect) run
+inside the transaction that records it, plus INDEXES, the (table, index) pairs it creates, which
+are checked for at startup. INDEXES can instead map each dialect to the pairs created on it. A migration must never change once released, add a new one instead.
+"""
+
+
+def to_dialect(sql: str, dialect: str) -> str:
+    """Turns the ? placeholders of a query into $1, $2... for Postgres."""
+    if dialect != "postgres":
+        return sql
+
+    parts = sql.split("?")
+    return parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], start=1))
+
+
+def split_statements(sql: str) -> list[str]:
+    """Splits a script on the semicolons that end its lines.
+
+    Statements are run one at a time, as SQLite's executescript would commit the transaction.
+    """
+    return [statement.strip() for statement in sql.split(";\n") if statement.strip()]
+
+
+async def merge_movies(conn, dialect: str, pairs: list[list[int]]):
+    """Moves the sources of each [kept, duplicate] pair of movies to the kept movie.
+
+    The duplicates are deleted, their sources may then need merging with merge_duplicate_sources.
+    """
+    if not pairs:
+        return
+
+    await conn.execute_many(
+        to_dialect('UPDATE "movie_sources" SET "movie_id" = ? WHERE "movie_id" = ?', dialect), pairs
+    )
+    await conn.execute_many(
+        to_dialect('DELETE FROM "movies" WHERE "id" = ?', dialect), [[dup] for __, dup in pairs]
+    )
+
+
+async def merge_duplicate_sources(conn, dialect: str):
+    """Merges the sources of the same site for one movie into the oldest, keeping every review."""
+    sources = await conn.execute_query_dict(
+        'SELECT "id", "movie_id", "name" FROM "movie_sources" ORDER BY "id"'
+    )
+    pairs = duplicates(sources, lambda s: (s["movie_id"], s["name"]))
+    if not pairs:
+        return
+
+    for table in ("reviews", "scrape_jobs"):
+        await conn.execute_many(
+            to_dialect(f'UPDATE "{table}" SET "source_id" = ? WHERE "source_id" = ?', dialect),
+            pairs,
+        )
+    # The kept source's latest review is backfilled from the merged history if it has none
+    for table, column in (("latest_reviews", "source_id"), ("movie_sources", "id")):
+        await conn.execute_many(
+            to_dialect(f'DELETE FROM "{table}" WHERE "{column}" = ?', dialect),
+            [[dup] for __, dup in pairs],
+        )
+
+
+def duplicates(rows: list[dict], key) -> list[list]:
+    """Pairs the id of each row with the id of the first row sharing its key."""
+    first: dict = {}
+    pairs = []
+    for row in rows:
+        kept = first.setdefault(key(row), row["id"])
+        if kept != row["id"]:
+            pairs.append([kept, row["id"]])
+    return pairs
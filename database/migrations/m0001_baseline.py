@@ -0,0 +1,133 @@
+"""The schema as it was created by Tortoise's generate_schemas before migrations were added.
+
+Every statement only creates what is missing, so databases created by generate_schemas adopt
+the migrations without changes.
+"""
+from database.migrations import split_statements
+
+POSTGRES_SQL = """CREATE TABLE IF NOT EXISTS "data_version" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "version" INT NOT NULL  DEFAULT 0,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS "movies" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "title" TEXT NOT NULL,
+    "release_date" DATE,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS "movie_sources" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "name" TEXT NOT NULL,
+    "url" TEXT NOT NULL,
+    "movie_id" INT NOT NULL REFERENCES "movies" ("id") ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS "latest_reviews" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "audience_score" INT,
+    "audience_count" TEXT,
+    "critic_score" INT,
+    "critic_count" TEXT,
+    "scraped_at" TIMESTAMPTZ NOT NULL,
+    "changed_at" TIMESTAMPTZ NOT NULL,
+    "source_id" INT NOT NULL UNIQUE REFERENCES "movie_sources" ("id") ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS "reviews" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "audience_score" INT,
+    "audience_count" TEXT,
+    "critic_score" INT,
+    "critic_count" TEXT,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "source_id" INT NOT NULL REFERENCES "movie_sources" ("id") ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS "scrape_jobs" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "status" TEXT NOT NULL,
+    "attempts" INT NOT NULL  DEFAULT 0,
+    "available_at" TIMESTAMPTZ NOT NULL,
+    "worker" TEXT,
+    "lease_expires_at" TIMESTAMPTZ,
+    "last_error" TEXT,
+    "created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "source_id" INT NOT NULL REFERENCES "movie_sources" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_scrape_jobs_status_9f3556" ON "scrape_jobs" ("status", "available_at");
+CREATE TABLE IF NOT EXISTS "source_resolutions" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "site" TEXT NOT NULL,
+    "title_key" TEXT NOT NULL,
+    "year" INT,
+    "url" TEXT,
+    "resolved_at" TIMESTAMPTZ NOT NULL,
+    CONSTRAINT "uid_source_reso_site_823828" UNIQUE ("site", "title_key", "year")
+);"""
+
+SQLITE_SQL = """CREATE TABLE IF NOT EXISTS "data_version" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "version" INT NOT NULL  DEFAULT 0,
+    "updated_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS "movies" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "title" TEXT NOT NULL,
+    "release_date" DATE,
+    "created_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS "movie_sources" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "name" TEXT NOT NULL,
+    "url" TEXT NOT NULL,
+    "movie_id" INT NOT NULL REFERENCES "movies" ("id") ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS "latest_reviews" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "audience_score" INT,
+    "audience_count" TEXT,
+    "critic_score" INT,
+    "critic_count" TEXT,
+    "scraped_at" TIMESTAMP NOT NULL,
+    "changed_at" TIMESTAMP NOT NULL,
+    "source_id" INT NOT NULL UNIQUE REFERENCES "movie_sources" ("id") ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS "reviews" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "audience_score" INT,
+    "audience_count" TEXT,
+    "critic_score" INT,
+    "critic_count" TEXT,
+    "created_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "source_id" INT NOT NULL REFERENCES "movie_sources" ("id") ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS "scrape_jobs" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "status" TEXT NOT NULL,
+    "attempts" INT NOT NULL  DEFAULT 0,
+    "available_at" TIMESTAMP NOT NULL,
+    "worker" TEXT,
+    "lease_expires_at" TIMESTAMP,
+    "last_error" TEXT,
+    "created_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "source_id" INT NOT NULL REFERENCES "movie_sources" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_scrape_jobs_status_9f3556" ON "scrape_jobs" ("status", "available_at");
+CREATE TABLE IF NOT EXISTS "source_resolutions" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "site" TEXT NOT NULL,
+    "title_key" TEXT NOT NULL,
+    "year" INT,
+    "url" TEXT,
+    "resolved_at" TIMESTAMP NOT NULL,
+    CONSTRAINT "uid_source_reso_site_823828" UNIQUE ("site", "title_key", "year")
+);"""
+
+INDEXES = [("scrape_jobs", "idx_scrape_jobs_status_9f3556")]
+
+
+async def upgrade(conn, dialect: str):
+    for statement in split_statements(POSTGRES_SQL if dialect == "postgres" else SQLITE_SQL):
+        await conn.execute_query(statement)
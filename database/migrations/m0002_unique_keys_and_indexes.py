@@ -0,0 +1,51 @@
+"""Adds the normalized title key of movies and the unique keys and indexes lookups rely on.
+
+Movies whose titles share a key, and sources of the same site for one movie, are merged into
+the oldest first so the unique indexes can be created. The merged sources keep every review.
+"""
+from database.migrations import (
+    duplicates,
+    merge_duplicate_sources,
+    merge_movies,
+    split_statements,
+    to_dialect,
+)
+
+INDEXES_SQL = """CREATE UNIQUE INDEX IF NOT EXISTS "movies_title_key_uniq" ON "movies" ("title_key");
+CREATE INDEX IF NOT EXISTS "movies_release_date_idx" ON "movies" ("release_date");
+CREATE UNIQUE INDEX IF NOT EXISTS "movie_sources_movie_id_name_uniq" ON "movie_sources" ("movie_id", "name");
+CREATE INDEX IF NOT EXISTS "movie_sources_url_idx" ON "movie_sources" ("url");
+CREATE INDEX IF NOT EXISTS "reviews_source_id_created_at_idx" ON "reviews" ("source_id", "created_at");
+CREATE INDEX IF NOT EXISTS "scrape_jobs_source_id_status_idx" ON "scrape_jobs" ("source_id", "status")"""
+
+INDEXES = [
+    ("movies", "movies_title_key_uniq"),
+    ("movies", "movies_release_date_idx"),
+    ("movie_sources", "movie_sources_movie_id_name_uniq"),
+    ("movie_sources", "movie_sources_url_idx"),
+    ("reviews", "reviews_source_id_created_at_idx"),
+    ("scrape_jobs", "scrape_jobs_source_id_status_idx"),
+]
+
+
+def title_key(title: str) -> str:
+    # Frozen here, later changes to how titles are normalized need a migration of their own
+    return " ".join(title.casefold().split())
+
+
+async def upgrade(conn, dialect: str):
+    await conn.execute_query('ALTER TABLE "movies" ADD COLUMN "title_key" TEXT')
+    movies = await conn.execute_query_dict('SELECT "id", "title" FROM "movies" ORDER BY "id"')
+    if movies:
+        await conn.execute_many(
+            to_dialect('UPDATE "movies" SET "title_key" = ? WHERE "id" = ?', dialect),
+            [[title_key(m["title"]), m["id"]] for m in movies],
+        )
+
+    await merge_movies(conn, dialect, duplicates(movies, lambda m: title_key(m["title"])))
+    await merge_duplicate_sources(conn, dialect)
+
+    if dialect == "postgres":
+        await conn.execute_query('ALTER TABLE "movies" ALTER COLUMN "title_key" SET NOT NULL')
+    for statement in split_statements(INDEXES_SQL):
+        await conn.execute_query(statement)
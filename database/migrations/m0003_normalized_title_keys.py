@@ -0,0 +1,86 @@
+"""Re-keys movies with the normalized titles of projects.bot.titles.
+
+Accents, punctuation and articles no longer tell titles apart, so movies whose new keys match
+and whose release years are at most a year apart are merged into the oldest. Movies sharing a
+title with an older movie of another year are keyed with their year, as in "dune 2021", and
+numbered if that key is taken too, as in "dune 2021 #2", like projects.bot.titles keys them.
+"""
+import re
+import unicodedata
+
+from database.migrations import merge_duplicate_sources, merge_movies, split_statements, to_dialect
+
+DROP_INDEXES_SQL = """DROP INDEX IF EXISTS "movies_title_key_uniq";
+DROP INDEX IF EXISTS "movie_sources_movie_id_name_uniq\""""
+
+CREATE_INDEXES_SQL = """CREATE UNIQUE INDEX IF NOT EXISTS "movies_title_key_uniq" ON "movies" ("title_key");
+CREATE UNIQUE INDEX IF NOT EXISTS "movie_sources_movie_id_name_uniq" ON "movie_sources" ("movie_id", "name")"""
+
+TRAILING_ARTICLE = re.compile(r"^(.*),\s*(the|a|an)$")
+PUNCTUATION = re.compile(r"[^\w\s]|_")
+
+
+def title_key(title: str) -> str:
+    # Frozen here, later changes to how titles are normalized need a migration of their own
+    folded = unicodedata.normalize("NFKD", title)
+    folded = "".join(c for c in folded if not unicodedata.combining(c)).casefold().strip()
+    if match := TRAILING_ARTICLE.match(folded):
+        folded = f"{match[2]} {match[1]}"
+
+    words = PUNCTUATION.sub(" ", folded.replace("&", " and ")).split()
+    if len(words) > 1 and words[0] in ("the", "a", "an"):
+        words = words[1:]
+    return " ".join(words)
+
+
+def year_of(release_date) -> int | None:
+    # SQLite returns dates as text
+    return int(str(release_date)[:4]) if release_date else None
+
+
+async def upgrade(conn, dialect: str):
+    movies = await conn.execute_query_dict(
+        'SELECT "id", "title", "title_key", "release_date" FROM "movies" ORDER BY "id"'
+    )
+
+    kept: dict[str, list[tuple[int, int | None]]] = {}
+    taken: set[str] = set()
+    keys: list[list] = []
+    pairs: list[list[int]] = []
+    for movie in movies:
+        key, year = title_key(movie["title"]), year_of(movie["release_date"])
+        same_title = kept.setdefault(key, [])
+        match = next(
+            (
+                kept_id
+                for kept_id, kept_year in same_title
+                if year is None or kept_year is None or abs(year - kept_year) <= 1
+            ),
+            None,
+        )
+        if match is not None:
+            pairs.append([match, movie["id"]])
+            continue
+
+        if key in taken and year is not None:
+            key = f"{key} {year}"
+        unique, number = key, 2
+        while unique in taken:
+            unique, number = f"{key} #{number}", number + 1
+        taken.add(unique)
+        same_title.append((movie["id"], year))
+        if unique != movie["title_key"]:
+            keys.append([unique, movie["id"]])
+
+    # Merged movies can have sources of the same site, and keys are swapped between movies at
+    # times, so the keys are only unique again once every movie and source is merged and re-keyed
+    for statement in split_statements(DROP_INDEXES_SQL):
+        await conn.execute_query(statement)
+    await merge_movies(conn, dialect, pairs)
+    await merge_duplicate_sources(conn, dialect)
+    if keys:
+        await conn.execute_many(
+            to_dialect('UPDATE "movies" SET "title_key" = ? WHERE "id" = ?', dialect), keys
+        )
+    for statement in split_statements(CREATE_INDEXES_SQL):
+        await conn.execute_query(statement)
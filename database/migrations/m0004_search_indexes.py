@@ -0,0 +1,80 @@
+"""Adds the indexes projects.api.search matches title keys with.
+
+On Postgres, title keys are range scanned for prefixes with a "C" collation index. They are
+matched with a tsvector index, and with a pg_trgm trigram index as well when the extension can
+be created. On SQLite an FTS5 trigram table of the title keys is kept in step by triggers. The
+indexes the api used to create on the first search, on the titles, are dropped.
+"""
+import logging
+
+from database.migrations import split_statements
+
+POSTGRES_SQL = """DROP INDEX IF EXISTS "movies_title_trgm_idx";
+DROP INDEX IF EXISTS "movies_title_tsv_idx";
+DROP INDEX IF EXISTS "movies_title_prefix_idx";
+CREATE INDEX IF NOT EXISTS "movies_title_key_prefix_idx" ON "movies" (("title_key" COLLATE "C"));
+CREATE INDEX IF NOT EXISTS "movies_title_key_tsv_idx" ON "movies"
+USING gin (to_tsvector('simple', "title_key"))"""
+
+POSTGRES_TRIGRAM_SQL = """CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS "movies_title_key_trgm_idx" ON "movies" USING gin ("title_key" gin_trgm_ops)"""
+
+SQLITE_SQL = """DROP TRIGGER IF EXISTS "movies_search_insert";
+DROP TRIGGER IF EXISTS "movies_search_delete";
+DROP TRIGGER IF EXISTS "movies_search_update";
+DROP TABLE IF EXISTS "movies_search";
+DROP INDEX IF EXISTS "movies_title_nocase_idx";
+CREATE VIRTUAL TABLE "movies_search" USING fts5(
+    title_key, content='movies', content_rowid='id', tokenize='trigram'
+)"""
+
+# Their bodies hold semicolons, so they are not split like the other statements
+SQLITE_TRIGGERS_SQL = [
+    """CREATE TRIGGER "movies_search_insert" AFTER INSERT ON "movies" BEGIN
+    INSERT INTO movies_search (rowid, title_key) VALUES (new.id, new.title_key);
+END""",
+    """CREATE TRIGGER "movies_search_delete" AFTER DELETE ON "movies" BEGIN
+    INSERT INTO movies_search (movies_search, rowid, title_key)
+    VALUES ('delete', old.id, old.title_key);
+END""",
+    """CREATE TRIGGER "movies_search_update" AFTER UPDATE OF "title_key" ON "movies" BEGIN
+    INSERT INTO movies_search (movies_search, rowid, title_key)
+    VALUES ('delete', old.id, old.title_key);
+    INSERT INTO movies_search (rowid, title_key) VALUES (new.id, new.title_key);
+END""",
+]
+
+# The trigram index is left out, it is only created when pg_trgm is available
+INDEXES = {
+    "postgres": [
+        ("movies", "movies_title_key_prefix_idx"),
+        ("movies", "movies_title_key_tsv_idx"),
+    ],
+    "sqlite": [("movies_search", "movies_search")],
+}
+
+logger = logging.getLogger(__name__)
+
+
+async def upgrade(conn, dialect: str):
+    if dialect != "postgres":
+        for statement in split_statements(SQLITE_SQL) + SQLITE_TRIGGERS_SQL:
+            await conn.execute_query(statement)
+        # Index the movies stored before the table existed
+        await conn.execute_query("INSERT INTO movies_search (movies_search) VALUES ('rebuild')")
+        return
+
+    for statement in split_statements(POSTGRES_SQL):
+        await conn.execute_query(statement)
+
+    # A failed statement aborts the whole transaction, unless it is rolled back to a savepoint
+    await conn.execute_query("SAVEPOINT search_trigram")
+    try:
+        for statement in split_statements(POSTGRES_TRIGRAM_SQL):
+            await conn.execute_query(statement)
+    except Exception as ex:
+        # Not installed on the server, or the user may not create extensions
+        logger.warning(f"pg_trgm is unavailable, search will not tolerate typos: {ex}")
+        await conn.execute_query("ROLLBACK TO SAVEPOINT search_trigram")
+    else:
+        await conn.execute_query("RELEASE SAVEPOINT search_trigram")
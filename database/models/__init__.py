@@ -1 +1,9 @@
-from database.models.models import MovieModel, ReviewModel, SourceModel
+from database.models.models import (
+    DataVersionModel,
+    LatestReviewModel,
+    MovieModel,
+    ReviewModel,
+    ScrapeJobModel,
+    SourceModel,
+    SourceResolutionModel,
+)
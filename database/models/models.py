@@ -3,12 +3,15 @@ from tortoise.fields import ForeignKeyRelation
 from tortoise.models import Model
 
 from projects.bot.result_models import MovieResult
+from projects.bot.titles import normalize_title
 
 
 class MovieModel(Model):
     id = fields.IntField(pk=True)
     title = fields.TextField()
-    release_date = fields.DateField(null=True)
+    # The normalized title movies are matched on, unique, see projects.bot.titles
+    title_key = fields.TextField()
+    release_date = fields.DateField(null=True, index=True)
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
 
@@ -17,6 +20,11 @@ class MovieModel(Model):
     class Meta:
         table = "movies"
 
+    def __init__(self, **kwargs):
+        if "title" in kwargs:
+            kwargs.setdefault("title_key", normalize_title(kwargs["title"]))
+        super().__init__(**kwargs)
+
     def __repr__(self):
         return f"Movie(title={self.title})"
 
@@ -25,11 +33,11 @@ class MovieModel(Model):
 
     def __eq__(self, other):
         """Determines if the same movie, does not check based on PK"""
-        if isinstance(other, MovieModel):
-            return self.title == other.title and self.release_date == other.release_date
-
-        if isinstance(other, MovieResult):
-            return self.title == other.title and self.release_date == other.release_date
+        if isinstance(other, (MovieModel, MovieResult)):
+            return (
+                normalize_title(self.title) == normalize_title(other.title)
+                and self.release_date == other.release_date
+            )
 
         return False
 
@@ -41,12 +49,15 @@ class SourceModel(Model):
 
     id = fields.IntField(pk=True)
     name = fields.TextField()
+    # Indexed by migration 0002, TextFields can't be indexed here
     url = fields.TextField()
 
     reviews: fields.ReverseRelation["ReviewModel"]
+    latest_review: fields.BackwardOneToOneRelation["LatestReviewModel"]
 
     class Meta:
         table = "movie_sources"
+        unique_together = (("movie", "name"),)
 
     def __repr__(self):
         return f"Source(title={self.name}, url={self.url})"
@@ -68,9 +79,101 @@ class ReviewModel(Model):
 
     class Meta:
         table = "reviews"
+        indexes = (("source", "created_at"),)
 
     def __repr__(self):
         return f"Review(audience={self.audience_score}, critic={self.critic_score})"
 
     def __str__(self):
         return self.__repr__()
+
+
+class LatestReviewModel(Model):
+    """The most recently scraped scores of a source, kept up to date as reviews are ingested."""
+
+    source: fields.OneToOneRelation[SourceModel] = fields.OneToOneField(
+        "models.SourceModel", related_name="latest_review", description="FK to a movie source"
+    )
+
+    id = fields.IntField(pk=True)
+    audience_score = fields.IntField(null=True)
+    audience_count = fields.TextField(null=True)
+    critic_score = fields.IntField(null=True)
+    critic_count = fields.TextField(null=True)
+    scraped_at = fields.DatetimeField()
+    changed_at = fields.DatetimeField()
+
+    class Meta:
+        table = "latest_reviews"
+
+    def __repr__(self):
+        return f"LatestReview(audience={self.audience_score}, critic={self.critic_score})"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class SourceResolutionModel(Model):
+    """The remembered outcome of searching a site for a movie, a null url means no match."""
+
+    id = fields.IntField(pk=True)
+    site = fields.TextField()
+    title_key = fields.TextField()
+    year = fields.IntField(null=True)
+    url = fields.TextField(null=True)
+    resolved_at = fields.DatetimeField()
+
+    class Meta:
+        table = "source_resolutions"
+        unique_together = (("site", "title_key", "year"),)
+
+    def __repr__(self):
+        return f"SourceResolution(site={self.site}, title_key={self.title_key}, url={self.url})"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class ScrapeJobModel(Model):
+    """A queued review scrape of a source, claimed by one worker at a time under a lease."""
+
+    source: ForeignKeyRelation[SourceModel] = fields.ForeignKeyField(
+        "models.SourceModel", related_name="scrape_jobs", description="FK to the source to scrape"
+    )
+
+    id = fields.IntField(pk=True)
+    status = fields.TextField()
+    attempts = fields.IntField(default=0)
+    available_at = fields.DatetimeField()
+    worker = fields.TextField(null=True)
+    lease_expires_at = fields.DatetimeField(null=True)
+    last_error = fields.TextField(null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "scrape_jobs"
+        indexes = (("status", "available_at"), ("source", "status"))
+
+    def __repr__(self):
+        return f"ScrapeJob(source_id={self.source_id}, status={self.status})"
+
+    def __str__(self):
+        return self.__repr__()
+
+
+class DataVersionModel(Model):
+    """A counter bumped whenever the bot changes the data, so readers know to drop caches."""
+
+    id = fields.IntField(pk=True)
+    version = fields.IntField(default=0)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "data_version"
+
+    def __repr__(self):
+        return f"DataVersion(version={self.version})"
+
+    def __str__(self):
+        return self.__repr__()
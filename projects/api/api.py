@@ -1,18 +1,25 @@
 import os
+import json
+import time
 import asyncio
 import urllib.parse
+from dataclasses import asdict
 
 import uvicorn
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Query
 from fastapi.requests import Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from tortoise.contrib.fastapi import register_tortoise
 
 from database import database as db
-from database.models import MovieModel
+from database.migrate import check_indexes, migrate
+from projects.api import queries
+from projects.api.page_cache import PageCache
+from projects.api.search import movie_search
+from projects.bot.metrics import Metrics, render_prometheus
 
 
 load_dotenv()
@@ -24,52 +31,100 @@ api = FastAPI()
 api.mount("/static", StaticFiles(directory=static_dir), name="static")
 templates = Jinja2Templates(directory=templates_dir)
 
+# The bot writes a summary of its last run, which is exposed alongside the api's own metrics
+api_metrics = Metrics(os.getenv("METRICS", "false").lower() in ("1", "true", "yes", "on"))
+metrics_summary_path = os.getenv("METRICS_SUMMARY_PATH", "run-summary.json")
+
+# Rendered pages are served from memory until they expire or the bot changes the data
+page_cache = PageCache(
+    max_entries=int(os.getenv("PAGE_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("PAGE_CACHE_TTL", "300")),
+    poll_interval=float(os.getenv("DATA_VERSION_POLL_INTERVAL", "5")),
+)
+
+
+@api.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    if not api_metrics.enabled:
+        return await call_next(request)
+
+    start = time.perf_counter()
+    response = await call_next(request)
+    # The route's path rather than the URL, so /m/1 and /m/2 share a series
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    api_metrics.observe("request_duration_seconds", time.perf_counter() - start, path=path)
+    api_metrics.inc("responses_total", path=path, status=str(response.status_code))
+    return response
+
+
+@api.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    api_metrics.set("page_cache_hits", page_cache.hits)
+    api_metrics.set("page_cache_misses", page_cache.misses)
+    body = render_prometheus(api_metrics.snapshot(), "reel_api_")
+    try:
+        with open(metrics_summary_path) as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        summary = None
+
+    if summary is not None:
+        body += render_prometheus(
+            dict(
+                summary["metrics"],
+                gauges=dict(
+                    summary["metrics"]["gauges"],
+                    last_run_finished_timestamp_seconds=[
+                        dict(labels={}, value=summary["finished_at"])
+                    ],
+                    last_run_duration_seconds=[dict(labels={}, value=summary["duration_seconds"])],
+                ),
+            ),
+            "reel_bot_",
+        )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 
 @api.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    # TODO: Figure out how to force tortoise-orm to use an INNER JOIN and remove raw SQL
-    top_movies: list[MovieModel] = await MovieModel.raw(
-        """SELECT m.*, r.audience_score, r.audience_count
-        FROM movies m
-        INNER JOIN movie_sources s
-            ON m.id = s.movie_id
-        INNER JOIN reviews r
-            ON s.id = r.source_id
-        WHERE m.release_date >= CURRENT_DATE - INTERVAL '30 days'
-        ORDER BY m.release_date DESC NULLS LAST
-        LIMIT(5)"""
-    )
-
-    for movie in top_movies:
-        await movie.fetch_related("sources", "sources__reviews")
-
-    ctx = dict(request=request, movies=top_movies)
-    print(top_movies)
-    return templates.TemplateResponse("pages/home.html", ctx)
+    async def render():
+        top_movies = await queries.recent_top_movies()
+
+        ctx = dict(request=request, movies=top_movies)
+        return templates.TemplateResponse("pages/home.html", ctx)
+
+    return await page_cache.serve(request, render)
 
 
 @api.get("/m/{movie_id}", response_class=HTMLResponse)
 async def movie_page(request: Request, movie_id: int, return_url: str | None = None):
-    movie = await MovieModel.filter(id=movie_id).first()
-    if movie:
-        await movie.fetch_related("sources__reviews")
+    async def render():
+        movie = await queries.get_movie(movie_id)
 
-    print(return_url)
+        ctx = dict(request=request, movie=movie, return_url=return_url)
+        return templates.TemplateResponse("pages/movie.html", ctx)
 
-    ctx = dict(request=request, movie=movie, return_url=return_url)
-    return templates.TemplateResponse("pages/movie.html", ctx)
+    return await page_cache.serve(request, render)
 
 
 @api.get("/s", response_class=HTMLResponse)
-async def search_movie(request: Request, q: str):
-    await MovieModel.filter()
-    movies = await MovieModel.filter(title__icontains=q)
+async def search_movie(request: Request, q: str, after: str | None = None):
+    async def render():
+        movies, next_cursor = await queries.search_movies(q, cursor=after)
+
+        next_url = None
+        if next_cursor:
+            next_url = f"/s?{urllib.parse.urlencode(dict(q=q, after=next_cursor))}"
+        ctx = dict(request=request, movies=movies, query=q, next_url=next_url)
+        return templates.TemplateResponse("pages/search-results.html", ctx)
+
+    return await page_cache.serve(request, render)
 
-    for movie in movies:
-        await movie.fetch_related("sources__reviews")
 
-    ctx = dict(request=request, movies=movies, query=q)
-    return templates.TemplateResponse("pages/search-results.html", ctx)
+@api.get("/api/autocomplete")
+async def autocomplete(q: str, limit: int = Query(10, ge=1, le=50)):
+    return [asdict(suggestion) for suggestion in await movie_search.autocomplete(q, limit)]
 
 
 async def main():
@@ -86,6 +141,12 @@ register_tortoise(
     api,
     db_url=database_url,
     modules={"models": db.MODELS_PATHS},
-    generate_schemas=True,
     add_exception_handlers=True,
 )
+
+
+@api.on_event("startup")
+async def apply_migrations():
+    # Registered after register_tortoise, so the connections are open by now
+    await migrate()
+    await check_indexes()
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import logging
+import time
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from fastapi.requests import Request
+from fastapi.responses import Response
+
+from database.models import DataVersionModel
+
+
+@dataclass
+class CachedPage:
+    body: bytes
+    media_type: str | None
+    etag: str
+    created_at: float
+
+
+def page_key(request: Request) -> str:
+    """The URL of the page with its parameters in a stable order.
+
+    Pages link to absolute URLs, so the scheme and host they were requested through are kept.
+    """
+    url = request.url
+    params = urllib.parse.urlencode(sorted(request.query_params.multi_items()))
+    return f"{url.scheme}://{url.netloc}{url.path}?{params}"
+
+
+class PageCache:
+    """An in-memory LRU of rendered pages with strong ETags, dropped when the data changes.
+
+    Pages are kept for ttl seconds at most. The data version the bot bumps after each run is
+    read at most once every poll_interval seconds, and every page is dropped when it changes.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0, poll_interval: float = 5.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.version: int | None = None
+        self.hits = 0
+        self.misses = 0
+        self._pages: OrderedDict[str, CachedPage] = OrderedDict()
+        self._polled_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __check_version(self):
+        if time.monotonic() - self._polled_at < self.poll_interval:
+            return
+
+        async with self._lock:
+            # Another request may have polled while this one waited for the lock
+            if time.monotonic() - self._polled_at < self.poll_interval:
+                return
+
+            versions = await DataVersionModel.filter(id=1).values_list("version", flat=True)
+            version = versions[0] if versions else 0
+            if version != self.version:
+                if self.version is not None:
+                    self.logger.info(f"Data version {version}, dropping {len(self._pages)} pages")
+                self._pages.clear()
+                self.version = version
+            self._polled_at = time.monotonic()
+
+    def __get(self, key: str) -> CachedPage | None:
+        page = self._pages.get(key)
+        if page is None:
+            return None
+        if time.monotonic() - page.created_at >= self.ttl:
+            del self._pages[key]
+            return None
+        self._pages.move_to_end(key)
+        return page
+
+    def __put(self, key: str, response: Response) -> CachedPage:
+        body = bytes(response.body)
+        page = CachedPage(
+            body=body,
+            media_type=response.media_type,
+            etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+            created_at=time.monotonic(),
+        )
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+        return page
+
+    async def serve(self, request: Request, render: Callable[[], Awaitable[Response]]) -> Response:
+        """Answers from the cache, or renders and caches the page if it is missing or stale.
+
+        Answers 304 Not Modified if the client already has the page.
+        """
+        await self.__check_version()
+        key = page_key(request)
+        page = self.__get(key)
+        if page is None:
+            self.misses += 1
+            response = await render()
+            if response.status_code != 200:
+                return response
+            page = self.__put(key, response)
+        else:
+            self.hits += 1
+
+        # Clients may keep the page but must check it is current before using it
+        headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+        if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+        if page.etag in if_none_match or "*" in if_none_match:
+            return Response(status_code=304, headers=headers)
+        return Response(page.body, media_type=page.media_type, headers=headers)
@@ -0,0 +1,105 @@
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from tortoise.queryset import QuerySet
+
+from database.models import LatestReviewModel, MovieModel, SourceModel
+from projects.api.search import movie_search
+
+REVIEW_FIELDS = ("source_id", "audience_score", "audience_count", "critic_score", "critic_count")
+
+
+@dataclass
+class ReviewView:
+    audience_score: int | None
+    audience_count: str | None
+    critic_score: int | None
+    critic_count: str | None
+
+
+@dataclass
+class SourceView:
+    id: int
+    name: str
+    url: str
+    review: ReviewView | None = None
+
+
+@dataclass
+class MovieView:
+    id: int
+    title: str
+    release_date: date | None
+    sources: list[SourceView] = field(default_factory=list)
+
+    @property
+    def audience_score(self) -> int | None:
+        """The audience score of the first source with one, shown in movie lists."""
+        return next(
+            (
+                s.review.audience_score
+                for s in self.sources
+                if s.review is not None and s.review.audience_score is not None
+            ),
+            None,
+        )
+
+
+async def load_movies(query: QuerySet[MovieModel]) -> list[MovieView]:
+    """Loads the movies of the query with their sources and latest reviews in three queries."""
+    movies = [
+        MovieView(m["id"], m["title"], m["release_date"])
+        for m in await query.values("id", "title", "release_date")
+    ]
+    if not movies:
+        return []
+
+    movies_by_id = {movie.id: movie for movie in movies}
+    sources = (
+        await SourceModel.filter(movie_id__in=list(movies_by_id))
+        .order_by("id")
+        .values("id", "movie_id", "name", "url")
+    )
+    sources_by_id: dict[int, SourceView] = {}
+    for s in sources:
+        source = SourceView(s["id"], s["name"], s["url"])
+        sources_by_id[source.id] = source
+        movies_by_id[s["movie_id"]].sources.append(source)
+
+    if sources_by_id:
+        reviews = await LatestReviewModel.filter(source_id__in=list(sources_by_id)).values(
+            *REVIEW_FIELDS
+        )
+        for r in reviews:
+            source = sources_by_id[r.pop("source_id")]
+            source.review = ReviewView(**r)
+
+    return movies
+
+
+async def recent_top_movies(days: int = 30, limit: int = 5) -> list[MovieView]:
+    """The most recently released movies of the last days that have been reviewed."""
+    query = (
+        MovieModel.filter(
+            release_date__gte=date.today() - timedelta(days=days),
+            sources__latest_review__id__not_isnull=True,
+        )
+        .distinct()
+        .order_by("-release_date", "id")
+        .limit(limit)
+    )
+    return await load_movies(query)
+
+
+async def search_movies(
+    text: str, limit: int = 20, cursor: str | None = None
+) -> tuple[list[MovieView], str | None]:
+    """A page of the movies matching the text, best match first, and the cursor of the next."""
+    page = await movie_search.search(text, limit, cursor)
+    movies = {m.id: m for m in await load_movies(MovieModel.filter(id__in=page.ids))}
+    return [movies[id] for id in page.ids if id in movies], page.next_cursor
+
+
+async def get_movie(movie_id: int) -> MovieView | None:
+    movies = await load_movies(MovieModel.filter(id=movie_id))
+    return movies[0] if movies else None
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+
+from tortoise import connections
+
+from projects.bot.titles import normalize_title
+
+# Sorts after every character, so a prefix and this make the upper bound of a range scan
+MAX_CHAR = "\U0010ffff"
+
+# Only this much of a query is matched, so a pasted paragraph cannot make a huge query
+MAX_QUERY_LENGTH = 64
+
+# How much of a query a title has to share to match, out of 1000, like pg_trgm's default
+MIN_SCORE = 600
+
+# The most titles sharing a trigram with the query that are scored on SQLite
+MAX_CANDIDATES = 500
+
+# A score no match can reach, used as the cursor of the first page
+FIRST_PAGE = (1001, 0)
+
+# Created by the m0004 migration when pg_trgm is available, see database/migrations
+POSTGRES_TRIGRAM_INDEX_EXISTS_SQL = """SELECT 1 FROM pg_indexes
+WHERE tablename = 'movies' AND indexname = 'movies_title_key_trgm_idx'"""
+
+# Scores are rounded to integers so the cursor of a page compares exactly
+POSTGRES_TRIGRAM_SEARCH_SQL = """SELECT id, score FROM (
+    SELECT id, CAST(round(word_similarity($1, title_key) * 1000) AS INT) AS score
+    FROM movies
+    WHERE $1 <% title_key
+) m
+WHERE score < $2 OR (score = $2 AND id > $3)
+ORDER BY score DESC, id
+LIMIT $4"""
+
+POSTGRES_TSVECTOR_SEARCH_SQL = """SELECT id, score FROM (
+    SELECT id, CAST(round(ts_rank(to_tsvector('simple', title_key), query) * 1000) AS INT) AS score
+    FROM movies, to_tsquery('simple', $1) query
+    WHERE to_tsvector('simple', title_key) @@ query
+) m
+WHERE score < $2 OR (score = $2 AND id > $3)
+ORDER BY score DESC, id
+LIMIT $4"""
+
+# Prefix matches all score 1000, so the id in the cursor is enough to find where a page ends
+POSTGRES_PREFIX_SEARCH_SQL = """SELECT id, title, release_date, 1000 AS score
+FROM movies
+WHERE title_key COLLATE "C" >= $1 AND title_key COLLATE "C" < $2
+    AND ($3 = 0 OR (title_key COLLATE "C", id) > (
+        SELECT title_key COLLATE "C", id FROM movies WHERE id = $3
+    ))
+ORDER BY title_key COLLATE "C", id
+LIMIT $4"""
+
+# The titles sharing the most trigrams with the query, to be scored by title_similarity
+SQLITE_CANDIDATES_SQL = """SELECT movies.id, movies.title_key
+FROM movies_search JOIN movies ON movies.id = movies_search.rowid
+WHERE movies_search MATCH ?
+ORDER BY movies_search.rank
+LIMIT ?"""
+
+# Title keys are already folded to lower case, so the unique index on them serves the range
+SQLITE_PREFIX_SEARCH_SQL = """SELECT id, title, release_date, 1000 AS score
+FROM movies
+WHERE title_key >= ?1 AND title_key < ?2
+    AND (?3 = 0 OR (title_key, id) > (SELECT title_key, id FROM movies WHERE id = ?3))
+ORDER BY title_key, id
+LIMIT ?4"""
+
+
+def normalize_query(text: str) -> str:
+    """Folds the query like the title keys it is matched against, see projects.bot.titles."""
+    return normalize_title(text[: MAX_QUERY_LENGTH * 2])[:MAX_QUERY_LENGTH]
+
+
+def trigrams(text: str) -> list[str]:
+    """The distinct three character sequences of each word in the text."""
+    grams: dict[str, None] = {}
+    for word in text.split():
+        for i in range(len(word) - 2):
+            grams[word[i : i + 3]] = None
+    return list(grams)
+
+
+def edit_similarity(word: str, other: str) -> float:
+    """1 less the edits, counting a swap of neighbouring letters as one, per letter."""
+    previous, current = None, list(range(len(other) + 1))
+    for i in range(1, len(word) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(other)
+        for j in range(1, len(other) + 1):
+            cost = word[i - 1] != other[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and word[i - 1] == other[j - 2] and word[i - 2] == other[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+    return 1 - current[-1] / max(len(word), len(other), 1)
+
+
+def title_similarity(query: str, title_key: str) -> int:
+    """How well the title matches the query, out of 1000.
+
+    Each word of the query scores its closest word of the title, a word it starts counting in
+    full, and the scores are weighted by the length of the query words. So "matirx" scores 833
+    against "matrix", one swap in six letters, and "matrix" 1000 against "matrix reloaded".
+    """
+    title_words = title_key.split()
+    if not title_words:
+        return 0
+
+    total, matched = 0, 0.0
+    for word in query.split():
+        total += len(word)
+        matched += len(word) * max(
+            1.0 if other.startswith(word) else edit_similarity(word, other)
+            for other in title_words
+        )
+    return round(1000 * matched / total) if total else 0
+
+
+def parse_cursor(cursor: str | None) -> tuple[int, int] | None:
+    """Reads the score and id of the last result of the previous page."""
+    match = re.fullmatch(r"(\d+)\.(\d+)", cursor or "")
+    return (int(match[1]), int(match[2])) if match else None
+
+
+def format_cursor(score: int, id: int) -> str:
+    return f"{score}.{id}"
+
+
+@dataclass
+class SearchPage:
+    ids: list[int]
+    next_cursor: str | None
+
+
+@dataclass
+class Suggestion:
+    id: int
+    title: str
+    year: int | None
+
+
+class MovieSearch:
+    """Ranked, typo tolerant title search over the movies table with keyset pagination.
+
+    Queries are matched against the movies' title keys, which fold accents, case, punctuation
+    and articles. On Postgres they are matched by trigram word similarity with a pg_trgm index,
+    or by full-text search with a tsvector index when the extension cannot be installed. On
+    SQLite an FTS5 trigram index finds the candidates, which are ranked by title_similarity.
+    The indexes are created by the m0004 migration, which only adds the pg_trgm one when the
+    extension is available.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.mode: str | None = None
+        self._lock = asyncio.Lock()
+
+    async def __prepare(self):
+        if self.mode is not None:
+            return
+
+        async with self._lock:
+            if self.mode is not None:
+                return
+
+            conn = connections.get("default")
+            if conn.capabilities.dialect != "postgres":
+                self.mode = "fts5"
+            elif await conn.execute_query_dict(POSTGRES_TRIGRAM_INDEX_EXISTS_SQL):
+                self.mode = "pg_trgm"
+            else:
+                self.mode = "tsvector"
+            self.logger.info(f"Searching movies with {self.mode}")
+
+    async def search(self, text: str, limit: int = 20, cursor: str | None = None) -> SearchPage:
+        """Returns a page of the ids of the movies matching the text, best match first."""
+        query = normalize_query(text)
+        if not query:
+            return SearchPage([], None)
+
+        await self.__prepare()
+        after = parse_cursor(cursor) or FIRST_PAGE
+        # Queries without a word of three letters are matched on the start of the title instead
+        if not trigrams(query):
+            rows = await self.__prefix_rows(query, limit + 1, after)
+        else:
+            rows = await self.__search_rows(query, limit + 1, after)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = format_cursor(rows[-1]["score"], rows[-1]["id"]) if has_more else None
+        return SearchPage([row["id"] for row in rows], next_cursor)
+
+    async def __search_rows(self, query: str, limit: int, after: tuple[int, int]) -> list[dict]:
+        conn = connections.get("default")
+        score, id = after
+        if self.mode == "pg_trgm":
+            return await conn.execute_query_dict(
+                POSTGRES_TRIGRAM_SEARCH_SQL, [query, score, id, limit]
+            )
+
+        if self.mode == "tsvector":
+            words = re.findall(r"\w+", query)
+            if not words:
+                return []
+            ts_query = " & ".join(f"{word}:*" for word in words)
+            return await conn.execute_query_dict(
+                POSTGRES_TSVECTOR_SEARCH_SQL, [ts_query, score, id, limit]
+            )
+
+        match = " OR ".join('"' + gram.replace('"', '""') + '"' for gram in trigrams(query))
+        candidates = await conn.execute_query_dict(SQLITE_CANDIDATES_SQL, [match, MAX_CANDIDATES])
+        scored = [
+            dict(id=row["id"], score=title_similarity(query, row["title_key"]))
+            for row in candidates
+        ]
+        rows = [
+            row
+            for row in scored
+            if row["score"] >= MIN_SCORE
+            and (row["score"] < score or (row["score"] == score and row["id"] > id))
+        ]
+        return sorted(rows, key=lambda row: (-row["score"], row["id"]))[:limit]
+
+    async def __prefix_rows(self, prefix: str, limit: int, after: tuple[int, int]) -> list[dict]:
+        """Titles starting with the prefix in alphabetical order, after the movie with id after."""
+        conn = connections.get("default")
+        sql = (
+            POSTGRES_PREFIX_SEARCH_SQL
+            if conn.capabilities.dialect == "postgres"
+            else SQLITE_PREFIX_SEARCH_SQL
+        )
+        return await conn.execute_query_dict(sql, [prefix, prefix + MAX_CHAR, after[1], limit])
+
+    async def autocomplete(self, prefix: str, limit: int = 10) -> list[Suggestion]:
+        """Suggests the titles that start with the prefix, alphabetically."""
+        query = normalize_query(prefix)
+        if not query:
+            return []
+
+        await self.__prepare()
+        rows = await self.__prefix_rows(query, limit, FIRST_PAGE)
+        return [
+            Suggestion(
+                row["id"],
+                row["title"],
+                # SQLite returns dates as strings
+                int(str(row["release_date"])[:4]) if row["release_date"] else None,
+            )
+            for row in rows
+        ]
+
+
+movie_search = MovieSearch()
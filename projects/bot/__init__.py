@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import time
 from logging import Logger
 from typing import Protocol
 
@@ -7,6 +9,13 @@ from httpx import AsyncClient
 from playwright.async_api import Page
 from selectolax.parser import HTMLParser
 
+from projects.bot.fragments import FragmentScanner, PageFragment, extract_fragment
+from projects.bot.http_cache import HttpCache
+from projects.bot.metrics import metrics
+from projects.bot.rate_limiter import THROTTLE_STATUS_CODES, ThrottledError, parse_retry_after
+from projects.bot.replay import ResponseCorpus
+from projects.bot.resilience import CircuitOpenError
+
 
 class HtmlParserProtocol(Protocol):
     @property
@@ -16,34 +25,154 @@ class HtmlParserProtocol(Protocol):
     async def get_html_parser(self, client, url: str):
         ...
 
+    async def get_html(
+        self, client, url: str, fragment: PageFragment | None = None
+    ) -> bytes | None:
+        ...
+
 
 class PlaywrightHtmlParser:
-    def __init__(self):
+    def __init__(self, corpus: ResponseCorpus | None = None):
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.corpus = corpus
 
     async def get_html_parser(self, page: Page, url: str):
+        body = await self.get_html(page, url)
+        return HTMLParser(body) if body is not None else None
+
+    async def get_html(
+        self, page: Page, url: str, fragment: PageFragment | None = None
+    ) -> bytes | None:
         try:
-            await page.goto(url)
-            return HTMLParser(await page.content())
+            resp = await page.goto(url)
+            body = (await page.content()).encode()
+            if self.corpus is not None:
+                status_code = resp.status if resp else 200
+                headers = {"content-type": "text/html; charset=utf-8"}
+                self.corpus.save(url, status_code, headers, body)
+            return (extract_fragment(body, fragment) if fragment else None) or body
         except Exception as ex:
             self.logger.exception(ex)
             return None
 
 
 class HttpxHtmlParser:
-    def __init__(self):
+    def __init__(self, cache: HttpCache | None = None):
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.cache = cache
+        self._in_flight: dict[tuple[str, PageFragment | None], asyncio.Task] = {}
 
     async def get_html_parser(self, client: AsyncClient, url: str):
+        body = await self.get_html(client, url)
+        return HTMLParser(body) if body is not None else None
+
+    async def get_html(
+        self, client: AsyncClient, url: str, fragment: PageFragment | None = None
+    ) -> bytes | None:
+        """Returns the body of the page, sharing a single request between concurrent callers.
+
+        Given a fragment, the response is streamed and closed as soon as the fragment has been
+        read, returning only the fragment. The whole page is returned if it has no fragment.
+        """
+        key = (url, fragment)
+        task = self._in_flight.get(key)
+        if task is None:
+            if fragment is None:
+                task = asyncio.create_task(self.__fetch(client, url))
+            else:
+                task = asyncio.create_task(self.__fetch_fragment(client, url, fragment))
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self._in_flight[key] = task
+
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def __raise_if_throttled(url: str, resp: httpx.Response):
+        if resp.status_code in THROTTLE_STATUS_CODES:
+            retry_after = parse_retry_after(resp.headers.get("retry-after"))
+            raise ThrottledError(url, resp.status_code, retry_after)
+
+    @staticmethod
+    def __record(resp: httpx.Response, start: float, size: int):
+        if metrics.enabled:
+            site = resp.url.host
+            metrics.observe("http_request_duration_seconds", time.perf_counter() - start, site=site)
+            metrics.inc("http_responses_total", site=site, status=str(resp.status_code))
+            metrics.inc("http_response_bytes_total", size, site=site)
+
+    async def __fetch(self, client: AsyncClient, url: str) -> bytes | None:
+        entry = await self.cache.get(url) if self.cache else None
+        if entry and self.cache.is_fresh(entry):
+            metrics.inc("http_cache_hits_total")
+            return entry.body
+
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
-            }
-            resp = await client.get(url, headers=headers)
+            start = time.perf_counter()
+            resp = await client.get(url, headers=entry.conditional_headers() if entry else None)
+            self.__record(resp, start, len(resp.content))
+            if resp.status_code == 304 and entry:
+                await self.cache.refresh(url)
+                return entry.body
+            self.__raise_if_throttled(url, resp)
             if resp.status_code != 200:
                 self.logger.warning(f"URL '{url} returned status code of {resp.status_code}'")
                 return None
-            return HTMLParser(resp.content)
-        except httpx.ReadTimeout as ex:
-            self.logger.exception(f"httpx.ReadTimeout for '{url}'")
+
+            if self.cache and "no-store" not in resp.headers.get("cache-control", ""):
+                await self.cache.put(
+                    url, resp.content, resp.headers.get("etag"), resp.headers.get("last-modified")
+                )
+            return resp.content
+        except CircuitOpenError:
+            # Raised to the caller, an open circuit is not a failure of this page
+            raise
+        except httpx.TransportError as ex:
+            # Timeouts have already been retried, see resilience.py
+            self.logger.warning(f"Failed to fetch '{url}': {ex!r}")
+            return None
+
+    async def __fetch_fragment(
+        self, client: AsyncClient, url: str, fragment: PageFragment
+    ) -> bytes | None:
+        # Partial bodies are never cached, but a cached page can still answer the request
+        entry = await self.cache.get(url) if self.cache else None
+        if entry and self.cache.is_fresh(entry):
+            metrics.inc("http_cache_hits_total")
+            return extract_fragment(entry.body, fragment) or entry.body
+
+        try:
+            start = time.perf_counter()
+            headers = entry.conditional_headers() if entry else None
+            async with client.stream("GET", url, headers=headers) as resp:
+                if resp.status_code != 200:
+                    self.__record(resp, start, 0)
+                if resp.status_code == 304 and entry:
+                    await self.cache.refresh(url)
+                    return extract_fragment(entry.body, fragment) or entry.body
+                self.__raise_if_throttled(url, resp)
+                if resp.status_code != 200:
+                    self.logger.warning(f"URL '{url} returned status code of {resp.status_code}'")
+                    return None
+
+                scanner = FragmentScanner(fragment)
+                async for chunk in resp.aiter_bytes():
+                    found = scanner.feed(chunk)
+                    if found is not None:
+                        self.__record(resp, start, len(scanner.buffer))
+                        return found
+
+                self.logger.debug(f"Fragment markers not found at '{url}', using the whole page")
+                body = bytes(scanner.buffer)
+                self.__record(resp, start, len(body))
+                if self.cache and "no-store" not in resp.headers.get("cache-control", ""):
+                    await self.cache.put(
+                        url, body, resp.headers.get("etag"), resp.headers.get("last-modified")
+                    )
+                return body
+        except CircuitOpenError:
+            # Raised to the caller, an open circuit is not a failure of this page
+            raise
+        except httpx.TransportError as ex:
+            # Timeouts have already been retried, see resilience.py
+            self.logger.warning(f"Failed to fetch '{url}': {ex!r}")
             return None
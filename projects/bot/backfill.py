@@ -0,0 +1,123 @@
+"""Seeds the database with the releases Box Office Mojo lists for a range of years.
+
+    python -m projects.bot.backfill 2010 2023             # the years not stored yet
+    python -m projects.bot.backfill 2010 2023 --restart   # every year, forgetting the progress
+
+The years are fetched concurrently and each is stored as soon as it is parsed. The stored years
+are checkpointed to BACKFILL_CHECKPOINT_PATH, so an interrupted backfill resumes where it left
+off. Review sources are not searched for, the pipeline does that for movies on the recent lists.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+from tortoise import Tortoise
+
+from database import database as db
+from projects.bot.config import BotConfig
+from projects.bot.main import scraping_resources
+from projects.bot.metrics import metrics
+from projects.bot.persistence import bump_data_version, load_title_index, upsert_movies
+from projects.bot.scrapers import BoxOfficeMojoMovieListScraper
+
+
+@dataclass
+class BackfillStats:
+    years: int = 0
+    movies: int = 0
+    failed_years: list[int] = field(default_factory=list)
+
+
+class BackfillCheckpoint:
+    """The years a backfill has stored, kept in a JSON file if a path is given."""
+
+    def __init__(self, path: str = ""):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.years: set[int] = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.years = set(json.load(f)["years"])
+
+    def mark_done(self, year: int):
+        self.years.add(year)
+        if not self.path:
+            return
+
+        # Written to a temporary file first so an interrupted write never loses the progress
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"years": sorted(self.years)}, f)
+        os.replace(temporary_path, self.path)
+
+    def clear(self):
+        self.years.clear()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def backfill(
+    config: BotConfig, years: list[int], checkpoint: BackfillCheckpoint
+) -> BackfillStats:
+    """Stores the releases of the years not in the checkpoint, in batches of backfill_batch_size."""
+    logger = logging.getLogger(__name__)
+    stats = BackfillStats()
+    pending = [year for year in years if year not in checkpoint.years]
+    if len(pending) < len(years):
+        logger.info(f"Skipping {len(years) - len(pending)} years stored by an earlier backfill")
+    if not pending:
+        return stats
+
+    async with scraping_resources(config) as (html_parser, fetcher):
+        scraper = BoxOfficeMojoMovieListScraper(html_parser, fetcher)
+        titles = await load_title_index()
+        async for year, movies in scraper.run_years(pending):
+            if movies is None:
+                stats.failed_years.append(year)
+                continue
+
+            for start in range(0, len(movies), config.backfill_batch_size):
+                await upsert_movies(movies[start : start + config.backfill_batch_size], titles)
+            checkpoint.mark_done(year)
+
+            stats.years += 1
+            stats.movies += len(movies)
+            metrics.inc("backfill_movies_total", len(movies))
+            logger.info(f"Stored {len(movies)} releases from {year}")
+
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("first_year", type=int)
+    parser.add_argument("last_year", type=int)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    config = BotConfig.from_env()
+    checkpoint = BackfillCheckpoint(config.backfill_checkpoint_path)
+    if args.restart:
+        checkpoint.clear()
+
+    await db.init_database(config.database_url)
+    try:
+        stats = await backfill(config, list(range(args.first_year, args.last_year + 1)), checkpoint)
+        if stats.movies:
+            await bump_data_version()
+    finally:
+        await Tortoise.close_connections()
+
+    print(f"Stored {stats.movies} releases from {stats.years} years")
+    if stats.failed_years:
+        raise SystemExit(f"Failed to fetch {stats.failed_years}, run again to retry them")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
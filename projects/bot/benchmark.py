@@ -0,0 +1,256 @@
+"""Benchmarks the scrapers against a corpus of recorded pages.
+
+Record a corpus by running the bot with HTTP_RECORD_DIR set, then run:
+
+    python -m projects.bot.benchmark --corpus <HTTP_RECORD_DIR>
+
+Results are compared against a stored baseline and the process exits with a non-zero status if
+any benchmark has regressed by more than the tolerance. Use --update-baseline to store new
+results as the baseline. Timings depend on the machine, so neither the corpus nor the baseline
+is committed and the benchmark fails if either is missing.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+import urllib.parse
+from dataclasses import dataclass, asdict
+from typing import Any, Callable
+
+from selectolax.parser import HTMLParser
+from tortoise import Tortoise
+
+from database import database as db
+from projects.bot.config import BotConfig
+from projects.bot.main import run_pipeline
+from projects.bot.page_types import page_type
+from projects.bot.replay import ResponseCorpus
+from projects.bot.scrapers import boxofficemojo_movie_list_scraper as mojo_list
+from projects.bot.scrapers import imdb_movie_list_scraper as imdb_list
+from projects.bot.scrapers import imdb_movie_review_scraper as imdb_review
+from projects.bot.scrapers import rottentomatoes_movie_list_scraper as rt_list
+from projects.bot.scrapers import rottentomatoes_movie_review_scraper as rt_review
+
+DEFAULT_CORPUS_DIR = "projects/bot/fixtures/corpus"
+DEFAULT_BASELINE_PATH = "projects/bot/fixtures/benchmark-baseline.json"
+
+ParseFunction = Callable[[HTMLParser, str], Any]
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool
+
+    def regressed_from(self, baseline: "BenchmarkResult", tolerance: float) -> bool:
+        if self.higher_is_better:
+            return self.value < baseline.value * (1 - tolerance)
+        return self.value > baseline.value * (1 + tolerance)
+
+
+def query_value(url: str, name: str) -> str:
+    return urllib.parse.parse_qs(urllib.parse.urlsplit(url).query).get(name, [""])[0]
+
+
+def parse_functions() -> dict[str, list[tuple[str, ParseFunction]]]:
+    """Returns the parse functions of every scraper keyed by the page type they parse."""
+    logger = logging.getLogger(__name__)
+
+    def year(url: str) -> int:
+        return int(re.search(r"/year/(\d+)", url).group(1))
+
+    return {
+        "mojo_year": [
+            (
+                "boxofficemojo_movie_list_scraper.parse_releases",
+                lambda p, url: mojo_list.parse_releases(p, year(url), logger),
+            ),
+        ],
+        "imdb_list": [
+            ("imdb_movie_list_scraper.parse_movies", lambda p, url: imdb_list.parse_movies(p)),
+        ],
+        "imdb_ratings": [
+            (
+                "imdb_movie_review_scraper.parse_reviews",
+                lambda p, url: imdb_review.parse_reviews(p, None, url, logger),
+            ),
+        ],
+        "imdb_search": [
+            (
+                "imdb_movie_review_scraper.get_movie_url",
+                lambda p, url: imdb_review.get_movie_url(p, query_value(url, "q"), None, logger),
+            ),
+        ],
+        "rt_list": [
+            (
+                "rottentomatoes_movie_list_scraper.parse_tiles",
+                lambda p, url: rt_list.parse_tiles(p),
+            ),
+            (
+                "rottentomatoes_movie_list_scraper.parse_video_tiles",
+                lambda p, url: rt_list.parse_video_tiles(p),
+            ),
+            (
+                "rottentomatoes_movie_list_scraper.parse_normal_tiles",
+                lambda p, url: rt_list.parse_normal_tiles(p),
+            ),
+        ],
+        "rt_movie": [
+            (
+                "rottentomatoes_movie_review_scraper.parse_reviews",
+                lambda p, url: rt_review.parse_reviews(p, None, url, logger),
+            ),
+        ],
+        "rt_search": [
+            (
+                "rottentomatoes_movie_review_scraper.get_movie_url",
+                lambda p, url: rt_review.get_movie_url(
+                    p, query_value(url, "search"), None, logger
+                ),
+            ),
+        ],
+    }
+
+
+def pages_per_second(
+    pages: list[tuple[str, bytes]], parse: ParseFunction, min_time: float
+) -> float:
+    """Repeatedly parses the pages for at least min_time seconds, excluding DOM construction."""
+    parsers = [(url, HTMLParser(body)) for url, body in pages]
+    parsed, elapsed = 0, 0.0
+    while elapsed < min_time:
+        for url, parser in parsers:
+            start = time.perf_counter()
+            parse(parser, url)
+            elapsed += time.perf_counter() - start
+            parsed += 1
+
+    return parsed / elapsed
+
+
+def dom_pages_per_second(pages: list[tuple[str, bytes]], min_time: float) -> float:
+    parsed, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        for __, body in pages:
+            HTMLParser(body)
+            parsed += 1
+
+    return parsed / (time.perf_counter() - start)
+
+
+def benchmark_parsers(corpus: ResponseCorpus, min_time: float) -> list[BenchmarkResult]:
+    pages_by_type: dict[str, list[tuple[str, bytes]]] = {}
+    for url in corpus.urls():
+        status_code, __, body = corpus.load(url)
+        name = page_type(url)
+        if status_code == 200 and name is not None:
+            pages_by_type.setdefault(name, []).append((url, body))
+
+    results: list[BenchmarkResult] = []
+    for name, functions in parse_functions().items():
+        pages = pages_by_type.get(name)
+        if not pages:
+            logging.warning(f"No recorded '{name}' pages, skipping its benchmarks")
+            continue
+
+        rate = dom_pages_per_second(pages, min_time)
+        results.append(BenchmarkResult(f"HTMLParser[{name}]", rate, "pages/s", True))
+        for function_name, parse in functions:
+            rate = pages_per_second(pages, parse, min_time)
+            results.append(BenchmarkResult(function_name, rate, "pages/s", True))
+
+    return results
+
+
+async def benchmark_pipeline(corpus_dir: str) -> BenchmarkResult:
+    """Times a whole bot run against the replayed corpus and a fresh SQLite database."""
+    with tempfile.TemporaryDirectory() as directory:
+        config = BotConfig.from_env()
+        config.http_replay_dir = corpus_dir
+        config.http_record_dir = ""
+        config.http_cache_path = ""
+        config.database_url = f"sqlite://{os.path.join(directory, 'benchmark.sqlite3')}"
+
+        await db.init_database(config.database_url)
+        try:
+            start = time.perf_counter()
+            await run_pipeline(config)
+            elapsed = time.perf_counter() - start
+        finally:
+            await Tortoise.close_connections()
+
+    return BenchmarkResult("pipeline", elapsed, "s", False)
+
+
+def load_baseline(path: str) -> dict[str, BenchmarkResult]:
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return {name: BenchmarkResult(**result) for name, result in json.load(f).items()}
+
+
+def save_baseline(path: str, results: list[BenchmarkResult]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({r.name: asdict(r) for r in results}, f, indent=2)
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-time", type=float, default=1.0)
+    parser.add_argument("--skip-pipeline", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    corpus = ResponseCorpus(args.corpus)
+    # The corpus and baseline are recorded per machine and not committed, so say how to make them
+    if not corpus.urls():
+        raise SystemExit(
+            f"No recorded pages in '{args.corpus}', record them with "
+            f"HTTP_RECORD_DIR={args.corpus} python -m projects.bot.main"
+        )
+    if not args.update_baseline and not os.path.exists(args.baseline):
+        raise SystemExit(
+            f"No baseline at '{args.baseline}', store one with "
+            f"python -m projects.bot.benchmark --update-baseline"
+        )
+
+    results = benchmark_parsers(corpus, args.min_time)
+    if not args.skip_pipeline:
+        results.append(await benchmark_pipeline(args.corpus))
+
+    baseline = load_baseline(args.baseline)
+    regressions = 0
+    for result in results:
+        line = f"{result.name:<55} {result.value:>12.2f} {result.unit}"
+        if result.name in baseline:
+            base = baseline[result.name]
+            change = (result.value - base.value) / base.value * 100 if base.value else 0.0
+            line += f" ({change:+.1f}% vs baseline)"
+            if result.regressed_from(base, args.tolerance):
+                line += " REGRESSION"
+                regressions += 1
+        print(line)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Saved baseline to '{args.baseline}'")
+        return 0
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
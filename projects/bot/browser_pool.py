@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import re
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from playwright.async_api import (
+    Browser,
+    BrowserContext,
+    Page,
+    Playwright,
+    Route,
+    TimeoutError as PlaywrightTimeoutError,
+    async_playwright,
+)
+from selectolax.parser import HTMLParser
+
+from projects.bot.fragments import PageFragment, extract_fragment
+from projects.bot.http_client import DEFAULT_HEADERS
+from projects.bot.page_types import CONTENT_SELECTORS, page_type
+from projects.bot.replay import ResponseCorpus
+
+# Resources the scrapers never look at, so they are not downloaded by the browser
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet", "beacon", "ping"}
+BLOCKED_URLS = re.compile(
+    r"google-analytics|googletagmanager|doubleclick|googlesyndication|adsystem|"
+    r"scorecardresearch|facebook\.net|hotjar|newrelic|nr-data|segment\.io|amazon-adsystem"
+)
+
+
+@dataclass
+class PooledPage:
+    context: BrowserContext
+    page: Page
+    navigations: int = 0
+
+
+class BrowserPool:
+    """A fixed number of reusable browser pages sharing one headless browser.
+
+    Each page lives in its own context, which is replaced after max_navigations navigations to
+    bound the memory a long running context accumulates. A page that cannot be replaced leaves
+    an empty slot in the pool, and the page is created when the slot is next borrowed.
+    """
+
+    def __init__(self, size: int = 4, max_navigations: int = 50, headless: bool = True):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.size = size
+        self.max_navigations = max_navigations
+        self.headless = headless
+        self._playwright: Playwright | None = None
+        self._browser: Browser | None = None
+        self._pages: asyncio.Queue[PooledPage | None] = asyncio.Queue()
+
+    @staticmethod
+    async def __block_resources(route: Route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or BLOCKED_URLS.search(request.url):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def __new_page(self) -> PooledPage:
+        context = await self._browser.new_context(user_agent=DEFAULT_HEADERS["User-Agent"])
+        await context.route("**/*", self.__block_resources)
+        return PooledPage(context, await context.new_page())
+
+    async def start(self):
+        if self._browser is not None:
+            raise RuntimeError("The browser pool has already been started")
+
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        for page in await asyncio.gather(*[self.__new_page() for _ in range(self.size)]):
+            self._pages.put_nowait(page)
+
+    async def close(self):
+        while not self._pages.empty():
+            pooled = self._pages.get_nowait()
+            if pooled is not None:
+                await pooled.context.close()
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    @asynccontextmanager
+    async def lifespan(self) -> AsyncIterator["BrowserPool"]:
+        await self.start()
+        try:
+            yield self
+        finally:
+            await self.close()
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """Borrows a page from the pool, waiting for one to be free."""
+        if self._browser is None:
+            raise RuntimeError("The browser pool has not been started")
+
+        pooled = await self._pages.get()
+        if pooled is None:
+            try:
+                pooled = await self.__new_page()
+            except BaseException:
+                self._pages.put_nowait(None)
+                raise
+
+        try:
+            yield pooled.page
+        finally:
+            pooled.navigations += 1
+            replacement: PooledPage | None = pooled
+            try:
+                if pooled.navigations >= self.max_navigations or pooled.page.is_closed():
+                    replacement = None
+                    await pooled.context.close()
+                    replacement = await self.__new_page()
+            except Exception as ex:
+                self.logger.warning(f"Failed to replace a browser page, retrying later: {ex!r}")
+            finally:
+                # The slot always goes back, or borrowers would wait on a pool that has shrunk
+                self._pages.put_nowait(replacement)
+
+
+class PooledPlaywrightHtmlParser:
+    """Fetches pages with a browser from a BrowserPool.
+
+    The client argument of the HtmlParserProtocol methods is ignored, so this can be used
+    anywhere an HttpxHtmlParser is. Rather than waiting for the whole page to load, each
+    navigation waits for the element that the scrapers parse for that type of page.
+    """
+
+    def __init__(
+        self,
+        pool: BrowserPool,
+        timeout: float = 20.0,
+        corpus: ResponseCorpus | None = None,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.pool = pool
+        self.timeout = timeout
+        self.corpus = corpus
+
+    async def get_html_parser(self, client, url: str):
+        body = await self.get_html(client, url)
+        return HTMLParser(body) if body is not None else None
+
+    async def get_html(
+        self, client, url: str, fragment: PageFragment | None = None
+    ) -> bytes | None:
+        timeout_ms = self.timeout * 1000
+        selector = CONTENT_SELECTORS.get(page_type(url))
+        try:
+            async with self.pool.page() as page:
+                resp = await page.goto(url, wait_until="domcontentloaded", timeout=timeout_ms)
+                if resp is not None and resp.status != 200:
+                    self.logger.warning(f"URL '{url} returned status code of {resp.status}'")
+                    return None
+
+                if selector is not None:
+                    try:
+                        await page.wait_for_selector(selector, state="attached", timeout=timeout_ms)
+                    except PlaywrightTimeoutError:
+                        self.logger.debug(f"'{selector}' did not appear at '{url}'")
+
+                body = (await page.content()).encode()
+        except Exception as ex:
+            self.logger.exception(ex)
+            return None
+
+        if self.corpus is not None:
+            self.corpus.save(url, 200, {"content-type": "text/html; charset=utf-8"}, body)
+        return (extract_fragment(body, fragment) if fragment else None) or body
@@ -0,0 +1,94 @@
+import os
+from dataclasses import dataclass, fields
+
+
+@dataclass
+class BotConfig:
+    """Tunables for the scraping bot, each overridable by an environment variable of the same
+    name in upper case, e.g. FETCH_MAX_CONCURRENCY."""
+
+    database_url: str = ""
+
+    fetch_max_concurrency: int = 16
+    fetch_max_per_host: int = 4
+    fetch_stream_fragments: bool = True
+    fetch_max_requeues: int = 3
+    parse_workers: int = 0
+
+    pipeline_queue_size: int = 64
+    pipeline_batch_size: int = 20
+    pipeline_resolve_workers: int = 2
+    pipeline_review_workers: int = 4
+
+    rt_browse_lists: str = "movies_in_theaters/sort:newest"
+    rt_list_max_pages: int = 5
+
+    http2: bool = True
+    http_timeout: float = 20.0
+    http_connect_timeout: float = 10.0
+    http_max_connections: int = 32
+    http_max_keepalive_connections: int = 16
+    http_keepalive_expiry: float = 30.0
+    http_resilience: bool = True
+    http_retries: int = 2
+    http_retry_backoff: float = 0.5
+    http_hedge: bool = True
+    circuit_failure_threshold: int = 5
+    circuit_reset_timeout: float = 30.0
+    http_record_dir: str = ""
+    http_replay_dir: str = ""
+
+    rate_limit: bool = True
+    rate_limit_initial: float = 4.0
+    rate_limit_min: float = 0.2
+    rate_limit_max: float = 50.0
+    rate_limit_increase: float = 1.0
+    rate_limit_decrease: float = 0.5
+    rate_limit_latency_factor: float = 2.0
+
+    browser_fallback: bool = False
+    browser_pool_size: int = 2
+    browser_max_navigations: int = 50
+
+    http_cache_path: str = ""
+    http_cache_max_mb: int = 256
+    http_cache_ttl: float = 0.0
+    http_cache_site_ttls: str = "www.boxofficemojo.com=86400,www.imdb.com=3600,www.rottentomatoes.com=3600"
+
+    review_budget: int = 0
+    review_score_change_threshold: int = 5
+    review_history: bool = True
+
+    source_resolution_hit_ttl_days: float = 30.0
+    source_resolution_miss_ttl_days: float = 3.0
+
+    metrics: bool = False
+    metrics_summary_path: str = "run-summary.json"
+
+    job_batch_size: int = 20
+    job_lease_seconds: float = 300.0
+    job_max_attempts: int = 3
+    job_retry_delay_seconds: float = 60.0
+    job_poll_interval: float = 5.0
+
+    backfill_batch_size: int = 500
+    backfill_checkpoint_path: str = "backfill-checkpoint.json"
+
+    @classmethod
+    def from_env(cls) -> "BotConfig":
+        config = cls()
+        for field in fields(cls):
+            value = os.getenv(field.name.upper())
+            if value is None or value == "":
+                continue
+
+            if field.type is bool:
+                setattr(config, field.name, value.lower() in ("1", "true", "yes", "on"))
+            elif field.type is int:
+                setattr(config, field.name, int(value))
+            elif field.type is float:
+                setattr(config, field.name, float(value))
+            else:
+                setattr(config, field.name, value)
+
+        return config
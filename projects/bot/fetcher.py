@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+import urllib.parse
+from dataclasses import dataclass
+from typing import Any, Callable, Generic, TypeVar
+
+from selectolax.parser import HTMLParser
+
+from projects.bot import HtmlParserProtocol
+from projects.bot.fragments import PageFragment
+from projects.bot.metrics import metrics
+from projects.bot.page_types import page_type
+from projects.bot.parse_executor import ParseExecutor
+from projects.bot.rate_limiter import ThrottledError
+from projects.bot.resilience import CircuitOpenError
+
+T = TypeVar("T")
+
+# The wait before re-fetching a throttled URL that did not say when to retry, doubled each time
+THROTTLE_BACKOFF = 5.0
+
+
+@dataclass
+class FetchResult(Generic[T]):
+    """The outcome of fetching a URL, value is None if it could not be fetched or parsed."""
+
+    url: str
+    value: T | None
+    error: Exception | None = None
+    fetched: bool = True
+
+    @property
+    def ok(self) -> bool:
+        return self.fetched and self.error is None
+
+
+class ConcurrentFetcher:
+    """Fetches batches of URLs concurrently, bounded by a global and a per-host limit.
+
+    A single fetcher should be shared between scrapers so the global limit applies to the
+    whole run rather than to each scraper individually. URLs that are throttled by their site
+    are fetched again after the site's Retry-After, up to max_requeues times.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_per_host: int = 4,
+        parse_executor: ParseExecutor | None = None,
+        stream_fragments: bool = True,
+        max_requeues: int = 3,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.parse_executor = parse_executor or ParseExecutor()
+        self.stream_fragments = stream_fragments
+        self.max_requeues = max_requeues
+        self._global_limit = asyncio.Semaphore(max_concurrency)
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+
+    def __host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    async def __get_html(
+        self, scraper: HtmlParserProtocol, client, url: str, fragment: PageFragment | None
+    ) -> bytes | None:
+        """Fetches the body within the limits, without holding a slot while waiting to retry."""
+        for attempt in range(self.max_requeues + 1):
+            async with self.__host_limit(url), self._global_limit:
+                try:
+                    return await scraper.get_html(client, url, fragment)
+                except ThrottledError as ex:
+                    if attempt == self.max_requeues:
+                        raise
+                    throttled = ex
+
+            delay = throttled.retry_after or THROTTLE_BACKOFF * 2**attempt
+            self.logger.info(
+                f"Re-queueing '{url}' in {delay:.0f}s after a {throttled.status_code} response"
+            )
+            await asyncio.sleep(delay)
+
+    def __log_throttled(self, url: str, ex: ThrottledError):
+        host = urllib.parse.urlsplit(url).netloc
+        self.logger.warning(
+            f"{host} is still throttling after {self.max_requeues} re-queues, "
+            f"skipped '{url}' after a {ex.status_code} response"
+        )
+
+    async def fetch(
+        self, scraper: HtmlParserProtocol, client, url: str
+    ) -> FetchResult[HTMLParser]:
+        try:
+            body = await self.__get_html(scraper, client, url, None)
+        except CircuitOpenError as ex:
+            self.logger.warning(f"Skipped '{url}': {ex}")
+            return FetchResult(url, None, ex, fetched=False)
+        except ThrottledError as ex:
+            self.__log_throttled(url, ex)
+            return FetchResult(url, None, ex, fetched=False)
+        except Exception as ex:
+            self.logger.exception(f"Failed to fetch '{url}'")
+            return FetchResult(url, None, ex, fetched=False)
+
+        if body is None:
+            return FetchResult(url, None, fetched=False)
+        return FetchResult(url, HTMLParser(body))
+
+    async def fetch_parsed(
+        self,
+        scraper: HtmlParserProtocol,
+        client,
+        url: str,
+        parse: Callable[..., T],
+        *args: Any,
+        fragment: PageFragment | None = None,
+    ) -> FetchResult[T]:
+        """Fetches the URL and runs parse(body, *args) on the parse executor.
+
+        If a fragment is given and fragment streaming is enabled, only that part of the page
+        is downloaded and parsed when its markers are found.
+        """
+        fragment = fragment if self.stream_fragments else None
+        try:
+            body = await self.__get_html(scraper, client, url, fragment)
+        except CircuitOpenError as ex:
+            self.logger.warning(f"Skipped '{url}': {ex}")
+            return FetchResult(url, None, ex, fetched=False)
+        except ThrottledError as ex:
+            self.__log_throttled(url, ex)
+            return FetchResult(url, None, ex, fetched=False)
+        except Exception as ex:
+            self.logger.exception(f"Failed to fetch '{url}'")
+            return FetchResult(url, None, ex, fetched=False)
+
+        if body is None:
+            return FetchResult(url, None, fetched=False)
+
+        try:
+            start = time.perf_counter()
+            value = await self.parse_executor.run(parse, body, *args)
+        except Exception as ex:
+            self.logger.exception(f"Failed to parse '{url}'")
+            return FetchResult(url, None, ex)
+
+        if metrics.enabled:
+            elapsed = time.perf_counter() - start
+            metrics.observe("parse_duration_seconds", elapsed, page_type=page_type(url) or "other")
+        return FetchResult(url, value)
+
+    async def fetch_all(
+        self, scraper: HtmlParserProtocol, client, urls: list[str]
+    ) -> list[FetchResult[HTMLParser]]:
+        """Fetches all URLs, returning one result per URL in the same order as the input."""
+        results = await asyncio.gather(*[self.fetch(scraper, client, url) for url in urls])
+        self.__log_failures(results)
+        return list(results)
+
+    async def fetch_all_parsed(
+        self,
+        scraper: HtmlParserProtocol,
+        client,
+        urls: list[str],
+        parse: Callable[..., T],
+        args: list[tuple] | None = None,
+        fragment: PageFragment | None = None,
+    ) -> list[FetchResult[T]]:
+        """Fetches and parses all URLs, returning one result per URL in input order.
+
+        Each body is parsed with parse(body, *args[i]) as soon as it arrives, so parsing
+        overlaps with the remaining fetches.
+        """
+        args = args or [()] * len(urls)
+        results = await asyncio.gather(
+            *[
+                self.fetch_parsed(scraper, client, url, parse, *url_args, fragment=fragment)
+                for url, url_args in zip(urls, args)
+            ]
+        )
+        self.__log_failures(results)
+        return list(results)
+
+    def __log_failures(self, results: list[FetchResult]):
+        failed = [r for r in results if not r.ok]
+        if failed:
+            self.logger.warning(f"{len(failed)} of {len(results)} URLs failed to fetch or parse")
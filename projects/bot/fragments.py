@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class PageFragment:
+    """Markers around the only part of a page that a parser needs.
+
+    The fragment runs from the tag containing start up to and including end. If given, end is
+    only looked for after the after marker, for fragments whose closing tag also appears
+    earlier in the fragment.
+    """
+
+    start: bytes
+    end: bytes
+    after: bytes = b""
+
+
+class FragmentScanner:
+    """Incrementally scans a streamed body for a fragment, without rescanning earlier chunks."""
+
+    def __init__(self, fragment: PageFragment):
+        self.fragment = fragment
+        self.buffer = bytearray()
+        self._start = -1
+        self._after = -1 if fragment.after else 0
+        self._scanned = 0
+
+    def __find(self, marker: bytes, begin: int) -> int:
+        return self.buffer.find(marker, max(begin, self._scanned - len(marker) + 1))
+
+    def feed(self, chunk: bytes) -> bytes | None:
+        """Adds a chunk of the body, returning the fragment once it is complete."""
+        self.buffer += chunk
+        fragment = None
+
+        if self._start == -1:
+            index = self.__find(self.fragment.start, 0)
+            if index != -1:
+                tag_start = self.buffer.rfind(b"<", 0, index + 1)
+                self._start = tag_start if tag_start != -1 else index
+                self._scanned = index + len(self.fragment.start)
+
+        if self._start != -1 and self._after == -1:
+            index = self.__find(self.fragment.after, self._start)
+            if index != -1:
+                self._after = index + len(self.fragment.after)
+                self._scanned = self._after
+
+        if self._start != -1 and self._after != -1:
+            index = self.__find(self.fragment.end, max(self._start, self._after))
+            if index != -1:
+                fragment = bytes(self.buffer[self._start : index + len(self.fragment.end)])
+
+        self._scanned = max(self._scanned, len(self.buffer))
+        return fragment
+
+
+def extract_fragment(body: bytes, fragment: PageFragment) -> bytes | None:
+    return FragmentScanner(fragment).feed(body)
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+from dataclasses import dataclass
+
+from projects.bot.page_types import page_type
+
+# The pages a TTL applies to, review pages are always revalidated so every scrape sees new scores
+FRESH_PAGE_TYPES = {"mojo_year", "imdb_list", "imdb_search", "rt_list", "rt_search"}
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    body: bytes
+    etag: str | None
+    last_modified: str | None
+    stored_at: float
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Headers that let the server answer with a 304 if the page has not changed."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def parse_site_ttls(value: str) -> dict[str, float]:
+    """Parses a "host=seconds,host=seconds" string into a mapping of host to TTL."""
+    site_ttls: dict[str, float] = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        host, ttl = item.split("=", 1)
+        site_ttls[host.strip().lower()] = float(ttl)
+    return site_ttls
+
+
+class HttpCache:
+    """A size-bounded, zlib compressed, SQLite backed store of HTTP response bodies.
+
+    List and search pages younger than the TTL for their site are served without a request.
+    Older entries, and review pages, are revalidated using their ETag/Last-Modified validators.
+    Once the compressed bodies exceed max_bytes the least recently used entries are evicted,
+    their total size is read once and then kept up to date as entries are stored and evicted.
+
+    The database is only used from worker threads, so the event loop never waits on the disk.
+    Reads do not write, the times entries were last used are kept in memory and stored in one
+    batch before evicting and on close.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        default_ttl: float = 0,
+        site_ttls: dict[str, float] | None = None,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.site_ttls = site_ttls or {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._accessed: dict[str, float] = {}
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self._conn.commit()
+        (self._total_bytes,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+    def ttl_for(self, url: str) -> float:
+        if page_type(url) not in FRESH_PAGE_TYPES:
+            return 0
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        for site, ttl in self.site_ttls.items():
+            if host == site or host.endswith(f".{site}"):
+                return ttl
+        return self.default_ttl
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored_at < self.ttl_for(entry.url)
+
+    async def get(self, url: str) -> CacheEntry | None:
+        return await asyncio.to_thread(self.__get, url)
+
+    async def put(self, url: str, body: bytes, etag: str | None, last_modified: str | None):
+        await asyncio.to_thread(self.__put, url, body, etag, last_modified)
+
+    async def refresh(self, url: str):
+        """Marks an entry as revalidated, e.g. after a 304 response."""
+        await asyncio.to_thread(self.__refresh, url)
+
+    def __get(self, url: str) -> CacheEntry | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._accessed[url] = time.time()
+
+        body, etag, last_modified, stored_at = row
+        return CacheEntry(url, zlib.decompress(body), etag, last_modified, stored_at)
+
+    def __put(self, url: str, body: bytes, etag: str | None, last_modified: str | None):
+        compressed = zlib.compress(body)
+        with self._lock:
+            now = time.time()
+            self._accessed.pop(url, None)
+            replaced = self._conn.execute(
+                "SELECT size FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if replaced is not None:
+                self._total_bytes -= replaced[0]
+            self._total_bytes += len(compressed)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, compressed, len(compressed), etag, last_modified, now, now),
+            )
+            self._conn.commit()
+            self.__evict()
+
+    def __refresh(self, url: str):
+        with self._lock:
+            now = time.time()
+            self._accessed.pop(url, None)
+            self._conn.execute(
+                "UPDATE responses SET stored_at = ?, accessed_at = ? WHERE url = ?", (now, now, url)
+            )
+            self._conn.commit()
+
+    def __store_access_times(self):
+        if not self._accessed:
+            return
+
+        self._conn.executemany(
+            "UPDATE responses SET accessed_at = ? WHERE url = ?",
+            [(accessed_at, url) for url, accessed_at in self._accessed.items()],
+        )
+        self._conn.commit()
+        self._accessed.clear()
+
+    def __evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        # Entries read since the last batch must not be evicted as if they were unused
+        self.__store_access_times()
+        evicted = 0
+        rows = self._conn.execute("SELECT url, size FROM responses ORDER BY accessed_at")
+        for url, size in rows.fetchall():
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._total_bytes -= size
+            evicted += 1
+
+        self._conn.commit()
+        self.logger.debug(f"Evicted {evicted} responses from the cache")
+
+    def close(self):
+        with self._lock:
+            self.__store_access_times()
+            self._conn.close()
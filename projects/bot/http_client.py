@@ -0,0 +1,131 @@
+import importlib.util
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import httpx
+
+from projects.bot.config import BotConfig
+from projects.bot.rate_limiter import AdaptiveRateLimiter, RateLimitedTransport
+from projects.bot.replay import RecordingTransport, ReplayTransport, ResponseCorpus
+from projects.bot.resilience import ResilientTransport
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+}
+
+
+class HttpClientManager:
+    """Owns the httpx client shared by every scraper for the lifetime of a pipeline run.
+
+    httpx keeps a connection pool per origin inside a single client, so sharing one client
+    means connections (and TLS sessions) to each site are reused across scrapers.
+    """
+
+    def __init__(self, config: BotConfig | None = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config = config or BotConfig()
+        self._client: httpx.AsyncClient | None = None
+        self.rate_limiter: AdaptiveRateLimiter | None = None
+        self.resilient_transport: ResilientTransport | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient | None:
+        return self._client
+
+    def build_client(self) -> httpx.AsyncClient:
+        http2 = self.config.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            self.logger.warning("HTTP/2 requested but the h2 package is not installed")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=self.config.http_max_connections,
+            max_keepalive_connections=self.config.http_max_keepalive_connections,
+            keepalive_expiry=self.config.http_keepalive_expiry,
+        )
+        transport = None
+        if self.config.http_replay_dir:
+            transport = ReplayTransport(ResponseCorpus(self.config.http_replay_dir))
+        elif self.config.http_record_dir:
+            transport = RecordingTransport(
+                httpx.AsyncHTTPTransport(http2=http2, limits=limits),
+                ResponseCorpus(self.config.http_record_dir),
+            )
+
+        # Replayed responses are not rate limited, the sites are never contacted
+        if self.config.rate_limit and not self.config.http_replay_dir:
+            self.rate_limiter = self.rate_limiter or AdaptiveRateLimiter(
+                self.config.rate_limit_initial,
+                self.config.rate_limit_min,
+                self.config.rate_limit_max,
+                self.config.rate_limit_increase,
+                self.config.rate_limit_decrease,
+                self.config.rate_limit_latency_factor,
+            )
+            transport = RateLimitedTransport(
+                transport or httpx.AsyncHTTPTransport(http2=http2, limits=limits),
+                self.rate_limiter,
+            )
+
+        # Outermost, so retries and hedges also wait for the rate limiter
+        if self.config.http_resilience:
+            self.resilient_transport = ResilientTransport(
+                transport or httpx.AsyncHTTPTransport(http2=http2, limits=limits),
+                retries=self.config.http_retries,
+                backoff=self.config.http_retry_backoff,
+                hedge=self.config.http_hedge,
+                failure_threshold=self.config.circuit_failure_threshold,
+                reset_timeout=self.config.circuit_reset_timeout,
+            )
+            transport = self.resilient_transport
+
+        return httpx.AsyncClient(
+            http2=http2,
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(
+                self.config.http_timeout, connect=self.config.http_connect_timeout
+            ),
+            limits=limits,
+            transport=transport,
+        )
+
+    async def start(self, config: BotConfig | None = None) -> httpx.AsyncClient:
+        if self._client is not None:
+            raise RuntimeError("The HTTP client has already been started")
+
+        if config is not None:
+            self.config = config
+
+        # Each run learns the sites' rates and latencies from scratch
+        self.rate_limiter = None
+        self.resilient_transport = None
+        self._client = self.build_client()
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def lifespan(self, config: BotConfig | None = None) -> AsyncIterator[httpx.AsyncClient]:
+        """Starts the shared client and closes it once the context exits."""
+        client = await self.start(config)
+        try:
+            yield client
+        finally:
+            await self.close()
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[httpx.AsyncClient]:
+        """Yields the shared client, or a short-lived client when no run has started one."""
+        if self._client is not None:
+            yield self._client
+            return
+
+        async with self.build_client() as client:
+            yield client
+
+
+client_manager = HttpClientManager()
@@ -0,0 +1,72 @@
+import logging
+import re
+import urllib.parse
+from dataclasses import dataclass
+
+from selectolax.parser import HTMLParser
+
+from projects.bot import HtmlParserProtocol
+from projects.bot.fragments import PageFragment
+from projects.bot.page_types import CONTENT_MARKERS, page_type
+
+
+@dataclass
+class EscalationStats:
+    requests: int = 0
+    escalations: int = 0
+
+    @property
+    def rate(self) -> float:
+        return self.escalations / self.requests if self.requests else 0.0
+
+
+class HybridHtmlParser:
+    """Fetches pages over plain HTTP, escalating to a browser only when that is not enough.
+
+    A page is escalated when its 200 response is missing the element the scrapers parse for
+    its page type, which usually means the content is rendered with JavaScript. Pages of an
+    unknown type are never escalated. Neither are failed fetches, a browser would only send
+    the same request to a site that is down, missing the page or throttling the bot.
+    """
+
+    def __init__(
+        self,
+        http_parser: HtmlParserProtocol,
+        browser_parser: HtmlParserProtocol,
+        required_markers: dict[str, re.Pattern[bytes]] | None = None,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.http_parser = http_parser
+        self.browser_parser = browser_parser
+        self.required_markers = required_markers or CONTENT_MARKERS
+        self.stats: dict[str, EscalationStats] = {}
+
+    async def get_html_parser(self, client, url: str):
+        body = await self.get_html(client, url)
+        return HTMLParser(body) if body is not None else None
+
+    async def get_html(
+        self, client, url: str, fragment: PageFragment | None = None
+    ) -> bytes | None:
+        stats = self.stats.setdefault(urllib.parse.urlsplit(url).netloc, EscalationStats())
+        stats.requests += 1
+
+        body = await self.http_parser.get_html(client, url, fragment)
+        if body is None or self.__has_required_content(url, body):
+            return body
+
+        stats.escalations += 1
+        self.logger.debug(f"Escalating '{url}' to the browser")
+        return await self.browser_parser.get_html(client, url, fragment)
+
+    def __has_required_content(self, url: str, body: bytes) -> bool:
+        # Runs on the event loop for every page, so the body is scanned rather than parsed
+        marker = self.required_markers.get(page_type(url))
+        return marker is None or marker.search(body) is not None
+
+    def log_escalation_rates(self):
+        for site, stats in sorted(self.stats.items()):
+            self.logger.info(
+                f"{site}: {stats.escalations} of {stats.requests} pages escalated to the browser "
+                f"({stats.rate:.1%})"
+            )
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import socket
+from dataclasses import dataclass
+from datetime import timedelta
+
+from tortoise import connections, timezone
+from tortoise.functions import Count
+
+from database.models import ScrapeJobModel, SourceModel
+from projects.bot import HtmlParserProtocol
+from projects.bot.fetcher import ConcurrentFetcher
+from projects.bot.persistence import bump_data_version, ingest_reviews
+from projects.bot.scrapers import IMDBMovieReviewScraper, RottenTomatoesMovieReviewScraper
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+# Both claim a batch of jobs that are available, or whose lease has expired, in one statement
+CLAIM_JOBS_POSTGRES_SQL = """UPDATE scrape_jobs
+SET status = 'running',
+    worker = $1,
+    lease_expires_at = $2::timestamptz,
+    attempts = attempts + 1,
+    updated_at = $3::timestamptz
+WHERE id IN (
+    SELECT id FROM scrape_jobs
+    WHERE (status = 'pending' AND available_at <= $3::timestamptz)
+        OR (status = 'running' AND lease_expires_at < $3::timestamptz AND attempts < $5)
+    ORDER BY available_at, id
+    LIMIT $4
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, source_id, attempts"""
+
+# SQLite only allows one writer at a time, so the statement is already exclusive
+CLAIM_JOBS_SQLITE_SQL = """UPDATE scrape_jobs
+SET status = 'running',
+    worker = ?1,
+    lease_expires_at = ?2,
+    attempts = attempts + 1,
+    updated_at = ?3
+WHERE id IN (
+    SELECT id FROM scrape_jobs
+    WHERE (status = 'pending' AND available_at <= ?3)
+        OR (status = 'running' AND lease_expires_at < ?3 AND attempts < ?5)
+    ORDER BY available_at, id
+    LIMIT ?4
+)
+RETURNING id, source_id, attempts"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass
+class ClaimedJob:
+    id: int
+    source_id: int
+    attempts: int
+
+
+class ScrapeJobQueue:
+    """A queue of review scrapes stored in the scrape_jobs table, shared by many workers.
+
+    Workers claim batches of jobs under a lease, which they keep extending while they work. A
+    job whose lease expires, e.g. because its worker died, is claimed again by another worker.
+    Failed jobs are retried with an exponential backoff and dead-lettered after max_attempts.
+    """
+
+    def __init__(
+        self,
+        lease: timedelta = timedelta(minutes=5),
+        max_attempts: int = 3,
+        retry_delay: timedelta = timedelta(minutes=1),
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    async def enqueue(self, source_ids: list[int]) -> int:
+        """Queues a scrape of each source that does not already have one queued or running."""
+        if not source_ids:
+            return 0
+
+        active = set(
+            await ScrapeJobModel.filter(
+                source_id__in=source_ids, status__in=[PENDING, RUNNING]
+            ).values_list("source_id", flat=True)
+        )
+        now = timezone.now()
+        jobs = [
+            ScrapeJobModel(source_id=source_id, status=PENDING, available_at=now)
+            for source_id in dict.fromkeys(source_ids)
+            if source_id not in active
+        ]
+        if jobs:
+            await ScrapeJobModel.bulk_create(jobs)
+
+        self.logger.debug(f"Queued {len(jobs)} of {len(source_ids)} sources")
+        return len(jobs)
+
+    async def claim(self, worker: str, limit: int) -> list[ClaimedJob]:
+        """Claims up to limit jobs for the worker, without waiting on jobs claimed by others."""
+        now = timezone.now()
+        await self.__dead_letter_expired(now)
+
+        conn = connections.get("default")
+        sql = (
+            CLAIM_JOBS_POSTGRES_SQL
+            if conn.capabilities.dialect == "postgres"
+            else CLAIM_JOBS_SQLITE_SQL
+        )
+        rows = await conn.execute_query_dict(
+            sql, [worker, now + self.lease, now, limit, self.max_attempts]
+        )
+        return [ClaimedJob(row["id"], row["source_id"], row["attempts"]) for row in rows]
+
+    async def __dead_letter_expired(self, now):
+        """Gives up on jobs whose lease expired on their last attempt."""
+        dead = await ScrapeJobModel.filter(
+            status=RUNNING, lease_expires_at__lt=now, attempts__gte=self.max_attempts
+        ).update(status=DEAD, last_error="Lease expired", lease_expires_at=None, updated_at=now)
+        if dead:
+            self.logger.warning(f"Dead-lettered {dead} jobs whose lease expired")
+
+    async def heartbeat(self, worker: str, job_ids: list[int]) -> int:
+        """Extends the lease on the worker's jobs, returning how many it still holds."""
+        now = timezone.now()
+        return await ScrapeJobModel.filter(id__in=job_ids, worker=worker, status=RUNNING).update(
+            lease_expires_at=now + self.lease, updated_at=now
+        )
+
+    async def complete(self, worker: str, job_ids: list[int]):
+        if job_ids:
+            await ScrapeJobModel.filter(id__in=job_ids, worker=worker, status=RUNNING).update(
+                status=DONE, lease_expires_at=None, last_error=None, updated_at=timezone.now()
+            )
+
+    async def fail(self, worker: str, jobs: list[ClaimedJob], error: str, retry: bool = True):
+        """Makes the jobs available again after a backoff, or dead-letters them."""
+        now = timezone.now()
+        for job in jobs:
+            running = ScrapeJobModel.filter(id=job.id, worker=worker, status=RUNNING)
+            if retry and job.attempts < self.max_attempts:
+                delay = self.retry_delay * 2 ** (job.attempts - 1)
+                await running.update(
+                    status=PENDING,
+                    available_at=now + delay,
+                    lease_expires_at=None,
+                    last_error=error,
+                    updated_at=now,
+                )
+            else:
+                await running.update(
+                    status=DEAD, lease_expires_at=None, last_error=error, updated_at=now
+                )
+                self.logger.warning(f"Dead-lettered the job for source {job.source_id}: {error}")
+
+    async def counts(self) -> dict[str, int]:
+        rows = await (
+            ScrapeJobModel.annotate(count=Count("id")).group_by("status").values("status", "count")
+        )
+        return {row["status"]: row["count"] for row in rows}
+
+
+class ScrapeWorker:
+    """Claims batches of scrape jobs from a ScrapeJobQueue and scrapes their reviews."""
+
+    def __init__(
+        self,
+        queue: ScrapeJobQueue,
+        html_parser: HtmlParserProtocol,
+        fetcher: ConcurrentFetcher,
+        worker: str | None = None,
+        batch_size: int = 20,
+        poll_interval: float = 5.0,
+        keep_review_history: bool = True,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.queue = queue
+        self.worker = worker or default_worker_id()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.keep_review_history = keep_review_history
+        self.rt_scraper = RottenTomatoesMovieReviewScraper(html_parser, fetcher)
+        self.imdb_scraper = IMDBMovieReviewScraper(html_parser, fetcher)
+
+    async def run(self, exit_when_empty: bool = False) -> int:
+        """Works through jobs until cancelled, or the queue is empty if exit_when_empty is set.
+
+        Returns the number of jobs claimed.
+        """
+        claimed = 0
+        while True:
+            jobs = await self.queue.claim(self.worker, self.batch_size)
+            if not jobs:
+                if exit_when_empty:
+                    return claimed
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            claimed += len(jobs)
+            heartbeat = asyncio.create_task(self.__heartbeat([job.id for job in jobs]))
+            try:
+                await self.run_jobs(jobs)
+            except Exception as ex:
+                self.logger.exception(f"Failed to run {len(jobs)} jobs")
+                await self.queue.fail(self.worker, jobs, repr(ex))
+            finally:
+                heartbeat.cancel()
+
+    async def __heartbeat(self, job_ids: list[int]):
+        interval = self.queue.lease.total_seconds() / 3
+        while True:
+            await asyncio.sleep(interval)
+            held = await self.queue.heartbeat(self.worker, job_ids)
+            if held < len(job_ids):
+                self.logger.warning(f"Lost the lease on {len(job_ids) - held} jobs")
+
+    async def run_jobs(self, jobs: list[ClaimedJob]):
+        sources = {
+            source.id: source
+            for source in await SourceModel.filter(id__in=[job.source_id for job in jobs])
+        }
+        missing = [job for job in jobs if job.source_id not in sources]
+        if missing:
+            await self.queue.fail(self.worker, missing, "Source no longer exists", retry=False)
+
+        scraped_reviews = await asyncio.gather(
+            self.rt_scraper.run_sources(list(sources.values())),
+            self.imdb_scraper.run_sources(list(sources.values())),
+        )
+        reviews = [r for site_reviews in scraped_reviews for r in site_reviews]
+        await ingest_reviews(reviews, self.keep_review_history)
+        if reviews:
+            await bump_data_version()
+
+        scraped = {review.source_id for review in reviews}
+        jobs = [job for job in jobs if job.source_id in sources]
+        await self.queue.complete(self.worker, [job.id for job in jobs if job.source_id in scraped])
+        failed = [job for job in jobs if job.source_id not in scraped]
+        if failed:
+            await self.queue.fail(self.worker, failed, "The review page could not be fetched")
+
+        self.logger.debug(f"Scraped {len(scraped)} of {len(jobs)} sources")
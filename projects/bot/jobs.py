@@ -0,0 +1,78 @@
+"""Runs the bot as a planner and any number of workers sharing a queue of scrape jobs.
+
+    python -m projects.bot.jobs plan      # scrape the movie lists and queue due review scrapes
+    python -m projects.bot.jobs work      # claim and run queued scrapes, on as many hosts as needed
+    python -m projects.bot.jobs status    # count the jobs in each state
+
+The queue is stored in the database, so every process must use the same DATABASE_URL. Workers
+on Postgres claim jobs with SELECT ... FOR UPDATE SKIP LOCKED; SQLite can be used to run the
+planner and workers on a single host.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import timedelta
+
+from dotenv import load_dotenv
+from tortoise import Tortoise
+
+from database import database as db
+from projects.bot.config import BotConfig
+from projects.bot.job_queue import ScrapeJobQueue, ScrapeWorker
+from projects.bot.main import run_pipeline, scraping_resources
+from projects.bot.persistence import backfill_latest_reviews, bump_data_version
+
+
+def build_queue(config: BotConfig) -> ScrapeJobQueue:
+    return ScrapeJobQueue(
+        lease=timedelta(seconds=config.job_lease_seconds),
+        max_attempts=config.job_max_attempts,
+        retry_delay=timedelta(seconds=config.job_retry_delay_seconds),
+    )
+
+
+async def work(config: BotConfig, worker: str | None, exit_when_empty: bool):
+    async with scraping_resources(config) as (html_parser, fetcher):
+        scrape_worker = ScrapeWorker(
+            build_queue(config),
+            html_parser,
+            fetcher,
+            worker,
+            batch_size=config.job_batch_size,
+            poll_interval=config.job_poll_interval,
+            keep_review_history=config.review_history,
+        )
+        claimed = await scrape_worker.run(exit_when_empty)
+        logging.info(f"Worker '{scrape_worker.worker}' ran {claimed} jobs")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("plan")
+    work_parser = commands.add_parser("work")
+    work_parser.add_argument("--worker", help="defaults to <hostname>-<pid>")
+    work_parser.add_argument("--exit-when-empty", action="store_true")
+    commands.add_parser("status")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    config = BotConfig.from_env()
+    await db.init_database(config.database_url)
+    try:
+        await backfill_latest_reviews()
+        if args.command == "plan":
+            await run_pipeline(config, build_queue(config))
+            await bump_data_version()
+        elif args.command == "work":
+            await work(config, args.worker, args.exit_when_empty)
+        else:
+            for status, count in sorted((await build_queue(config).counts()).items()):
+                print(f"{status:<10} {count}")
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
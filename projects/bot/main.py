@@ -1,95 +1,104 @@
-import os
 import asyncio
 import logging
-from datetime import datetime
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator
 
 from dotenv import load_dotenv
 
 from database import database as db
-from database.models import MovieModel, SourceModel, ReviewModel
-from projects.bot import HttpxHtmlParser, sites
-from projects.bot.scrapers import (
-    RottenTomatoesMovieListScraper,
-    RottenTomatoesMovieReviewScraper,
-    IMDBMovieReviewScraper,
-)
-from projects.bot.scrapers.imdb_movie_list_scraper import IMDBMovieListScraper
-
-
-async def scrape_recent_movies() -> list[MovieModel]:
-    """Scrapes recent movies and adds/updates the database with the results."""
-    rt_scraper = RottenTomatoesMovieListScraper(HttpxHtmlParser())
-    imdb_scraper = IMDBMovieListScraper(HttpxHtmlParser())
-
-    movie_results: list[MovieModel] = []
-    scraped_movies = await asyncio.gather(rt_scraper.run(), imdb_scraper.run())
-    scraped_movies = [m for movie_list in scraped_movies for m in movie_list]
-    for movie in scraped_movies:
-        existing_movie = (
-            await MovieModel.filter(title=movie.title).prefetch_related("sources").first()
+from projects.bot import HtmlParserProtocol, HttpxHtmlParser
+from projects.bot.browser_pool import BrowserPool, PooledPlaywrightHtmlParser
+from projects.bot.config import BotConfig
+from projects.bot.fetcher import ConcurrentFetcher
+from projects.bot.http_cache import HttpCache, parse_site_ttls
+from projects.bot.http_client import client_manager
+from projects.bot.hybrid_parser import HybridHtmlParser
+from projects.bot.job_queue import ScrapeJobQueue
+from projects.bot.metrics import metrics
+from projects.bot.parse_executor import ParseExecutor
+from projects.bot.persistence import backfill_latest_reviews, bump_data_version
+from projects.bot.pipeline import StreamingPipeline
+from projects.bot.scheduler import ReviewScheduler
+from projects.bot.source_resolution import SourceResolutionCache
+
+
+@asynccontextmanager
+async def scraping_resources(
+    config: BotConfig,
+) -> AsyncIterator[tuple[HtmlParserProtocol, ConcurrentFetcher]]:
+    """Sets up the HTML parser and fetcher described by the config, closing them on exit."""
+    parse_executor = ParseExecutor(config.parse_workers)
+    fetcher = ConcurrentFetcher(
+        config.fetch_max_concurrency,
+        config.fetch_max_per_host,
+        parse_executor,
+        config.fetch_stream_fragments,
+        config.fetch_max_requeues,
+    )
+    cache = (
+        HttpCache(
+            config.http_cache_path,
+            max_bytes=config.http_cache_max_mb * 1024 * 1024,
+            default_ttl=config.http_cache_ttl,
+            site_ttls=parse_site_ttls(config.http_cache_site_ttls),
         )
+        if config.http_cache_path
+        else None
+    )
 
-        if existing_movie:
-            # Update the movie if the details are different
-            if existing_movie != movie:
-                existing_movie.release_date = movie.release_date
-                await existing_movie.save()
-
-            # Add the source for the movie if it isn't there already
-            # TODO: There could be an issue with the URL having changed for the movie source
-            if movie.source.url not in [source.url for source in existing_movie.sources]:
-                await SourceModel.get_or_create(
-                    name=movie.source.name, url=movie.source.url, movie_id=existing_movie.id
-                )
-
-            movie_results.append(existing_movie)
-        else:
-            new_movie = await MovieModel.create(title=movie.title, release_date=movie.release_date)
-            await SourceModel.create(
-                name=movie.source.name, url=movie.source.url, movie_id=new_movie.id
+    metrics.reset(config.metrics)
+    async with AsyncExitStack() as stack:
+        # Registered first so it runs last, after the stats below have been recorded
+        if config.metrics:
+            stack.callback(metrics.write_summary, config.metrics_summary_path)
+        stack.callback(parse_executor.close)
+        if cache is not None:
+            stack.callback(cache.close)
+
+        await stack.enter_async_context(client_manager.lifespan(config))
+        if client_manager.rate_limiter is not None:
+            stack.callback(client_manager.rate_limiter.log_rates)
+        if client_manager.resilient_transport is not None:
+            stack.callback(client_manager.resilient_transport.log_stats)
+        html_parser: HtmlParserProtocol = HttpxHtmlParser(cache)
+        if config.browser_fallback:
+            pool = BrowserPool(config.browser_pool_size, config.browser_max_navigations)
+            await stack.enter_async_context(pool.lifespan())
+            html_parser = HybridHtmlParser(
+                html_parser, PooledPlaywrightHtmlParser(pool, config.http_timeout)
             )
+            stack.callback(html_parser.log_escalation_rates)
 
-            await new_movie.fetch_related("sources")
-            movie_results.append(new_movie)
-
-    return movie_results
+        yield html_parser, fetcher
 
 
-async def fill_missing_movie_sources(movies: list[MovieModel]):
-    """Finds movie sources for movies that do not have a source from a given site."""
-    imdb_scraper = IMDBMovieReviewScraper(HttpxHtmlParser())
-    rt_scraper = RottenTomatoesMovieReviewScraper(HttpxHtmlParser())
-
-    # Build lists of movies for that require a specific source
-    imdb_movies = [m for m in movies if sites.IMDB not in [s.name for s in m.sources]]
-    rotten_tomato_movies = [
-        m for m in movies if sites.ROTTENTOMATOES not in [s.name for s in m.sources]
-    ]
-
-    source_results = await asyncio.gather(
-        imdb_scraper.get_sources(imdb_movies), rt_scraper.get_sources(rotten_tomato_movies)
-    )
+async def run_pipeline(config: BotConfig, job_queue: ScrapeJobQueue | None = None):
+    """Streams recent movies through upserting, source resolution and review scraping.
 
-    for source in [source for sources in source_results for source in sources]:
-        await source.save()
-
-
-async def scrape_movie_reviews():
-    """Scrapes reviews from Rottentomatoes for all movies in the database."""
-    movies = await MovieModel.all().prefetch_related("sources")
-    rt_scraper = RottenTomatoesMovieReviewScraper(HttpxHtmlParser())
-    imdb_scraper = IMDBMovieReviewScraper(HttpxHtmlParser())
-    scraped_reviews = await asyncio.gather(rt_scraper.run(movies), imdb_scraper.run(movies))
-
-    for review in [r for reviews in scraped_reviews for r in reviews]:
-        if review.should_save():
-            await ReviewModel.get_or_create(
-                source_id=review.source_id,
-                audience_score=review.audience_score,
-                audience_count=review.audience_count,
-                critic_score=review.critic_score,
-                critic_count=review.critic_count,
-            )
+    If a job queue is given, the review scrapes are queued for workers instead of being run.
+    """
+    async with scraping_resources(config) as (html_parser, fetcher):
+        resolutions = SourceResolutionCache(
+            timedelta(days=config.source_resolution_hit_ttl_days),
+            timedelta(days=config.source_resolution_miss_ttl_days),
+        )
+        scheduler = ReviewScheduler(config.review_budget, config.review_score_change_threshold)
+        pipeline = StreamingPipeline(
+            html_parser,
+            fetcher,
+            resolutions,
+            scheduler,
+            queue_size=config.pipeline_queue_size,
+            batch_size=config.pipeline_batch_size,
+            resolve_workers=config.pipeline_resolve_workers,
+            review_workers=config.pipeline_review_workers,
+            job_queue=job_queue,
+            keep_review_history=config.review_history,
+            rt_browse_lists=[b.strip() for b in config.rt_browse_lists.split(",") if b.strip()],
+            rt_list_max_pages=config.rt_list_max_pages,
+        )
+        await pipeline.run()
 
 
 async def main():
@@ -98,12 +107,11 @@ async def main():
     logger.setLevel(logging.DEBUG)
     logger.debug(f"Started executing at {datetime.now().isoformat()}")
 
-    await db.init_database(os.getenv("DATABASE_URL"))
-
-    recent_movies = await scrape_recent_movies()
-    await fill_missing_movie_sources(recent_movies)
-
-    await scrape_movie_reviews()
+    config = BotConfig.from_env()
+    await db.init_database(config.database_url)
+    await backfill_latest_reviews()
+    await run_pipeline(config)
+    await bump_data_version()
 
     logger.debug(f"Finished executing at {datetime.now().isoformat()}")
 
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+# Upper bounds of the histogram buckets, by metric name
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+HISTOGRAM_BUCKETS: dict[str, tuple[float, ...]] = {
+    "pipeline_queue_depth": (0, 1, 2, 4, 8, 16, 32, 64, 128, 256),
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters, gauges and histograms keyed by name and labels.
+
+    Every method returns straight away while disabled, so instrumented code costs next to
+    nothing unless metrics have been turned on for the run.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.enabled = enabled
+        self.started_at = time.time()
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.gauges: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+
+    def reset(self, enabled: bool):
+        """Clears every metric, e.g. at the start of a run."""
+        self.enabled = enabled
+        self.started_at = time.time()
+        self.counters.clear()
+        self.gauges.clear()
+        self.histograms.clear()
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        if not self.enabled:
+            return
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        self.gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = Histogram(HISTOGRAM_BUCKETS.get(name, SECONDS_BUCKETS))
+        series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """Observes how long the block took in seconds."""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Returns every metric as JSON serialisable data."""
+
+        def values(metric: dict[Labels, float]) -> list[dict[str, Any]]:
+            return [dict(labels=dict(labels), value=value) for labels, value in metric.items()]
+
+        def histograms(metric: dict[Labels, Histogram]) -> list[dict[str, Any]]:
+            return [
+                dict(
+                    labels=dict(labels),
+                    buckets=list(h.buckets),
+                    counts=h.counts,
+                    sum=h.sum,
+                    count=h.count,
+                )
+                for labels, h in metric.items()
+            ]
+
+        return dict(
+            counters={name: values(metric) for name, metric in self.counters.items()},
+            gauges={name: values(metric) for name, metric in self.gauges.items()},
+            histograms={name: histograms(metric) for name, metric in self.histograms.items()},
+        )
+
+    def write_summary(self, path: str, **extra: Any):
+        """Writes the metrics of the run, and any extra details, to a JSON file."""
+        finished_at = time.time()
+        summary = dict(
+            started_at=self.started_at,
+            finished_at=finished_at,
+            duration_seconds=finished_at - self.started_at,
+            **extra,
+            metrics=self.snapshot(),
+        )
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+        self.logger.info(f"Wrote the run summary to '{path}'")
+
+
+def format_labels(labels: dict[str, str], **extra: str) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    escaped = {
+        k: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for k, v in labels.items()
+    }
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(escaped.items())) + "}"
+
+
+def render_prometheus(snapshot: dict[str, Any], prefix: str) -> str:
+    """Renders a Metrics.snapshot in the Prometheus text exposition format."""
+    lines: list[str] = []
+    for kind, type_name in (("counters", "counter"), ("gauges", "gauge")):
+        for name, series in sorted(snapshot.get(kind, {}).items()):
+            lines.append(f"# TYPE {prefix}{name} {type_name}")
+            for s in series:
+                lines.append(f"{prefix}{name}{format_labels(s['labels'])} {s['value']}")
+
+    for name, series in sorted(snapshot.get("histograms", {}).items()):
+        lines.append(f"# TYPE {prefix}{name} histogram")
+        for s in series:
+            cumulative = 0
+            for bound, count in zip([*s["buckets"], "+Inf"], s["counts"]):
+                cumulative += count
+                le = format_labels(s["labels"], le=str(bound))
+                lines.append(f"{prefix}{name}_bucket{le} {cumulative}")
+            lines.append(f"{prefix}{name}_sum{format_labels(s['labels'])} {s['sum']}")
+            lines.append(f"{prefix}{name}_count{format_labels(s['labels'])} {s['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+# Shared by everything in the process, enabled by the bot's config or the api's environment
+metrics = Metrics()
@@ -0,0 +1,38 @@
+import re
+
+# The kinds of page the scrapers fetch, recognised by their URL
+PAGE_TYPES: list[tuple[str, re.Pattern]] = [
+    ("mojo_year", re.compile(r"boxofficemojo\.com/year/\d+")),
+    ("imdb_list", re.compile(r"imdb\.com/chart/")),
+    ("imdb_ratings", re.compile(r"imdb\.com/title/[^/]+/ratings")),
+    ("imdb_search", re.compile(r"imdb\.com/find")),
+    ("rt_list", re.compile(r"rottentomatoes\.com/browse/")),
+    ("rt_movie", re.compile(r"rottentomatoes\.com/m/")),
+    ("rt_search", re.compile(r"rottentomatoes\.com/search")),
+]
+
+# An element present once the content the scrapers parse has been rendered
+CONTENT_SELECTORS: dict[str, str] = {
+    "mojo_year": "tbody tr",
+    "imdb_list": "ul.ipc-metadata-list",
+    "imdb_ratings": 'p[data-testid="calculations-label"]',
+    "imdb_search": "h1",
+    "rt_list": ".js-tile-link",
+    "rt_movie": "score-board",
+    "rt_search": "h1",
+}
+
+# The same elements found with a scan of the raw body, which is far cheaper than building a DOM
+CONTENT_MARKERS: dict[str, re.Pattern[bytes]] = {
+    "mojo_year": re.compile(rb"<tbody\b.*?<tr\b", re.DOTALL),
+    "imdb_list": re.compile(rb'<ul\b[^>]*class="(?:[^"]*\s)?ipc-metadata-list[\s"]'),
+    "imdb_ratings": re.compile(rb'<p\b[^>]*data-testid="calculations-label"'),
+    "imdb_search": re.compile(rb"<h1\b"),
+    "rt_list": re.compile(rb'class="(?:[^"]*\s)?js-tile-link[\s"]'),
+    "rt_movie": re.compile(rb"<score-board\b"),
+    "rt_search": re.compile(rb"<h1\b"),
+}
+
+
+def page_type(url: str) -> str | None:
+    return next((name for name, pattern in PAGE_TYPES if pattern.search(url)), None)
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class ParseExecutor:
+    """Runs CPU bound parse functions off the event loop in a pool of worker processes.
+
+    With no workers the functions run inline on the event loop, which is easier to debug. Parse
+    functions and their arguments are pickled, so they must be module level functions or class
+    methods and should return small results rather than DOM nodes.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.workers = workers
+        self._pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+
+    @property
+    def inline(self) -> bool:
+        return self._pool is None
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        if self._pool is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
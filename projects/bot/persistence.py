@@ -0,0 +1,306 @@
+from tortoise import connections, timezone
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from database.models import DataVersionModel, MovieModel, SourceModel
+from projects.bot.metrics import metrics
+from projects.bot.result_models import MovieResult, ReviewResult
+from projects.bot.titles import TitleIndex, release_year
+
+
+UPSERT_MOVIE_POSTGRES_SQL = """INSERT INTO movies (
+    title, title_key, release_date, created_at, updated_at
+)
+VALUES ($1, $2, $3, $4, $4)
+ON CONFLICT (title_key) DO UPDATE SET
+    release_date = EXCLUDED.release_date,
+    updated_at = EXCLUDED.updated_at
+WHERE EXCLUDED.release_date IS NOT NULL
+    AND movies.release_date IS DISTINCT FROM EXCLUDED.release_date"""
+
+UPSERT_MOVIE_SQLITE_SQL = """INSERT INTO movies (
+    title, title_key, release_date, created_at, updated_at
+)
+VALUES (?1, ?2, ?3, ?4, ?4)
+ON CONFLICT (title_key) DO UPDATE SET
+    release_date = excluded.release_date,
+    updated_at = excluded.updated_at
+WHERE excluded.release_date IS NOT NULL AND movies.release_date IS NOT excluded.release_date"""
+
+INSERT_SOURCE_POSTGRES_SQL = """INSERT INTO movie_sources (movie_id, name, url) VALUES ($1, $2, $3)
+ON CONFLICT (movie_id, name) DO NOTHING"""
+
+INSERT_SOURCE_SQLITE_SQL = """INSERT INTO movie_sources (movie_id, name, url) VALUES (?, ?, ?)
+ON CONFLICT (movie_id, name) DO NOTHING"""
+
+
+async def load_title_index() -> TitleIndex:
+    """Indexes every stored movie by its title, once per run."""
+    titles = TitleIndex()
+    rows = await MovieModel.all().values_list("id", "title", "title_key", "release_date")
+    for movie_id, title, key, release_date in rows:
+        titles.add(title, release_year(release_date), key=key, id=movie_id)
+    return titles
+
+
+async def upsert_movies(
+    scraped_movies: list[MovieResult], titles: TitleIndex | None = None
+) -> list[MovieModel]:
+    """Adds/updates the scraped movies and their sources using a fixed number of queries.
+
+    Movies are matched through the title index, which is loaded if not given, and stored on
+    their title key; sources are matched on their movie and site, so concurrent writers never
+    create duplicates. Returns each matched or created movie once, in the order it was first
+    scraped, with its sources prefetched.
+    """
+    if not scraped_movies:
+        return []
+
+    if titles is None:
+        titles = await load_title_index()
+    with metrics.timer("db_write_duration_seconds", operation="upsert_movies"):
+        return await _upsert_movies(scraped_movies, titles)
+
+
+async def _upsert_movies(scraped_movies: list[MovieResult], titles: TitleIndex) -> list[MovieModel]:
+    keys = [titles.resolve(m.title, release_year(m.release_date)).key for m in scraped_movies]
+    # The first scrape of a movie in the batch decides its details
+    movies_by_key: dict[str, MovieResult] = {}
+    for key, scraped in zip(keys, scraped_movies):
+        movies_by_key.setdefault(key, scraped)
+
+    now = timezone.now()
+    async with in_transaction() as conn:
+        postgres = conn.capabilities.dialect == "postgres"
+        await conn.execute_many(
+            UPSERT_MOVIE_POSTGRES_SQL if postgres else UPSERT_MOVIE_SQLITE_SQL,
+            [[m.title, key, m.release_date, now] for key, m in movies_by_key.items()],
+        )
+        metrics.inc("db_rows_written_total", len(movies_by_key), table="movies")
+
+        ids_by_key = dict(
+            await MovieModel.filter(title_key__in=list(movies_by_key))
+            .using_db(conn)
+            .values_list("title_key", "id")
+        )
+        await insert_sources(
+            [
+                SourceModel(movie_id=ids_by_key[key], name=m.source.name, url=m.source.url)
+                for key, m in zip(keys, scraped_movies)
+                if m.source is not None
+            ],
+            using_db=conn,
+        )
+
+        movie_ids = [ids_by_key[key] for key in movies_by_key]
+        movies = (
+            await MovieModel.filter(id__in=movie_ids).prefetch_related("sources").using_db(conn)
+        )
+
+    for key, movie_id in ids_by_key.items():
+        titles.get(key).id = movie_id
+    movies_by_id = {movie.id: movie for movie in movies}
+    return [movies_by_id[movie_id] for movie_id in movie_ids]
+
+
+async def insert_sources(sources: list[SourceModel], using_db=None) -> list[SourceModel]:
+    """Adds the sources for sites their movies have no source from yet.
+
+    The first source of a site for a movie wins, both within the list and against the stored
+    ones. Returns the stored sources of the sites given, whichever was kept.
+    """
+    if not sources:
+        return []
+
+    conn = using_db or connections.get("default")
+    sql = (
+        INSERT_SOURCE_POSTGRES_SQL
+        if conn.capabilities.dialect == "postgres"
+        else INSERT_SOURCE_SQLITE_SQL
+    )
+    await conn.execute_many(sql, [[s.movie_id, s.name, s.url] for s in sources])
+    metrics.inc("db_rows_written_total", len(sources), table="movie_sources")
+
+    pairs = {(s.movie_id, s.name) for s in sources}
+    stored = await SourceModel.filter(
+        movie_id__in=list({movie_id for movie_id, __ in pairs}),
+        name__in=list({name for __, name in pairs}),
+    ).using_db(conn)
+    return [s for s in stored if (s.movie_id, s.name) in pairs]
+
+
+REVIEW_COLUMNS = ["source_id", "audience_score", "audience_count", "critic_score", "critic_count"]
+
+# History is compacted, a review is only stored if its scores differ from the latest ones
+MERGE_STAGED_REVIEWS_SQL = """INSERT INTO reviews (
+    source_id, audience_score, audience_count, critic_score, critic_count, created_at
+)
+SELECT DISTINCT
+    s.source_id, s.audience_score, s.audience_count, s.critic_score, s.critic_count, $1::timestamptz
+FROM reviews_staging s
+WHERE NOT EXISTS (
+    SELECT 1 FROM latest_reviews l
+    WHERE l.source_id = s.source_id
+        AND l.audience_score IS NOT DISTINCT FROM s.audience_score
+        AND l.audience_count IS NOT DISTINCT FROM s.audience_count
+        AND l.critic_score IS NOT DISTINCT FROM s.critic_score
+        AND l.critic_count IS NOT DISTINCT FROM s.critic_count
+)"""
+
+# A source scraped twice in a batch keeps the scores scraped last
+MERGE_STAGED_LATEST_REVIEWS_SQL = """INSERT INTO latest_reviews (
+    source_id, audience_score, audience_count, critic_score, critic_count, scraped_at, changed_at
+)
+SELECT DISTINCT ON (source_id)
+    source_id, audience_score, audience_count, critic_score, critic_count,
+    $1::timestamptz, $1::timestamptz
+FROM reviews_staging
+ORDER BY source_id, ordinal DESC
+ON CONFLICT (source_id) DO UPDATE SET
+    audience_score = EXCLUDED.audience_score,
+    audience_count = EXCLUDED.audience_count,
+    critic_score = EXCLUDED.critic_score,
+    critic_count = EXCLUDED.critic_count,
+    scraped_at = EXCLUDED.scraped_at,
+    changed_at = CASE
+        WHEN (
+            latest_reviews.audience_score, latest_reviews.audience_count,
+            latest_reviews.critic_score, latest_reviews.critic_count
+        ) IS NOT DISTINCT FROM (
+            EXCLUDED.audience_score, EXCLUDED.audience_count,
+            EXCLUDED.critic_score, EXCLUDED.critic_count
+        )
+        THEN latest_reviews.changed_at
+        ELSE EXCLUDED.changed_at
+    END"""
+
+INSERT_REVIEW_IF_CHANGED_SQL = """INSERT INTO reviews (
+    source_id, audience_score, audience_count, critic_score, critic_count, created_at
+)
+SELECT ?1, ?2, ?3, ?4, ?5, ?6
+WHERE NOT EXISTS (
+    SELECT 1 FROM latest_reviews l
+    WHERE l.source_id = ?1
+        AND l.audience_score IS ?2
+        AND l.audience_count IS ?3
+        AND l.critic_score IS ?4
+        AND l.critic_count IS ?5
+)"""
+
+UPSERT_LATEST_REVIEW_SQL = """INSERT INTO latest_reviews (
+    source_id, audience_score, audience_count, critic_score, critic_count, scraped_at, changed_at
+)
+VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?6)
+ON CONFLICT (source_id) DO UPDATE SET
+    audience_score = excluded.audience_score,
+    audience_count = excluded.audience_count,
+    critic_score = excluded.critic_score,
+    critic_count = excluded.critic_count,
+    scraped_at = excluded.scraped_at,
+    changed_at = CASE
+        WHEN latest_reviews.audience_score IS excluded.audience_score
+            AND latest_reviews.audience_count IS excluded.audience_count
+            AND latest_reviews.critic_score IS excluded.critic_score
+            AND latest_reviews.critic_count IS excluded.critic_count
+        THEN latest_reviews.changed_at
+        ELSE excluded.changed_at
+    END"""
+
+# Fills in the latest review of sources whose reviews were stored before latest_reviews existed
+BACKFILL_LATEST_REVIEWS_SQL = """INSERT INTO latest_reviews (
+    source_id, audience_score, audience_count, critic_score, critic_count, scraped_at, changed_at
+)
+SELECT
+    r.source_id, r.audience_score, r.audience_count, r.critic_score, r.critic_count,
+    r.created_at, r.created_at
+FROM reviews r
+WHERE r.id IN (SELECT max(id) FROM reviews GROUP BY source_id)
+    AND NOT EXISTS (SELECT 1 FROM latest_reviews l WHERE l.source_id = r.source_id)"""
+
+
+async def ingest_reviews(reviews: list[ReviewResult], keep_history: bool = True):
+    """Stores the latest scores of each source and, if keep_history is set, any that changed.
+
+    On Postgres the batch is streamed into a temporary staging table with COPY and merged with
+    one statement per table; other databases fall back to executemany calls.
+    """
+    records = [
+        (r.source_id, r.audience_score, r.audience_count, r.critic_score, r.critic_count)
+        for r in reviews
+        if r.should_save()
+    ]
+    if not records:
+        return
+
+    with metrics.timer("db_write_duration_seconds", operation="ingest_reviews"):
+        history_rows, latest_rows = await _ingest_review_records(records, keep_history)
+    metrics.inc("db_rows_written_total", latest_rows, table="latest_reviews")
+    if keep_history:
+        metrics.inc("db_rows_written_total", history_rows, table="reviews")
+
+
+async def _ingest_review_records(records: list[tuple], keep_history: bool) -> tuple[int, int]:
+    """Returns the number of rows written to reviews and to latest_reviews."""
+    scraped_at = timezone.now()
+    history_rows = 0
+    async with in_transaction() as conn:
+        # The history is written first, as it is compared with the latest scores before the update
+        if conn.capabilities.dialect != "postgres":
+            rows = [[*record, scraped_at] for record in records]
+            if keep_history:
+                changes = await _total_changes(conn)
+                await conn.execute_many(INSERT_REVIEW_IF_CHANGED_SQL, rows)
+                history_rows = await _total_changes(conn) - changes
+            # Only the scores scraped last for each source are kept, as with DISTINCT ON
+            latest = {row[0]: row for row in rows}
+            await conn.execute_many(UPSERT_LATEST_REVIEW_SQL, list(latest.values()))
+            return history_rows, len(latest)
+
+        async with conn.acquire_connection() as connection:
+            await connection.execute(
+                """CREATE TEMPORARY TABLE reviews_staging (
+                    source_id INT,
+                    audience_score INT,
+                    audience_count TEXT,
+                    critic_score INT,
+                    critic_count TEXT,
+                    ordinal INT
+                ) ON COMMIT DROP"""
+            )
+            # The ordinal keeps the order of the batch, which the table itself does not
+            await connection.copy_records_to_table(
+                "reviews_staging",
+                records=[(*record, ordinal) for ordinal, record in enumerate(records)],
+                columns=[*REVIEW_COLUMNS, "ordinal"],
+            )
+            if keep_history:
+                status = await connection.execute(MERGE_STAGED_REVIEWS_SQL, scraped_at)
+                history_rows = _rows_affected(status)
+            status = await connection.execute(MERGE_STAGED_LATEST_REVIEWS_SQL, scraped_at)
+            return history_rows, _rows_affected(status)
+
+
+async def _total_changes(conn) -> int:
+    """The rows SQLite has inserted, updated or deleted on the connection so far."""
+    rows = await conn.execute_query_dict("SELECT total_changes() AS changes")
+    return rows[0]["changes"]
+
+
+def _rows_affected(status: str) -> int:
+    # asyncpg returns the command tag, e.g. "INSERT 0 12"
+    return int(status.rsplit(" ", 1)[-1])
+
+
+async def backfill_latest_reviews():
+    """Copies the newest stored review of every source missing from latest_reviews."""
+    conn = connections.get("default")
+    await conn.execute_script(BACKFILL_LATEST_REVIEWS_SQL)
+
+
+async def bump_data_version():
+    """Tells readers of the database, e.g. the api's page cache, that the data has changed."""
+    updated = await DataVersionModel.filter(id=1).update(
+        version=F("version") + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        await DataVersionModel.get_or_create(id=1, defaults=dict(version=1))
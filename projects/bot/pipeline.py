@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable
+
+from database.models import MovieModel, SourceModel
+from projects.bot import HtmlParserProtocol, sites
+from projects.bot.fetcher import ConcurrentFetcher
+from projects.bot.job_queue import ScrapeJobQueue
+from projects.bot.metrics import metrics
+from projects.bot.persistence import ingest_reviews, insert_sources, load_title_index, upsert_movies
+from projects.bot.result_models import MovieResult, ReviewResult
+from projects.bot.scheduler import ReviewScheduler
+from projects.bot.source_resolution import SourceResolutionCache
+from projects.bot.scrapers import (
+    IMDBMovieReviewScraper,
+    RottenTomatoesMovieListScraper,
+    RottenTomatoesMovieReviewScraper,
+)
+from projects.bot.scrapers.imdb_movie_list_scraper import IMDBMovieListScraper
+
+# Put on a queue once every producer for it has finished
+DONE: Any = object()
+
+
+async def take_batch(queue: asyncio.Queue, size: int, name: str = "") -> list | None:
+    """Waits for an item and takes up to size - 1 more that are already queued.
+
+    Returns None once the queue has been closed with DONE, leaving DONE on the queue for the
+    other workers of the same stage.
+    """
+    metrics.observe("pipeline_queue_depth", queue.qsize(), queue=name)
+    item = await queue.get()
+    if item is DONE:
+        queue.put_nowait(DONE)
+        return None
+
+    batch = [item]
+    while len(batch) < size and not queue.empty():
+        item = queue.get_nowait()
+        if item is DONE:
+            queue.put_nowait(DONE)
+            break
+        batch.append(item)
+
+    return batch
+
+
+async def run_all(*coros: Awaitable):
+    """Runs the coroutines concurrently, cancelling the rest as soon as one fails."""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@dataclass
+class PipelineStats:
+    movies: int = 0
+    sources: int = 0
+    reviews: int = 0
+    first_review_after: float | None = None
+
+
+class StreamingPipeline:
+    """Moves each scraped movie through upserting, source resolution and review scraping.
+
+    The stages are connected by bounded queues, so a movie's reviews are scraped as soon as its
+    sources are known rather than after every movie has been through every stage, and a slow
+    stage holds back the stages feeding it instead of letting work pile up in memory. Each
+    stage takes whatever is already queued, up to batch_size items, so the database is still
+    written to in batches. Once the recently released movies are done, any other sources that
+    are due a scrape are scheduled as well.
+
+    If a job queue is given, due sources are queued as scrape jobs for ScrapeWorkers rather
+    than scraped by the pipeline itself.
+    """
+
+    def __init__(
+        self,
+        html_parser: HtmlParserProtocol,
+        fetcher: ConcurrentFetcher,
+        resolutions: SourceResolutionCache,
+        scheduler: ReviewScheduler,
+        queue_size: int = 64,
+        batch_size: int = 20,
+        resolve_workers: int = 2,
+        review_workers: int = 4,
+        job_queue: ScrapeJobQueue | None = None,
+        keep_review_history: bool = True,
+        rt_browse_lists: list[str] | None = None,
+        rt_list_max_pages: int = 5,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.html_parser = html_parser
+        self.fetcher = fetcher
+        self.resolutions = resolutions
+        self.scheduler = scheduler
+        self.batch_size = batch_size
+        self.resolve_workers = resolve_workers
+        self.review_workers = review_workers
+        self.job_queue = job_queue
+        self.keep_review_history = keep_review_history
+        self.rt_browse_lists = rt_browse_lists
+        self.rt_list_max_pages = rt_list_max_pages
+        self.stats = PipelineStats()
+
+        self._scraped: asyncio.Queue[MovieResult] = asyncio.Queue(queue_size)
+        self._movies: asyncio.Queue[MovieModel] = asyncio.Queue(queue_size)
+        self._sources: asyncio.Queue[SourceModel] = asyncio.Queue(queue_size)
+        self._reviews: asyncio.Queue[ReviewResult] = asyncio.Queue(queue_size)
+        self._movie_ids: set[int] = set()
+        self._source_ids: set[int] = set()
+        # Sources the scheduler has already let through, and charged to the budget
+        self._due_ids: set[int] = set()
+        self._started_at = 0.0
+
+    async def run(self) -> PipelineStats:
+        self._started_at = time.perf_counter()
+        await run_all(
+            self.__close_after(self._scraped, self.__discover_movies()),
+            self.__close_after(self._movies, self.__upsert_movies()),
+            self.__close_after(self._sources, self.__queue_sources()),
+            self.__close_after(
+                self._reviews,
+                *[self.__scrape_reviews() for _ in range(self.review_workers)],
+            ),
+            self.__write_reviews(),
+        )
+
+        elapsed = time.perf_counter() - self._started_at
+        metrics.set("pipeline_movies", self.stats.movies)
+        metrics.set("pipeline_sources", self.stats.sources)
+        metrics.set("pipeline_reviews", self.stats.reviews)
+        if self.stats.first_review_after is not None:
+            metrics.set("pipeline_first_review_seconds", self.stats.first_review_after)
+        first_review = (
+            f"{self.stats.first_review_after:.1f}s"
+            if self.stats.first_review_after is not None
+            else "never"
+        )
+        self.logger.info(
+            f"{self.stats.movies} movies, {self.stats.sources} sources and {self.stats.reviews} "
+            f"reviews in {elapsed:.1f}s, first review after {first_review}"
+        )
+        return self.stats
+
+    @staticmethod
+    async def __close_after(queue: asyncio.Queue, *producers: Awaitable):
+        await asyncio.gather(*producers)
+        await queue.put(DONE)
+
+    async def __discover_movies(self):
+        """Scrapes the lists of recent movies, queueing each list as soon as it is scraped."""
+
+        async def scrape(scraper):
+            for movie in await scraper.run():
+                await self._scraped.put(movie)
+
+        await asyncio.gather(
+            scrape(
+                RottenTomatoesMovieListScraper(
+                    self.html_parser, self.fetcher, self.rt_browse_lists, self.rt_list_max_pages
+                )
+            ),
+            scrape(IMDBMovieListScraper(self.html_parser, self.fetcher)),
+        )
+
+    async def __upsert_movies(self):
+        titles = await load_title_index()
+        while (batch := await take_batch(self._scraped, self.batch_size, "scraped")) is not None:
+            movies = await upsert_movies(batch, titles)
+
+            for movie in movies:
+                # A movie on more than one list only needs its sources resolving once
+                if movie.id not in self._movie_ids:
+                    self._movie_ids.add(movie.id)
+                    self.stats.movies += 1
+                    await self._movies.put(movie)
+
+    async def __queue_sources(self):
+        await asyncio.gather(*[self.__resolve_sources() for _ in range(self.resolve_workers)])
+
+        # Anything else the scheduler says is due, e.g. movies no longer on the recent lists
+        for source in await self.scheduler.due_sources(exclude_ids=self._source_ids):
+            self._due_ids.add(source.id)
+            await self.__queue_source(source)
+
+    async def __resolve_sources(self):
+        imdb_scraper = IMDBMovieReviewScraper(self.html_parser, self.fetcher)
+        rt_scraper = RottenTomatoesMovieReviewScraper(self.html_parser, self.fetcher)
+        while (movies := await take_batch(self._movies, self.batch_size, "movies")) is not None:
+            # Sources may have been added by a later list since the movie was queued
+            sources = await SourceModel.filter(movie_id__in=[m.id for m in movies])
+            found = await self.__find_missing_sources(movies, sources, imdb_scraper, rt_scraper)
+            for source in sources + found:
+                await self.__queue_source(source)
+
+    async def __find_missing_sources(
+        self,
+        movies: list[MovieModel],
+        sources: list[SourceModel],
+        imdb_scraper: IMDBMovieReviewScraper,
+        rt_scraper: RottenTomatoesMovieReviewScraper,
+    ) -> list[SourceModel]:
+        """Finds and stores sources for the movies that do not have one from each site."""
+        known = {(s.movie_id, s.name) for s in sources}
+        imdb_movies = [m for m in movies if (m.id, sites.IMDB) not in known]
+        rotten_tomato_movies = [m for m in movies if (m.id, sites.ROTTENTOMATOES) not in known]
+        if not imdb_movies and not rotten_tomato_movies:
+            return []
+
+        # Only search for movies that have not been searched for recently
+        await self.resolutions.load(imdb_movies + rotten_tomato_movies)
+        imdb_cached, imdb_movies = self.resolutions.partition(sites.IMDB, imdb_movies)
+        rt_cached, rotten_tomato_movies = self.resolutions.partition(
+            sites.ROTTENTOMATOES, rotten_tomato_movies
+        )
+
+        (imdb_sources, imdb_searched), (rt_sources, rt_searched) = await asyncio.gather(
+            imdb_scraper.get_sources(imdb_movies), rt_scraper.get_sources(rotten_tomato_movies)
+        )
+        # Failed searches are not remembered, so they are retried on the next run
+        await self.resolutions.record(sites.IMDB, imdb_searched, imdb_sources)
+        await self.resolutions.record(sites.ROTTENTOMATOES, rt_searched, rt_sources)
+
+        found = imdb_cached + rt_cached + imdb_sources + rt_sources
+        if not found:
+            return []
+
+        # A later list may have added a source for the site while the search was running
+        return await insert_sources(found)
+
+    async def __queue_source(self, source: SourceModel):
+        if source.id not in self._source_ids:
+            self._source_ids.add(source.id)
+            self.stats.sources += 1
+            await self._sources.put(source)
+
+    async def __scrape_reviews(self):
+        rt_scraper = RottenTomatoesMovieReviewScraper(self.html_parser, self.fetcher)
+        imdb_scraper = IMDBMovieReviewScraper(self.html_parser, self.fetcher)
+        while (sources := await take_batch(self._sources, self.batch_size, "sources")) is not None:
+            due = [s for s in sources if s.id in self._due_ids]
+            unchecked = [s.id for s in sources if s.id not in self._due_ids]
+            if unchecked:
+                due += await self.scheduler.due_sources(source_ids=unchecked)
+            if self.job_queue is not None:
+                await self.job_queue.enqueue([s.id for s in due])
+                continue
+
+            scraped_reviews = await asyncio.gather(
+                rt_scraper.run_sources(due), imdb_scraper.run_sources(due)
+            )
+            for review in [r for reviews in scraped_reviews for r in reviews]:
+                await self._reviews.put(review)
+
+    async def __write_reviews(self):
+        while (reviews := await take_batch(self._reviews, self.batch_size, "reviews")) is not None:
+            await ingest_reviews(reviews, self.keep_review_history)
+            if self.stats.first_review_after is None:
+                self.stats.first_review_after = time.perf_counter() - self._started_at
+            self.stats.reviews += len(reviews)
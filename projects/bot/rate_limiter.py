@@ -0,0 +1,196 @@
+import asyncio
+import email.utils
+import logging
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from projects.bot.metrics import metrics
+
+# Responses that mean a site wants us to slow down
+THROTTLE_STATUS_CODES = {429, 503}
+
+# Latency has to rise by at least this many seconds to count, so jitter on fast sites is ignored
+LATENCY_SLACK = 0.25
+
+# Longest Retry-After that is honoured, so one bad header cannot stall a whole run
+MAX_RETRY_AFTER = 300.0
+
+
+class ThrottledError(Exception):
+    """Raised when a site answers with 429 or 503, so the URL can be fetched again later."""
+
+    def __init__(self, url: str, status_code: int, retry_after: float | None = None):
+        super().__init__(f"'{url}' was throttled with status code {status_code}")
+        self.url = url
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Returns the seconds to wait from a Retry-After header of seconds or an HTTP date."""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), MAX_RETRY_AFTER)
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return min(max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0), MAX_RETRY_AFTER)
+
+
+class HostRateLimit:
+    """A token bucket for one host whose rate is adjusted with AIMD.
+
+    Every healthy response raises the rate by increase / rate, i.e. by about increase requests
+    per second for every second at full speed. A throttled response, or a latency above
+    latency_factor times the lowest latency seen, multiplies it by decrease, at most once per
+    cooldown seconds so a burst of slow or throttled responses only counts once.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        min_rate: float,
+        max_rate: float,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_factor: float = 2.0,
+        cooldown: float = 2.0,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.tokens = 1.0
+        self.blocked_until = 0.0
+        self.latency: float | None = None
+        self.baseline_latency: float | None = None
+        self.throttled = 0
+        self._updated_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def __refill(self, now: float):
+        # A burst of at most one second's worth of requests
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """Waits until a request to the host is allowed, serving waiters in order."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.__refill(now)
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def __decrease(self, now: float):
+        if now - self._decreased_at >= self.cooldown:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._decreased_at = now
+
+    def record(self, status_code: int, latency: float):
+        now = time.monotonic()
+        if status_code in THROTTLE_STATUS_CODES:
+            self.throttled += 1
+            self.__decrease(now)
+            return
+
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.baseline_latency is None or self.latency < self.baseline_latency:
+            self.baseline_latency = self.latency
+
+        slow = self.baseline_latency * self.latency_factor
+        if self.latency > slow and self.latency > self.baseline_latency + LATENCY_SLACK:
+            self.__decrease(now)
+        elif status_code < 500:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def block(self, seconds: float):
+        """Stops requests to the host for the given number of seconds."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class AdaptiveRateLimiter:
+    """Keeps a HostRateLimit for every host, created on the first request to it."""
+
+    def __init__(
+        self,
+        initial_rate: float = 4.0,
+        min_rate: float = 0.2,
+        max_rate: float = 50.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_factor: float = 2.0,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.hosts: dict[str, HostRateLimit] = {}
+
+    def host(self, host: str) -> HostRateLimit:
+        if host not in self.hosts:
+            self.hosts[host] = HostRateLimit(
+                self.initial_rate,
+                self.min_rate,
+                self.max_rate,
+                self.increase,
+                self.decrease,
+                self.latency_factor,
+            )
+        return self.hosts[host]
+
+    def log_rates(self):
+        for host, limit in sorted(self.hosts.items()):
+            metrics.set("rate_limit_requests_per_second", limit.rate, site=host)
+            self.logger.info(
+                f"{host}: {limit.rate:.1f} requests/s, {limit.throttled} throttled responses"
+            )
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Waits for the rate limiter before each request and feeds every response back to it."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: AdaptiveRateLimiter):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.transport = transport
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limit = self.limiter.host(request.url.host)
+        await limit.acquire()
+
+        start = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        limit.record(response.status_code, time.monotonic() - start)
+
+        if response.status_code in THROTTLE_STATUS_CODES:
+            retry_after = parse_retry_after(response.headers.get("retry-after"))
+            if retry_after:
+                self.logger.info(f"{request.url.host} asked to retry after {retry_after:.0f}s")
+                limit.block(retry_after)
+
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+import httpx
+
+
+class ResponseCorpus:
+    """A directory of recorded responses, one body and one metadata file per URL."""
+
+    def __init__(self, directory: str):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.directory = directory
+
+    def __path(self, url: str, extension: str) -> str:
+        name = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.{extension}")
+
+    def urls(self) -> list[str]:
+        if not os.path.isdir(self.directory):
+            return []
+
+        urls: list[str] = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.directory, name)) as f:
+                    urls.append(json.load(f)["url"])
+        return urls
+
+    def save(self, url: str, status_code: int, headers: dict[str, str], body: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.__path(url, "body"), "wb") as f:
+            f.write(body)
+        with open(self.__path(url, "json"), "w") as f:
+            json.dump(dict(url=url, status_code=status_code, headers=headers), f, indent=2)
+
+    def load(self, url: str) -> tuple[int, dict[str, str], bytes] | None:
+        try:
+            with open(self.__path(url, "json")) as f:
+                meta = json.load(f)
+            with open(self.__path(url, "body"), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+
+        return meta["status_code"], meta["headers"], body
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Passes requests through to another transport, saving every full page to a corpus.
+
+    The conditional headers of the HTTP cache are dropped, so the sites answer with the page
+    rather than a 304 without a body, and only 200 responses are saved.
+    """
+
+    # Headers that describe the encoding of the original bytes rather than the stored body
+    EXCLUDED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+    CONDITIONAL_HEADERS = ("if-none-match", "if-modified-since")
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, corpus: ResponseCorpus):
+        self.transport = transport
+        self.corpus = corpus
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for name in self.CONDITIONAL_HEADERS:
+            request.headers.pop(name, None)
+
+        response = await self.transport.handle_async_request(request)
+        body = await response.aread()
+        headers = {
+            k: v for k, v in response.headers.items() if k.lower() not in self.EXCLUDED_HEADERS
+        }
+        if response.status_code == 200:
+            await asyncio.to_thread(
+                self.corpus.save, str(request.url), response.status_code, headers, body
+            )
+        return httpx.Response(response.status_code, headers=headers, content=body)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Serves responses from a corpus without touching the network.
+
+    URLs that were never recorded are answered with a 404.
+    """
+
+    def __init__(self, corpus: ResponseCorpus):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.corpus = corpus
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        recorded = await asyncio.to_thread(self.corpus.load, str(request.url))
+        if recorded is None:
+            self.logger.warning(f"No recorded response for '{request.url}'")
+            return httpx.Response(404, request=request)
+
+        status_code, headers, body = recorded
+        return httpx.Response(status_code, headers=headers, content=body, request=request)
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import httpx
+
+from projects.bot.metrics import metrics
+
+# Failures that are worth retrying, the request may not even have reached the site
+RETRYABLE_ERRORS = (httpx.ConnectTimeout, httpx.ReadTimeout, httpx.PoolTimeout)
+
+# Server errors that count towards opening a circuit, 503 is left to the rate limiter
+FAILURE_STATUS_CODES = {500, 502, 504}
+
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request to a site whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Fails requests to a site fast after failure_threshold consecutive failures.
+
+    Once open for reset_timeout seconds, the circuit is half open and a single probe request
+    is let through. The circuit closes if the probe succeeds and opens again if it fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def abandon_probe(self):
+        """Lets another request probe the site when a probe was cancelled without an outcome."""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class LatencyTracker:
+    """The recent response latencies of a site, used to decide when to hedge a request."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, latency: float):
+        self.samples.append(latency)
+
+    def percentile(self, percentile: float) -> float | None:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * percentile), len(ordered) - 1)]
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """Retries, hedges and circuit breaks the requests of another transport, per site.
+
+    Idempotent requests that time out connecting, reading the response headers or waiting for
+    a pooled connection are retried with full jitter backoff. A request still waiting for its
+    headers after the site's p95 latency is hedged with a second identical request, the first
+    response wins and the other is cancelled. Hedges are limited to max_hedge_ratio of the
+    requests to a site so a slow site is not sent twice the traffic.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        retries: int = 2,
+        backoff: float = 0.5,
+        hedge: bool = True,
+        min_hedge_delay: float = 0.2,
+        max_hedge_ratio: float = 0.1,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.latencies: dict[str, LatencyTracker] = {}
+        self.requests: dict[str, int] = {}
+        self.hedges: dict[str, int] = {}
+
+    def __breaker(self, host: str) -> CircuitBreaker:
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[host]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        breaker = self.__breaker(host)
+        retries = self.retries if request.method in IDEMPOTENT_METHODS else 0
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                metrics.inc("http_circuit_rejections_total", site=host)
+                raise CircuitOpenError(f"The circuit for {host} is open", request=request)
+
+            try:
+                response = await self.__send(request, host)
+            except RETRYABLE_ERRORS as ex:
+                breaker.record_failure()
+                if attempt == retries:
+                    raise
+                metrics.inc("http_retries_total", site=host)
+                delay = random.uniform(0, self.backoff * 2**attempt)
+                self.logger.debug(f"Retrying '{request.url}' in {delay:.2f}s after {ex!r}")
+                await asyncio.sleep(delay)
+                continue
+            except httpx.TransportError:
+                breaker.record_failure()
+                raise
+            except asyncio.CancelledError:
+                breaker.abandon_probe()
+                raise
+
+            if response.status_code in FAILURE_STATUS_CODES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+
+    async def __send(self, request: httpx.Request, host: str) -> httpx.Response:
+        latencies = self.latencies.setdefault(host, LatencyTracker())
+        self.requests[host] = self.requests.get(host, 0) + 1
+
+        start = time.monotonic()
+        delay = self.__hedge_delay(request, host)
+        if delay is None:
+            response = await self.transport.handle_async_request(request)
+        else:
+            response = await self.__send_hedged(request, host, delay)
+
+        if response.status_code < 500:
+            latencies.add(time.monotonic() - start)
+        return response
+
+    def __hedge_delay(self, request: httpx.Request, host: str) -> float | None:
+        if not self.hedge or request.method not in IDEMPOTENT_METHODS:
+            return None
+        if self.hedges.get(host, 0) >= self.requests[host] * self.max_hedge_ratio:
+            return None
+
+        p95 = self.latencies[host].percentile(0.95)
+        return max(p95, self.min_hedge_delay) if p95 is not None else None
+
+    async def __send_hedged(
+        self, request: httpx.Request, host: str, delay: float
+    ) -> httpx.Response:
+        first = asyncio.create_task(self.transport.handle_async_request(request))
+        try:
+            done, __ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done:
+            return first.result()
+
+        self.hedges[host] = self.hedges.get(host, 0) + 1
+        metrics.inc("http_hedges_total", site=host)
+        self.logger.debug(f"Hedging '{request.url}' after {delay:.2f}s")
+        second = asyncio.create_task(self.transport.handle_async_request(request))
+        winner = None
+        try:
+            pending = {first, second}
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if t.exception() is None), None)
+        finally:
+            losers = [task for task in (first, second) if task is not winner]
+            for task in losers:
+                task.cancel()
+            for result in await asyncio.gather(*losers, return_exceptions=True):
+                if isinstance(result, httpx.Response):
+                    await result.aclose()
+
+        # If both requests failed, raise the error of the original one
+        return winner.result() if winner is not None else first.result()
+
+    def log_stats(self):
+        for host, requests in sorted(self.requests.items()):
+            p95 = self.latencies[host].percentile(0.95)
+            self.logger.info(
+                f"{host}: {requests} requests, {self.hedges.get(host, 0)} hedged, "
+                f"p95 {f'{p95:.2f}s' if p95 is not None else 'unknown'}, "
+                f"circuit {self.__breaker(host).state}"
+            )
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -12,7 +12,8 @@ class SourceResult:
 class MovieResult:
     title: str
     release_date: date | None
-    source: SourceResult
+    # None for lists of sites without reviews, such as Box Office Mojo
+    source: SourceResult | None
 
 
 @dataclass
@@ -0,0 +1,169 @@
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from tortoise import timezone
+from tortoise.expressions import Q
+
+from database.models import ReviewModel, SourceModel
+
+# How often a source is re-scraped, by how long ago the movie was released
+RELEASE_AGE_INTERVALS: list[tuple[timedelta, timedelta]] = [
+    (timedelta(days=14), timedelta(hours=6)),
+    (timedelta(days=60), timedelta(days=1)),
+    (timedelta(days=365), timedelta(days=7)),
+]
+OLD_RELEASE_INTERVAL = timedelta(days=30)
+UNKNOWN_RELEASE_INTERVAL = timedelta(days=1)
+
+# Reviews within this window are used to decide if a score is still moving
+SCORE_CHANGE_WINDOW = timedelta(days=30)
+
+
+@dataclass
+class SourceSchedule:
+    source: SourceModel
+    last_scraped_at: datetime | None
+    score_change: int
+    next_due_at: datetime | None
+
+    def is_due(self, now: datetime) -> bool:
+        return self.next_due_at is None or self.next_due_at <= now
+
+
+class ReviewScheduler:
+    """Decides which sources are due a review scrape.
+
+    Each source is due once an interval has passed since its last review. The interval grows
+    with the age of the movie's release and is halved while its scores are still changing.
+    Sources that have never been scraped are always due.
+    """
+
+    def __init__(self, budget: int = 0, score_change_threshold: int = 5):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.budget = budget
+        self.score_change_threshold = score_change_threshold
+        self.scheduled = 0
+
+    def interval_for(self, release_date: date | None, score_change: int, today: date) -> timedelta:
+        if release_date is None:
+            interval = UNKNOWN_RELEASE_INTERVAL
+        else:
+            age = today - release_date
+            interval = next(
+                (i for max_age, i in RELEASE_AGE_INTERVALS if age <= max_age), OLD_RELEASE_INTERVAL
+            )
+
+        if score_change >= self.score_change_threshold:
+            interval /= 2
+
+        return interval
+
+    def __may_be_due(self, now: datetime) -> Q:
+        """Sources that are due if their scores are changing, so their interval is halved.
+
+        The release dates bounding each interval are those interval_for picks them with.
+        """
+        today = now.date()
+        conditions = [
+            Q(latest_review__scraped_at__isnull=True),
+            Q(
+                movie__release_date__isnull=True,
+                latest_review__scraped_at__lte=now - UNKNOWN_RELEASE_INTERVAL / 2,
+            ),
+        ]
+        newer_than = None
+        for max_age, interval in RELEASE_AGE_INTERVALS:
+            released = dict(movie__release_date__gte=today - max_age)
+            if newer_than is not None:
+                released["movie__release_date__lt"] = newer_than
+            conditions.append(Q(**released, latest_review__scraped_at__lte=now - interval / 2))
+            newer_than = today - max_age
+        conditions.append(
+            Q(
+                movie__release_date__lt=newer_than,
+                latest_review__scraped_at__lte=now - OLD_RELEASE_INTERVAL / 2,
+            )
+        )
+        return Q(*conditions, join_type=Q.OR)
+
+    async def plan(
+        self,
+        now: datetime | None = None,
+        source_ids: list[int] | None = None,
+        exclude_ids: set[int] | None = None,
+    ) -> list[SourceSchedule]:
+        """Returns the schedule of the sources that may be due or the given ones, by when due.
+
+        Sources are only read with their history if the database finds they may be due, so a
+        run reads the sources it scrapes rather than every source.
+        """
+        now = now or timezone.now()
+        if source_ids is not None:
+            sources_query = SourceModel.filter(id__in=source_ids)
+        else:
+            sources_query = SourceModel.filter(self.__may_be_due(now))
+
+        # The history only holds changed scores, so when a source was last scraped is kept apart
+        sources = await sources_query.select_related("movie", "latest_review")
+        if exclude_ids:
+            # Filtered here rather than with a NOT IN, which would grow with every source of a run
+            sources = [source for source in sources if source.id not in exclude_ids]
+        if not sources:
+            return []
+
+        # Sources never scraped are due whatever their scores, so need no history
+        scraped_ids = [s.id for s in sources if s.latest_review is not None]
+        recent_reviews = []
+        if scraped_ids:
+            recent_reviews = await ReviewModel.filter(
+                source_id__in=scraped_ids, created_at__gte=now - SCORE_CHANGE_WINDOW
+            ).values("source_id", "audience_score", "critic_score")
+        recent_scores: dict[int, dict[str, list[int]]] = {}
+        for review in recent_reviews:
+            scores = recent_scores.setdefault(review["source_id"], dict(audience=[], critic=[]))
+            if review["audience_score"] is not None:
+                scores["audience"].append(review["audience_score"])
+            if review["critic_score"] is not None:
+                scores["critic"].append(review["critic_score"])
+
+        schedules: list[SourceSchedule] = []
+        for source in sources:
+            scores = recent_scores.get(source.id, {})
+            score_change = max([max(s) - min(s) for s in scores.values() if s], default=0)
+
+            last = source.latest_review.scraped_at if source.latest_review else None
+            next_due_at = None
+            if last is not None:
+                interval = self.interval_for(source.movie.release_date, score_change, now.date())
+                next_due_at = last + interval
+
+            schedules.append(SourceSchedule(source, last, score_change, next_due_at))
+
+        # Never scraped sources first, then the most overdue
+        schedules.sort(key=lambda s: (s.next_due_at is not None, s.next_due_at or now))
+        return schedules
+
+    async def due_sources(
+        self,
+        now: datetime | None = None,
+        source_ids: list[int] | None = None,
+        exclude_ids: set[int] | None = None,
+    ) -> list[SourceModel]:
+        """Returns the sources due a scrape, limited to what is left of the budget if one is set.
+
+        The budget is shared by every call on the same scheduler, so a scheduler should be
+        created for each run.
+        """
+        now = now or timezone.now()
+        schedules = await self.plan(now, source_ids, exclude_ids)
+        due = [s.source for s in schedules if s.is_due(now)]
+        if self.budget:
+            remaining = max(self.budget - self.scheduled, 0)
+            if len(due) > remaining:
+                self.logger.info(f"{len(due)} sources are due, scraping {remaining} within budget")
+                due = due[:remaining]
+
+        self.scheduled += len(due)
+        self.logger.debug(f"{len(due)} of {len(schedules)} sources are due a review scrape")
+        return due
@@ -1,44 +1,83 @@
+import asyncio
 from datetime import datetime
+from logging import Logger
+from typing import AsyncIterator
 
-import httpx
 from selectolax.parser import HTMLParser
 
-from database.models import MovieModel
 from projects.bot import HtmlParserProtocol
+from projects.bot.fetcher import ConcurrentFetcher, FetchResult
+from projects.bot.http_client import client_manager
+from projects.bot.result_models import MovieResult
 
 BOX_OFFICE_MOJO_URL = "https://www.boxofficemojo.com/year/{year}/"
 
 
+def parse_releases(parser: HTMLParser, year: int, logger: Logger) -> list[MovieResult]:
+    movies: list[MovieResult] = []
+    ranking_table = parser.css_first("tbody")
+    if ranking_table is None:
+        logger.debug(f"No releases listed for {year}")
+        return movies
+
+    for row in ranking_table.css("tr"):
+        data = row.css("td")
+        if not data:
+            continue
+
+        try:
+            # The website stores the date with the format Jan 17
+            date_with_year = f"{data[8].text()} {year}"
+            release_date = datetime.strptime(date_with_year, "%b %d %Y").date()
+        except ValueError as ex:
+            logger.exception(ex)
+            release_date = None
+
+        # Box Office Mojo has no reviews, so its movies are stored without a source
+        movies.append(
+            MovieResult(title=data[1].text(strip=True), release_date=release_date, source=None)
+        )
+
+    return movies
+
+
+def parse_year_page(body: bytes, year: int, logger: Logger) -> list[MovieResult]:
+    """Parses the releases of a raw year page, can be run by a ParseExecutor worker."""
+    return parse_releases(HTMLParser(body), year, logger)
+
+
 class BoxOfficeMojoMovieListScraper:
-    def __init__(self, scraper: HtmlParserProtocol):
+    def __init__(self, scraper: HtmlParserProtocol, fetcher: ConcurrentFetcher | None = None):
         self.scraper = scraper
+        self.fetcher = fetcher or ConcurrentFetcher()
         self.logger = scraper.logger
 
-    def __parse_html(self, parser: HTMLParser, year: int) -> enumerate[MovieModel]:
-        ranking_table = parser.css_first("tbody")
-        for row in ranking_table.css("tr"):
-            data = row.css("td")
-            if not data:
-                continue
+    async def run(self, year: int) -> list[MovieResult]:
+        async for __, movies in self.run_years([year]):
+            return movies or []
+        return []
 
-            try:
-                # The website stores the date with the format Jan 17
-                date_with_year = f"{data[8].text()} {year}"
-                release_date = datetime.strptime(date_with_year, "%b %d %Y").date()
-            except ValueError as ex:
-                self.logger.exception(ex)
-                release_date = None
-
-            distributor = data[9].text(strip=True)
-            yield MovieModel(
-                title=data[1].text(strip=True),
-                rank=int(data[0].text(strip=True)),
-                release_date=release_date,
-                distributor=None if not distributor or distributor == "-" else distributor,
+    async def run_years(
+        self, years: list[int]
+    ) -> AsyncIterator[tuple[int, list[MovieResult] | None]]:
+        """Fetches the years concurrently, yielding each year's releases as soon as it is parsed.
+
+        The releases are None for a year whose page could not be fetched or parsed.
+        """
+
+        async def fetch_year(client, year: int) -> tuple[int, FetchResult[list[MovieResult]]]:
+            url = BOX_OFFICE_MOJO_URL.format(year=year)
+            return year, await self.fetcher.fetch_parsed(
+                self.scraper, client, url, parse_year_page, year, self.logger
             )
 
-    async def run(self, year: int) -> enumerate[MovieModel]:
-        mojo_box_office_url = BOX_OFFICE_MOJO_URL.format(year=year)
-        async with httpx.AsyncClient() as client:
-            parser = await self.scraper.get_html_parser(client, mojo_box_office_url)
-            return self.__parse_html(parser, year)
+        async with client_manager.session() as client:
+            tasks = [asyncio.create_task(fetch_year(client, year)) for year in years]
+            try:
+                for next_year in asyncio.as_completed(tasks):
+                    year, result = await next_year
+                    yield year, result.value
+            finally:
+                # The caller may stop early, the remaining years are not needed then
+                for task in tasks:
+                    task.cancel()
@@ -1,105 +1,165 @@
+import re
 import urllib.parse
+from logging import Logger
 
-import httpx
 from httpx import AsyncClient
 from selectolax.parser import HTMLParser, Node
 
 from database.models import MovieModel, SourceModel
-from projects.bot import HtmlParserProtocol, sites, HttpxHtmlParser
+from projects.bot import HtmlParserProtocol, sites
+from projects.bot.fetcher import ConcurrentFetcher, FetchResult
+from projects.bot.fragments import PageFragment
+from projects.bot.http_client import client_manager
 from projects.bot.result_models import ReviewResult
+from projects.bot.titles import best_match, release_year
 
 BASE_URL = "https://www.imdb.com"
 SEARCH_URL = "https://www.imdb.com/find/?q={search}&ref_=nv_sr_sm"
 
+# The year a search result was released, or a series started, as in "2021" or "2019–2023"
+RELEASE_YEAR = re.compile(r"^\d{4}")
+
+# The part of the ratings page from the IMDB rating up to the user rating calculation
+RATINGS_PAGE_FRAGMENT = PageFragment(
+    b'class="sc-5931bdee-', b"</p>", after=b'data-testid="calculations-label"'
+)
+
+
+def parse_reviews(
+    parser: HTMLParser, source_id: int | None, url: str, logger: Logger
+) -> ReviewResult:
+    """Parses the IMDB ratings from the movie ratings page"""
+    imdb_rating_node = parser.css_first("span.sc-5931bdee-1.jUnWeS")
+    imdb_count_node = parser.css_first("div.sc-5931bdee-3.dWymrF")
+    user_rating_node = parser.css_first('p[data-testid="calculations-label"]')
+    if not imdb_rating_node:
+        logger.debug(f"No IMDB rating at '{url}'")
+
+    imdb_rating, user_rating = None, None
+    if imdb_rating_node:
+        imdb_rating = imdb_rating_node.text(strip=True)
+    if user_rating_node:
+        user_rating = user_rating_node.text(strip=True)
+
+    return ReviewResult(
+        source_id=source_id,
+        audience_score=int(float(user_rating.split(" ", 1)[0]) * 10) if user_rating else None,
+        audience_count="",
+        critic_score=int(float(imdb_rating) * 10) if imdb_rating else None,
+        critic_count=imdb_count_node.text(strip=True) if imdb_count_node else None,
+    )
+
+
+def _get_release_year(link: Node) -> int | None:
+    """The year listed under a search result, from the result's list item."""
+    item = link.parent
+    while item is not None and item.tag != "li":
+        item = item.parent
+    if item is None:
+        return None
+
+    for node in item.css("span.ipc-metadata-list-summary-item__li"):
+        if match := RELEASE_YEAR.match(node.text(strip=True)):
+            return int(match[0])
+    return None
+
+
+def get_movie_url(
+    parser: HTMLParser, movie_title: str, year: int | None, logger: Logger
+) -> str | None:
+    movie_links = parser.css("a.ipc-metadata-list-summary-item__t")
+    if not movie_links:
+        logger.debug(f"No search results for movie '{movie_title}'")
+        return None
+
+    # The link for the movie with the matching title and year or default to first movie
+    position = best_match(
+        movie_title,
+        year,
+        [(link.text(strip=True), _get_release_year(link)) for link in movie_links],
+    )
+    link = movie_links[position if position is not None else 0]
+    return f"{BASE_URL}{link.attrs.get('href')}"
+
+
+def parse_review_page(
+    body: bytes, source_id: int | None, url: str, logger: Logger
+) -> ReviewResult:
+    """Parses the scores from a raw ratings page, can be run by a ParseExecutor worker."""
+    return parse_reviews(HTMLParser(body), source_id, url, logger)
+
+
+def parse_search_page(
+    body: bytes, movie_title: str, year: int | None, logger: Logger
+) -> str | None:
+    """Picks the movie URL from a raw search page, can be run by a ParseExecutor worker."""
+    return get_movie_url(HTMLParser(body), movie_title, year, logger)
+
 
 class IMDBMovieReviewScraper:
-    def __init__(self, scraper: HtmlParserProtocol):
+    def __init__(self, scraper: HtmlParserProtocol, fetcher: ConcurrentFetcher | None = None):
         self.scraper = scraper
+        self.fetcher = fetcher or ConcurrentFetcher()
         self.logger = scraper.logger
 
-    def __parse_reviews(self, parser: HTMLParser, source_id: int | None, url: str) -> ReviewResult:
-        """Parses the rottentomatoes scores from the movie details page"""
-        imdb_rating_node = parser.css_first("span.sc-5931bdee-1.jUnWeS")
-        imdb_count_node = parser.css_first("div.sc-5931bdee-3.dWymrF")
-        user_rating_node = parser.css_first('p[data-testid="calculations-label"]')
-
-        imdb_rating, user_rating = None, None
-        if imdb_rating_node:
-            imdb_rating = imdb_rating_node.text(strip=True)
-        if user_rating_node:
-            user_rating = user_rating_node.text(strip=True)
-
-        return ReviewResult(
-            source_id=source_id,
-            audience_score=int(float(user_rating.split(" ", 1)[0]) * 10) if user_rating else None,
-            audience_count="",
-            critic_score=int(float(imdb_rating) * 10) if imdb_rating else None,
-            critic_count=imdb_count_node.text(strip=True) if imdb_count_node else None,
-        )
-
-    @staticmethod
-    def __search_page_has_results(parser: HTMLParser) -> bool:
-        """Determines if the search page has any movies present or not."""
-        page_heading = parser.css_first("h1")
-        return "search__no-results-header" not in page_heading.attrs.get("class", "").split()
-
-    @staticmethod
-    def __get_title_and_link(movie_node: Node) -> tuple[str, str]:
-        """Returns the title and url link to the movie."""
-        link_node = movie_node.css_first('a[data-qa="info-name"]')
-        return link_node.text(strip=True), link_node.attrs.get("href")
-
-    def __get_movie_url(self, parser: HTMLParser, movie_title: str) -> str | None:
-        movie_links = parser.css("a.ipc-metadata-list-summary-item__t")
-        if not movie_links:
-            return None
-
-        for link in movie_links:
-            title = link.text(strip=True)
-            if title and title.upper() == movie_title.upper():
-                return f"{BASE_URL}{link.attrs.get('href')}"
-        else:
-            return f"{BASE_URL}{movie_links[0].attrs.get('href')}"
-
     async def run(self, movies: list[MovieModel]) -> list[ReviewResult]:
-        movie_reviews: list[ReviewResult] = []
-        async with httpx.AsyncClient() as client:
-            for movie in movies:
-                sources = [s for s in movie.sources if s.name == sites.IMDB]
-                source = sources[0] if len(sources) else None
-
-                if not source:
-                    continue
+        sources: list[SourceModel] = []
+        for movie in movies:
+            movie_sources = [s for s in movie.sources if s.name == sites.IMDB]
+            if movie_sources:
+                sources.append(movie_sources[0])
 
-                ratings_url = urllib.parse.urljoin(source.url, "ratings")
-                parser = await self.scraper.get_html_parser(client, ratings_url)
+        return await self.run_sources(sources)
 
-                if parser is not None:
-                    review = self.__parse_reviews(parser, source.id, source.url)
-                    review.movie_id = movie.id
-                    movie_reviews.append(review)
+    async def run_sources(self, sources: list[SourceModel]) -> list[ReviewResult]:
+        """Scrapes the reviews for the given sources, ignoring sources from other sites."""
+        movie_reviews: list[ReviewResult] = []
+        sources = [s for s in sources if s.name == sites.IMDB]
+        async with client_manager.session() as client:
+            ratings_urls = [urllib.parse.urljoin(s.url, "ratings") for s in sources]
+            results = await self.fetcher.fetch_all_parsed(
+                self.scraper,
+                client,
+                ratings_urls,
+                parse_review_page,
+                [(s.id, s.url, self.logger) for s in sources],
+                fragment=RATINGS_PAGE_FRAGMENT,
+            )
+
+        for source, result in zip(sources, results):
+            if result.value is not None:
+                review = result.value
+                review.movie_id = source.movie_id
+                movie_reviews.append(review)
 
         return movie_reviews
 
     async def get_movie_urls(
         self, c: AsyncClient, movies: list[MovieModel]
-    ) -> list[tuple[int, str]]:
-        all_movie_urls: list[tuple[int, str]] = []
-        for movie in movies:
-            search_url = SEARCH_URL.format(search=urllib.parse.quote(movie.title))
-            parser = await self.scraper.get_html_parser(c, search_url)
-            if parser is not None:
-                movie_url = self.__get_movie_url(parser, movie.title)
-                if movie_url is not None:
-                    all_movie_urls.append((movie.id, movie_url))
-
-        return all_movie_urls
+    ) -> list[FetchResult[str]]:
+        search_urls = [SEARCH_URL.format(search=urllib.parse.quote(m.title)) for m in movies]
+        return await self.fetcher.fetch_all_parsed(
+            self.scraper,
+            c,
+            search_urls,
+            parse_search_page,
+            [(m.title, release_year(m.release_date), self.logger) for m in movies],
+        )
 
-    async def get_sources(self, movies: list[MovieModel]) -> list[SourceModel]:
+    async def get_sources(
+        self, movies: list[MovieModel]
+    ) -> tuple[list[SourceModel], list[MovieModel]]:
+        """Returns the sources found and the movies whose search page was fetched and parsed."""
         sources: list[SourceModel] = []
-        async with httpx.AsyncClient() as client:
-            movie_urls = await self.get_movie_urls(client, movies)
-            for movie_id, url in movie_urls:
-                sources.append(SourceModel(name=sites.IMDB, url=url, movie_id=movie_id))
-
-        return sources
+        searched: list[MovieModel] = []
+        async with client_manager.session() as client:
+            results = await self.get_movie_urls(client, movies)
+
+        for movie, result in zip(movies, results):
+            if not result.ok:
+                continue
+            searched.append(movie)
+            if result.value is not None:
+                sources.append(SourceModel(name=sites.IMDB, url=result.value, movie_id=movie.id))
+
+        return sources, searched
@@ -1,84 +1,135 @@
 import asyncio
 from datetime import datetime, date
 
-import httpx
 from selectolax.parser import HTMLParser, Node
 
+from database.models import SourceModel
 from projects.bot import HtmlParserProtocol
+from projects.bot.fetcher import ConcurrentFetcher
+from projects.bot.http_client import client_manager
 from projects.bot.result_models import MovieResult, SourceResult
 from projects.bot import sites
 
-# URL for the list of fresh movies - page number just loads more movies - max page is 5
+# A page of a list holds the movies of the pages before it too - max page is 5
 BASE_URL = "https://www.rottentomatoes.com"
-MOVIE_LIST_URL = "https://www.rottentomatoes.com/browse/movies_in_theaters/sort:a_z?page=5"
+BROWSE_URL = "https://www.rottentomatoes.com/browse/{browse_list}?page={page}"
+MAX_PAGES = 5
 
+# Sorted newest first, so the pages past the first one of only known movies hold nothing new
+DEFAULT_BROWSE_LISTS = ["movies_in_theaters/sort:newest"]
 
-class RottenTomatoesMovieListScraper:
-    def __init__(self, scraper: HtmlParserProtocol):
-        self.scraper = scraper
-        self.logger = scraper.logger
 
-    @staticmethod
-    def safe_parse_open_date(node: Node) -> date | None:
-        open_date_text = node.text(strip=True)
-        if open_date_text.startswith("Open"):
-            open_date_text = open_date_text.split(" ", 1)[1]
-
-        try:
-            return datetime.strptime(open_date_text, "%b %d, %Y").date()
-        except ValueError:
-            return None
-
-    async def __parse_video_tiles(self, parser: HTMLParser) -> list[MovieResult]:
-        movies: list[MovieResult] = []
-        tile_nodes = parser.css("div.js-tile-link")
-        for tile_node in tile_nodes:
-            link_node = tile_node.css_first('a[data-qa="discovery-media-list-item-caption"]')
-            title_node = tile_node.css_first('span[data-qa="discovery-media-list-item-title"]')
-            opened_node = tile_node.css_first(
-                'span[data-qa="discovery-media-list-item-start-date"]'
-            )
+def safe_parse_open_date(node: Node) -> date | None:
+    open_date_text = node.text(strip=True)
+    if open_date_text.startswith("Open"):
+        open_date_text = open_date_text.split(" ", 1)[1]
 
-            title = title_node.text(strip=True)
-            movies.append(
-                MovieResult(
-                    title=title,
-                    release_date=self.safe_parse_open_date(opened_node),
-                    source=SourceResult(
-                        sites.ROTTENTOMATOES, f"{BASE_URL}{link_node.attrs.get('href')}"
-                    ),
-                )
+    try:
+        return datetime.strptime(open_date_text, "%b %d, %Y").date()
+    except ValueError:
+        return None
+
+
+def parse_video_tiles(parser: HTMLParser) -> list[MovieResult]:
+    movies: list[MovieResult] = []
+    tile_nodes = parser.css("div.js-tile-link")
+    for tile_node in tile_nodes:
+        link_node = tile_node.css_first('a[data-qa="discovery-media-list-item-caption"]')
+        title_node = tile_node.css_first('span[data-qa="discovery-media-list-item-title"]')
+        opened_node = tile_node.css_first('span[data-qa="discovery-media-list-item-start-date"]')
+
+        title = title_node.text(strip=True)
+        movies.append(
+            MovieResult(
+                title=title,
+                release_date=safe_parse_open_date(opened_node),
+                source=SourceResult(
+                    sites.ROTTENTOMATOES, f"{BASE_URL}{link_node.attrs.get('href')}"
+                ),
             )
+        )
+
+    return movies
 
-        return movies
 
-    async def __parse_normal_tiles(self, parser: HTMLParser) -> list[MovieResult]:
-        movies: list[MovieResult] = []
-        tile_nodes = parser.css("a.js-tile-link")
-        for tile_node in tile_nodes:
-            title_node = tile_node.css_first('span[data-qa="discovery-media-list-item-title"]')
-            opened_node = tile_node.css_first(
-                'span[data-qa="discovery-media-list-item-start-date"]'
+def parse_normal_tiles(parser: HTMLParser) -> list[MovieResult]:
+    movies: list[MovieResult] = []
+    tile_nodes = parser.css("a.js-tile-link")
+    for tile_node in tile_nodes:
+        title_node = tile_node.css_first('span[data-qa="discovery-media-list-item-title"]')
+        opened_node = tile_node.css_first('span[data-qa="discovery-media-list-item-start-date"]')
+
+        movies.append(
+            MovieResult(
+                title=title_node.text(strip=True),
+                release_date=safe_parse_open_date(opened_node) if opened_node else None,
+                source=SourceResult(
+                    sites.ROTTENTOMATOES, f"{BASE_URL}{tile_node.attrs.get('href')}"
+                ),
             )
+        )
+
+    return movies
+
 
-            movies.append(
-                MovieResult(
-                    title=title_node.text(strip=True),
-                    release_date=self.safe_parse_open_date(opened_node) if opened_node else None,
-                    source=SourceResult(
-                        sites.ROTTENTOMATOES, f"{BASE_URL}{tile_node.attrs.get('href')}"
-                    ),
+def parse_tiles(parser: HTMLParser) -> list[MovieResult]:
+    return parse_normal_tiles(parser) + parse_video_tiles(parser)
+
+
+def parse_list_page(body: bytes) -> list[MovieResult]:
+    """Parses the movies from a raw list page, can be run by a ParseExecutor worker."""
+    return parse_tiles(HTMLParser(body))
+
+
+class RottenTomatoesMovieListScraper:
+    def __init__(
+        self,
+        scraper: HtmlParserProtocol,
+        fetcher: ConcurrentFetcher | None = None,
+        browse_lists: list[str] | None = None,
+        max_pages: int = MAX_PAGES,
+    ):
+        self.scraper = scraper
+        self.fetcher = fetcher or ConcurrentFetcher()
+        self.logger = scraper.logger
+        self.browse_lists = browse_lists or DEFAULT_BROWSE_LISTS
+        self.max_pages = max_pages
+
+    async def __scrape_list(self, client, browse_list: str) -> list[MovieResult]:
+        """Reads a list a page at a time, stopping after the first page without new movies.
+
+        A movie is new if no source has its URL yet. Each page repeats the pages before it, so
+        only the movies not on them are compared, and a page that fails is made up for by the
+        next one.
+        """
+        movies: dict[str, MovieResult] = {}
+        for page in range(1, self.max_pages + 1):
+            url = BROWSE_URL.format(browse_list=browse_list, page=page)
+            result = await self.fetcher.fetch_parsed(self.scraper, client, url, parse_list_page)
+            if not result.ok:
+                # Not a sign the list has nothing new, and the next page repeats this one's movies
+                self.logger.warning(
+                    f"Failed to read page {page} of '{browse_list}', trying the next page: "
+                    f"{result.error!r}"
                 )
-            )
+                continue
+
+            added = [m for m in result.value or [] if m.source.url not in movies]
+            if not added:
+                break
 
-        return movies
+            movies.update((m.source.url, m) for m in added)
+            urls = {m.source.url for m in added}
+            known = await SourceModel.filter(url__in=list(urls)).values_list("url", flat=True)
+            if urls <= set(known):
+                self.logger.debug(f"Page {page} of '{browse_list}' has no new movies, stopping")
+                break
 
-    async def __parse_tiles(self, parser: HTMLParser) -> list[MovieResult]:
-        coroutines = [self.__parse_normal_tiles(parser), self.__parse_video_tiles(parser)]
-        results: tuple[list[MovieResult]] = await asyncio.gather(*coroutines)
-        return [movie for movie_list in results for movie in movie_list]
+        return list(movies.values())
 
     async def run(self) -> list[MovieResult]:
-        async with httpx.AsyncClient() as client:
-            parser = await self.scraper.get_html_parser(client, MOVIE_LIST_URL)
-            return await self.__parse_tiles(parser)
+        async with client_manager.session() as client:
+            lists = await asyncio.gather(
+                *[self.__scrape_list(client, browse_list) for browse_list in self.browse_lists]
+            )
+            return [movie for movies in lists for movie in movies]
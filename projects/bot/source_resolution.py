@@ -0,0 +1,112 @@
+import logging
+from datetime import timedelta
+
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+
+from database.models import MovieModel, SourceModel, SourceResolutionModel
+from projects.bot.titles import normalize_title
+
+UPSERT_RESOLUTION_POSTGRES_SQL = """INSERT INTO source_resolutions (
+    site, title_key, year, url, resolved_at
+)
+VALUES ($1, $2, $3, $4, $5)
+ON CONFLICT (site, title_key, year) DO UPDATE SET
+    url = EXCLUDED.url,
+    resolved_at = EXCLUDED.resolved_at"""
+
+UPSERT_RESOLUTION_SQLITE_SQL = """INSERT INTO source_resolutions (
+    site, title_key, year, url, resolved_at
+)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (site, title_key, year) DO UPDATE SET
+    url = excluded.url,
+    resolved_at = excluded.resolved_at"""
+
+
+def resolution_key(movie: MovieModel) -> tuple[str, int | None]:
+    return normalize_title(movie.title), movie.release_date.year if movie.release_date else None
+
+
+class SourceResolutionCache:
+    """Remembers which URL, if any, a site search found for a movie title.
+
+    Matches are trusted for hit_ttl and failed searches for miss_ttl, after which the movie is
+    searched for again.
+    """
+
+    def __init__(self, hit_ttl: timedelta, miss_ttl: timedelta):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self._resolutions: dict[tuple[str, str, int | None], SourceResolutionModel] = {}
+
+    async def load(self, movies: list[MovieModel]):
+        """Reads the resolutions for every site for the given movies in a single query."""
+        title_keys = list({normalize_title(m.title) for m in movies})
+        if not title_keys:
+            return
+
+        for resolution in await SourceResolutionModel.filter(title_key__in=title_keys):
+            key = (resolution.site, resolution.title_key, resolution.year)
+            self._resolutions[key] = resolution
+
+    def __is_fresh(self, resolution: SourceResolutionModel) -> bool:
+        ttl = self.hit_ttl if resolution.url is not None else self.miss_ttl
+        return timezone.now() - resolution.resolved_at < ttl
+
+    def partition(
+        self, site: str, movies: list[MovieModel]
+    ) -> tuple[list[SourceModel], list[MovieModel]]:
+        """Splits movies into sources known from earlier searches and movies still to search."""
+        sources: list[SourceModel] = []
+        to_search: list[MovieModel] = []
+        skipped = 0
+        for movie in movies:
+            resolution = self._resolutions.get((site, *resolution_key(movie)))
+            if resolution is None or not self.__is_fresh(resolution):
+                to_search.append(movie)
+            elif resolution.url is not None:
+                sources.append(SourceModel(name=site, url=resolution.url, movie_id=movie.id))
+            else:
+                skipped += 1
+
+        self.logger.debug(
+            f"{site}: {len(sources)} cached matches, {skipped} cached misses, "
+            f"{len(to_search)} movies to search"
+        )
+        return sources, to_search
+
+    async def record(self, site: str, searched: list[MovieModel], sources: list[SourceModel]):
+        """Stores the outcome of searching the site for each of the searched movies.
+
+        searched must only hold the movies whose search page was fetched and parsed, a movie
+        without a source among them is remembered as a miss.
+        """
+        urls = {source.movie_id: source.url for source in sources}
+        resolutions: dict[tuple[str, int | None], SourceResolutionModel] = {}
+        now = timezone.now()
+        for movie in searched:
+            key, year = resolution_key(movie)
+            resolutions[(key, year)] = SourceResolutionModel(
+                site=site, title_key=key, year=year, url=urls.get(movie.id), resolved_at=now
+            )
+
+        if not resolutions:
+            return
+
+        for key, resolution in resolutions.items():
+            self._resolutions[(site, *key)] = resolution
+        async with in_transaction() as conn:
+            # Null years never conflict with each other, so those rows are replaced instead
+            no_year = [key for key, year in resolutions if year is None]
+            if no_year:
+                await SourceResolutionModel.filter(
+                    site=site, title_key__in=no_year, year__isnull=True
+                ).using_db(conn).delete()
+
+            postgres = conn.capabilities.dialect == "postgres"
+            await conn.execute_many(
+                UPSERT_RESOLUTION_POSTGRES_SQL if postgres else UPSERT_RESOLUTION_SQLITE_SQL,
+                [[site, r.title_key, r.year, r.url, now] for r in resolutions.values()],
+            )
@@ -0,0 +1,155 @@
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import date
+
+ARTICLES = ("the", "a", "an")
+
+# A trailing article moved to the end for sorting, as in "Matrix, The"
+TRAILING_ARTICLE = re.compile(r"^(.*),\s*(the|a|an)$")
+PUNCTUATION = re.compile(r"[^\w\s]|_")
+# Numbers, including the roman numerals of sequels
+NUMBER = re.compile(r"\d+|[ivx]+")
+
+
+def normalize_title(title: str) -> str:
+    """Folds a title to the form the sites' formats of it share.
+
+    Accents, case, punctuation and a leading or trailing article are dropped, "&" is read as
+    "and" and whitespace is collapsed, so "The Matrix", "Matrix, The" and "the matrix" match.
+    """
+    folded = unicodedata.normalize("NFKD", title)
+    folded = "".join(c for c in folded if not unicodedata.combining(c)).casefold().strip()
+    if match := TRAILING_ARTICLE.match(folded):
+        folded = f"{match[2]} {match[1]}"
+
+    words = PUNCTUATION.sub(" ", folded.replace("&", " and ")).split()
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+
+def release_year(release_date: date | None) -> int | None:
+    return release_date.year if release_date else None
+
+
+def years_match(year: int | None, other: int | None) -> bool:
+    """Whether two release years can be the same movie, the sites differ by a year at times."""
+    return year is None or other is None or abs(year - other) <= 1
+
+
+def numbers(normalized: str) -> list[str]:
+    return [word for word in normalized.split() if NUMBER.fullmatch(word)]
+
+
+def trigrams(normalized: str) -> set[str]:
+    # Spaces are dropped so "Spiderman" and "Spider-Man" share all of theirs
+    padded = "  " + normalized.replace(" ", "") + " "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class TitleEntry:
+    id: int | None
+    key: str
+    year: int | None
+
+
+class TitleIndex:
+    """Movies by normalized title, with trigrams to block near matches of a title on.
+
+    A title matches the movie with the same normalized title and a compatible release year. If
+    there is none and the year is known, the most similar title with the same numbers, sharing
+    at least min_similarity of their trigrams, and a compatible year is taken instead.
+    """
+
+    def __init__(self, min_similarity: float = 0.85):
+        self.min_similarity = min_similarity
+        self._by_title: dict[str, list[TitleEntry]] = {}
+        self._by_key: dict[str, TitleEntry] = {}
+        self._by_trigram: dict[str, set[str]] = {}
+        self._trigram_counts: dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def add(
+        self, title: str, year: int | None, key: str | None = None, id: int | None = None
+    ) -> TitleEntry:
+        normalized = normalize_title(title)
+        entry = TitleEntry(id=id, key=key or normalized, year=year)
+        self._by_key[entry.key] = entry
+        self._by_title.setdefault(normalized, []).append(entry)
+        if normalized not in self._trigram_counts:
+            grams = trigrams(normalized)
+            self._trigram_counts[normalized] = len(grams)
+            for gram in grams:
+                self._by_trigram.setdefault(gram, set()).add(normalized)
+        return entry
+
+    def get(self, key: str) -> TitleEntry | None:
+        return self._by_key.get(key)
+
+    def __similar(self, normalized: str) -> list[tuple[float, str]]:
+        grams = trigrams(normalized)
+        shared: dict[str, int] = {}
+        for gram in grams:
+            for other in self._by_trigram.get(gram, ()):
+                shared[other] = shared.get(other, 0) + 1
+
+        similar = []
+        for other, count in shared.items():
+            score = 2 * count / (len(grams) + self._trigram_counts[other])
+            if score >= self.min_similarity and other != normalized:
+                similar.append((score, other))
+        return sorted(similar, reverse=True)
+
+    def match(self, title: str, year: int | None = None) -> TitleEntry | None:
+        normalized = normalize_title(title)
+        exact = [e for e in self._by_title.get(normalized, []) if years_match(e.year, year)]
+        if exact:
+            # Prefer the same year, then the nearest, then a movie without one
+            return min(exact, key=lambda e: 2 if None in (e.year, year) else abs(e.year - year))
+        if year is None:
+            return None
+
+        # Sequels share most of their trigrams, so near matches must share their numbers too
+        sequel = numbers(normalized)
+        for __, other in self.__similar(normalized):
+            if numbers(other) != sequel:
+                continue
+            for entry in self._by_title[other]:
+                if entry.year is not None and years_match(entry.year, year):
+                    return entry
+        return None
+
+    def resolve(self, title: str, year: int | None) -> TitleEntry:
+        """The entry of the movie a title matches, or a new one with a key of its own.
+
+        A new movie sharing its normalized title with another year's movie is keyed with its
+        year, as in "dune 2021". If that key is taken too, by a movie titled "Dune 2021", it is
+        numbered, as in "dune 2021 #2".
+        """
+        entry = self.match(title, year)
+        if entry is not None:
+            return entry
+
+        key = normalize_title(title)
+        if key in self._by_key and year is not None:
+            key = f"{key} {year}"
+        # Normalized titles have no punctuation, so a numbered key never takes a title's key
+        unique, number = key, 2
+        while unique in self._by_key:
+            unique, number = f"{key} #{number}", number + 1
+        return self.add(title, year, key=unique)
+
+
+def best_match(
+    title: str, year: int | None, candidates: list[tuple[str, int | None]]
+) -> int | None:
+    """The position of the candidate (title, year) that best matches the title, if any does."""
+    index = TitleIndex()
+    for position, (candidate, candidate_year) in enumerate(candidates):
+        index.add(candidate, candidate_year, key=str(position), id=position)
+    entry = index.match(title, year)
+    return entry.id if entry is not None else None
@@ -0,0 +1,39 @@
+import time
+
+import pytest
+from tortoise import Tortoise
+
+from database import database as db
+
+
+class Clock:
+    """A time.monotonic that only moves when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    """A migrated in-memory SQLite database, for tests marked with anyio."""
+    await db.init_database("sqlite://:memory:")
+    yield
+    await Tortoise.close_connections()
@@ -0,0 +1,39 @@
+import logging
+
+import pytest
+
+from projects.bot.fetcher import ConcurrentFetcher
+from projects.bot.rate_limiter import ThrottledError
+
+pytestmark = pytest.mark.anyio
+
+
+class ThrottledSite:
+    logger = logging.getLogger("ThrottledSite")
+
+    def __init__(self):
+        self.requests = 0
+
+    async def get_html(self, client, url, fragment=None):
+        self.requests += 1
+        raise ThrottledError(url, 429)
+
+
+@pytest.mark.parametrize("parsed", [False, True])
+async def test_throttled_page_is_skipped_with_a_warning(caplog, parsed):
+    site = ThrottledSite()
+    fetcher = ConcurrentFetcher(max_requeues=0)
+    url = "https://www.imdb.com/find/?q=dune"
+
+    if parsed:
+        result = await fetcher.fetch_parsed(site, None, url, len)
+    else:
+        result = await fetcher.fetch(site, None, url)
+
+    assert not result.ok
+    assert isinstance(result.error, ThrottledError)
+    assert site.requests == 1
+    [record] = [r for r in caplog.records if r.name == "ConcurrentFetcher"]
+    assert record.levelno == logging.WARNING
+    assert "www.imdb.com" in record.getMessage()
+    assert record.exc_info is None
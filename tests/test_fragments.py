@@ -0,0 +1,64 @@
+import pytest
+
+from projects.bot.fragments import FragmentScanner, PageFragment, extract_fragment
+
+SCORES = PageFragment(b"<score-board", b"</score-board>")
+RATINGS = PageFragment(b'class="rating', b"</p>", after=b'data-testid="label"')
+
+SCORES_PAGE = b'<html><p>x</p><score-board audiencescore="55"><a>9</a></score-board><p>y</p>'
+SCORES_FRAGMENT = b'<score-board audiencescore="55"><a>9</a></score-board>'
+
+RATINGS_PAGE = b'<div><div class="rating-1"><p>8.1</p><p data-testid="label">7.5</p></div>'
+RATINGS_FRAGMENT = b'<div class="rating-1"><p>8.1</p><p data-testid="label">7.5</p>'
+
+PAGES = [(SCORES_PAGE, SCORES, SCORES_FRAGMENT), (RATINGS_PAGE, RATINGS, RATINGS_FRAGMENT)]
+
+
+def scan(fragment: PageFragment, chunks: list[bytes]) -> tuple[bytes | None, int]:
+    """The fragment found and the number of chunks fed until it was."""
+    scanner = FragmentScanner(fragment)
+    for fed, chunk in enumerate(chunks, 1):
+        if (found := scanner.feed(chunk)) is not None:
+            return found, fed
+    return None, len(chunks)
+
+
+def test_extract_fragment():
+    assert extract_fragment(SCORES_PAGE, SCORES) == SCORES_FRAGMENT
+
+
+def test_fragment_starts_at_the_tag_holding_the_start_marker():
+    assert extract_fragment(RATINGS_PAGE, RATINGS) == RATINGS_FRAGMENT
+
+
+def test_end_before_the_after_marker_is_skipped():
+    # The first </p> closes the rating, the fragment runs to the one after the label
+    assert extract_fragment(RATINGS_PAGE, RATINGS).count(b"</p>") == 2
+
+
+def test_missing_end_is_not_a_fragment():
+    assert extract_fragment(b"<html><score-board><a>9</a>", SCORES) is None
+    assert extract_fragment(b'<div class="rating-1"><p>8.1</p>', RATINGS) is None
+
+
+@pytest.mark.parametrize("page, fragment, expected", PAGES)
+def test_markers_split_across_two_chunks(page, fragment, expected):
+    for split in range(1, len(page)):
+        assert scan(fragment, [page[:split], page[split:]])[0] == expected, split
+
+
+@pytest.mark.parametrize("page, fragment, expected", PAGES)
+def test_one_byte_chunks(page, fragment, expected):
+    chunks = [page[i : i + 1] for i in range(len(page))]
+    found, fed = scan(fragment, chunks)
+
+    assert found == expected
+    # Found as soon as its last byte arrives, without waiting for the rest of the page
+    assert fed == page.index(expected) + len(expected)
+
+
+def test_end_marker_before_the_start_is_ignored():
+    # Split across chunks before the start, so it is in the bytes rescanned for the start
+    found, __ = scan(SCORES, [b"<p></score", b"-board><score-board>9</score", b"-board>"])
+
+    assert found == b"<score-board>9</score-board>"
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from projects.bot.http_cache import HttpCache
+
+pytestmark = pytest.mark.anyio
+
+URL = "https://www.imdb.com/title/tt{}/ratings"
+
+
+def stored_bytes(cache: HttpCache) -> int:
+    (total,) = cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+    return total
+
+
+async def test_evicts_the_least_recently_used_beyond_max_bytes(tmp_path):
+    # Random bodies do not compress, so each entry is a little over 1000 bytes
+    cache = HttpCache(str(tmp_path / "cache.db"), max_bytes=3500)
+    for i in range(3):
+        await cache.put(URL.format(i), os.urandom(1000), None, None)
+    await cache.get(URL.format(0))
+    await cache.put(URL.format(3), os.urandom(1000), None, None)
+
+    assert await cache.get(URL.format(1)) is None
+    for i in (0, 2, 3):
+        assert await cache.get(URL.format(i)) is not None
+    assert cache._total_bytes == stored_bytes(cache)
+    cache.close()
+
+
+async def test_replacing_an_entry_counts_its_size_once(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = HttpCache(path, max_bytes=3500)
+    for __ in range(5):
+        await cache.put(URL.format(0), os.urandom(1000), '"v"', None)
+    await cache.put(URL.format(1), os.urandom(1000), None, None)
+
+    assert await cache.get(URL.format(0)) is not None
+    assert cache._total_bytes == stored_bytes(cache)
+    cache.close()
+
+    # The total is read back when the cache is opened again
+    reopened = HttpCache(path, max_bytes=3500)
+    assert reopened._total_bytes == stored_bytes(reopened) > 2000
+    reopened.close()
@@ -0,0 +1,47 @@
+from datetime import date, datetime, timezone
+
+import pytest
+from tortoise import Tortoise, connections
+
+from database import MODELS_PATHS
+from database.migrate import migrate, missing_indexes
+from database.migrations import m0001_baseline
+from database.models import MovieModel
+from projects.bot.persistence import load_title_index
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def baseline_database():
+    """An in-memory SQLite database with the schema from before the migrations."""
+    await Tortoise.init(db_url="sqlite://:memory:", modules=dict(models=MODELS_PATHS))
+    await m0001_baseline.upgrade(connections.get("default"), "sqlite")
+    yield connections.get("default")
+    await Tortoise.close_connections()
+
+
+async def test_title_keys_taken_by_another_title_are_numbered(baseline_database):
+    now = datetime.now(timezone.utc)
+    movies = [
+        ("Dune 2021", date(2020, 12, 1)),
+        ("Dune", date(1984, 12, 14)),
+        ("Dune:", date(2021, 10, 22)),
+        ("The Dune 2021", date(2023, 1, 1)),
+    ]
+    for title, release_date in movies:
+        await baseline_database.execute_query(
+            "INSERT INTO movies (title, release_date, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            [title, release_date, now, now],
+        )
+
+    await migrate()
+
+    keys = await MovieModel.all().order_by("id").values_list("title_key", flat=True)
+    assert keys == ["dune 2021", "dune", "dune 2021 #2", "dune 2021 2023"]
+    assert await missing_indexes() == []
+
+    # The titles are matched to the same movies when they are scraped again
+    titles = await load_title_index()
+    for movie_id, (title, release_date) in enumerate(movies, 1):
+        assert titles.resolve(title, release_date.year).id == movie_id
@@ -0,0 +1,31 @@
+from fastapi.requests import Request
+
+from projects.api.page_cache import page_key
+
+
+def request(query_string: bytes, host: bytes = b"reel.test", scheme: str = "https") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "scheme": scheme,
+            "path": "/search",
+            "query_string": query_string,
+            "headers": [(b"host", host)],
+        }
+    )
+
+
+def test_parameter_order_does_not_matter():
+    assert page_key(request(b"q=dune&page=2")) == page_key(request(b"page=2&q=dune"))
+
+
+def test_encoded_separators_are_kept_apart():
+    assert page_key(request(b"a=1%26b%3D2")) != page_key(request(b"a=1&b=2"))
+
+
+def test_pages_are_kept_per_host_and_scheme():
+    key = page_key(request(b"q=dune"))
+
+    assert page_key(request(b"q=dune", host=b"other.test")) != key
+    assert page_key(request(b"q=dune", scheme="http")) != key
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+import pytest
+
+from database.models import MovieModel, SourceModel
+from projects.bot import HttpxHtmlParser, sites
+from projects.bot.fetcher import ConcurrentFetcher
+from projects.bot.pipeline import StreamingPipeline
+from projects.bot.result_models import MovieResult, ReviewResult, SourceResult
+from projects.bot.scheduler import ReviewScheduler
+from projects.bot.scrapers import (
+    IMDBMovieListScraper,
+    IMDBMovieReviewScraper,
+    RottenTomatoesMovieListScraper,
+    RottenTomatoesMovieReviewScraper,
+)
+from projects.bot.source_resolution import SourceResolutionCache
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def scraped(monkeypatch) -> list[int]:
+    """Stubs out the sites, returning the ids of the sources whose reviews were scraped."""
+    scraped_ids = []
+    listed = [
+        MovieResult(f"Listed {i}", None, SourceResult(sites.IMDB, f"https://imdb/listed/{i}"))
+        for i in range(2)
+    ]
+
+    async def list_run(self):
+        return listed if isinstance(self, IMDBMovieListScraper) else []
+
+    async def get_sources(self, movies):
+        return [], movies
+
+    async def run_sources(self, sources):
+        site = sites.IMDB if isinstance(self, IMDBMovieReviewScraper) else sites.ROTTENTOMATOES
+        reviews = []
+        for source in [s for s in sources if s.name == site]:
+            scraped_ids.append(source.id)
+            review = ReviewResult(source.id, 50, None, 50, None)
+            review.movie_id = source.movie_id
+            reviews.append(review)
+        return reviews
+
+    for scraper in (IMDBMovieListScraper, RottenTomatoesMovieListScraper):
+        monkeypatch.setattr(scraper, "run", list_run)
+    for scraper in (IMDBMovieReviewScraper, RottenTomatoesMovieReviewScraper):
+        monkeypatch.setattr(scraper, "get_sources", get_sources)
+        monkeypatch.setattr(scraper, "run_sources", run_sources)
+    return scraped_ids
+
+
+async def run_pipeline(budget: int):
+    pipeline = StreamingPipeline(
+        HttpxHtmlParser(),
+        ConcurrentFetcher(),
+        SourceResolutionCache(timedelta(days=1), timedelta(days=1)),
+        ReviewScheduler(budget=budget),
+    )
+    return await pipeline.run()
+
+
+@pytest.mark.parametrize("budget, expected", [(0, 6), (4, 4), (6, 6), (10, 6)])
+async def test_review_budget_counts_each_source_once(database, scraped, budget, expected):
+    # Due but not on the lists, so they are queued by the scheduler rather than resolved
+    for i in range(4):
+        movie = await MovieModel.create(title=f"Stored {i}", title_key=f"stored {i}")
+        await SourceModel.create(movie=movie, name=sites.IMDB, url=f"https://imdb/stored/{i}")
+
+    stats = await run_pipeline(budget)
+
+    assert len(scraped) == len(set(scraped)) == expected
+    assert stats.reviews == expected
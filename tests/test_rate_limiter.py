@@ -0,0 +1,125 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from projects.bot.rate_limiter import MAX_RETRY_AFTER, HostRateLimit, parse_retry_after
+
+
+@pytest.fixture
+def sleeps(clock, monkeypatch) -> list[float]:
+    """Sleeps skip ahead on the clock instead of waiting, and are recorded."""
+    slept = []
+
+    async def sleep(seconds: float):
+        slept.append(seconds)
+        clock.advance(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return slept
+
+
+def limit(rate: float = 4.0, **kwargs) -> HostRateLimit:
+    return HostRateLimit(rate, min_rate=0.5, max_rate=8.0, **kwargs)
+
+
+def test_healthy_responses_raise_the_rate_up_to_the_max(clock):
+    host = limit(rate=4.0)
+    host.record(200, 0.1)
+    assert host.rate == pytest.approx(4.25)
+
+    for __ in range(1000):
+        host.record(200, 0.1)
+    assert host.rate == 8.0
+
+
+def test_throttled_response_halves_the_rate_once_per_cooldown(clock):
+    host = limit(rate=4.0, cooldown=2.0)
+    host.record(429, 0.1)
+    host.record(503, 0.1)
+    assert host.rate == 2.0
+    assert host.throttled == 2
+
+    clock.advance(2.0)
+    host.record(429, 0.1)
+    assert host.rate == 1.0
+
+
+def test_rate_never_drops_below_the_min(clock):
+    host = limit(rate=1.0, cooldown=0.0)
+    for __ in range(10):
+        host.record(429, 0.1)
+
+    assert host.rate == 0.5
+
+
+def test_rising_latency_lowers_the_rate(clock):
+    host = limit(rate=4.0)
+    host.record(200, 1.0)
+    rate = host.rate
+
+    for __ in range(10):
+        host.record(200, 5.0)
+    # The average latency takes a response to rise, and it is lowered once per cooldown
+    assert rate / 2 < host.rate < rate
+
+
+def test_latency_jitter_on_a_fast_site_is_ignored(clock):
+    host = limit(rate=4.0)
+    host.record(200, 0.01)
+    for __ in range(10):
+        # Far more than twice the lowest latency, but within the slack
+        host.record(200, 0.2)
+
+    assert host.rate > 4.0
+
+
+def test_server_errors_do_not_raise_the_rate(clock):
+    host = limit(rate=4.0)
+    host.record(500, 0.1)
+
+    assert host.rate == 4.0
+
+
+def test_acquire_spaces_requests_at_the_rate(sleeps):
+    host = limit(rate=2.0)
+
+    async def acquire(times: int):
+        for __ in range(times):
+            await host.acquire()
+
+    asyncio.run(acquire(3))
+    # The first request uses the token the bucket starts with
+    assert sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+
+
+def test_acquire_waits_while_blocked(sleeps):
+    host = limit(rate=2.0)
+    host.block(10)
+    host.block(5)
+
+    asyncio.run(host.acquire())
+    assert sleeps == [10]
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [
+        ("120", 120.0),
+        (" 7 ", 7.0),
+        ("100000", MAX_RETRY_AFTER),
+        ("soon", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_parse_retry_after_seconds(value, seconds):
+    assert parse_retry_after(value) == seconds
+
+
+def test_parse_retry_after_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=60)
+
+    assert parse_retry_after(format_datetime(retry_at, usegmt=True)) == pytest.approx(60, abs=2)
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
@@ -0,0 +1,38 @@
+import httpx
+import pytest
+
+from projects.bot.replay import RecordingTransport, ReplayTransport, ResponseCorpus
+
+pytestmark = pytest.mark.anyio
+
+
+def site(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/missing":
+        return httpx.Response(404, text="Not found")
+    if "if-none-match" in request.headers:
+        return httpx.Response(304, headers={"ETag": '"v1"'})
+    return httpx.Response(200, headers={"ETag": '"v1"'}, text=f"<p>{request.url.path}</p>")
+
+
+async def test_records_full_pages_for_conditional_requests(tmp_path):
+    corpus = ResponseCorpus(str(tmp_path))
+    recording = RecordingTransport(httpx.MockTransport(site), corpus)
+    async with httpx.AsyncClient(transport=recording) as client:
+        response = await client.get("https://a.test/page", headers={"If-None-Match": '"v1"'})
+        assert response.status_code == 200
+
+    async with httpx.AsyncClient(transport=ReplayTransport(corpus)) as client:
+        replayed = await client.get("https://a.test/page")
+    assert replayed.status_code == 200
+    assert replayed.text == "<p>/page</p>"
+
+
+async def test_only_saves_pages_that_were_found(tmp_path):
+    corpus = ResponseCorpus(str(tmp_path))
+    async with httpx.AsyncClient(
+        transport=RecordingTransport(httpx.MockTransport(site), corpus)
+    ) as client:
+        assert (await client.get("https://a.test/missing")).status_code == 404
+        await client.get("https://a.test/page")
+
+    assert corpus.urls() == ["https://a.test/page"]
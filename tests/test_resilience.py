@@ -0,0 +1,114 @@
+import asyncio
+
+import httpx
+import pytest
+
+from projects.bot.resilience import CircuitBreaker, CircuitOpenError, ResilientTransport
+
+
+def test_closed_circuit_allows_requests(clock):
+    breaker = CircuitBreaker(failure_threshold=3)
+
+    assert all(breaker.allow() for __ in range(10))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_after_the_reset_timeout_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+
+    clock.advance(29.9)
+    assert not breaker.allow()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.advance(0.1)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes_the_circuit(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.advance(30)
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_opens_the_circuit_for_another_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for __ in range(5):
+        breaker.record_failure()
+    clock.advance(30)
+    assert breaker.allow()
+
+    # A single failure is enough while half open
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.advance(29)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+
+
+def test_abandoned_probe_lets_another_request_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.advance(30)
+    assert breaker.allow()
+
+    breaker.abandon_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+@pytest.mark.parametrize(
+    "status_code, opens", [(500, True), (502, True), (503, False), (404, False)]
+)
+def test_transport_counts_server_errors_as_failures(clock, status_code, opens):
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request)
+        return httpx.Response(status_code)
+
+    transport = ResilientTransport(httpx.MockTransport(handler), hedge=False, failure_threshold=2)
+
+    async def get() -> int:
+        async with httpx.AsyncClient(transport=transport) as client:
+            return (await client.get("https://a.com/")).status_code
+
+    assert asyncio.run(get()) == status_code
+    assert asyncio.run(get()) == status_code
+    if opens:
+        with pytest.raises(CircuitOpenError):
+            asyncio.run(get())
+        assert len(sent) == 2
+    else:
+        assert asyncio.run(get()) == status_code
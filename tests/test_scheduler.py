@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+import pytest
+from tortoise import timezone
+
+from database.models import LatestReviewModel, MovieModel, ReviewModel, SourceModel
+from projects.bot.scheduler import ReviewScheduler
+
+pytestmark = pytest.mark.anyio
+
+RELEASE_AGES = [None, -10, 3, 14, 15, 30, 60, 61, 200, 365, 366, 900]
+SCRAPED_AGES = [None, 2, 4, 7, 13, 25, 50, 100, 200, 400, 800]
+
+
+@pytest.fixture
+async def sources(database) -> list[SourceModel]:
+    """A source for every release age and hours since its last scrape, changing scores or not."""
+    now = timezone.now()
+    created = []
+    for release_age in RELEASE_AGES:
+        release_date = None if release_age is None else now.date() - timedelta(days=release_age)
+        for scraped_age in SCRAPED_AGES:
+            for changing in (False, True):
+                title = f"{release_age} {scraped_age} {changing}"
+                movie = await MovieModel.create(
+                    title=title, title_key=title, release_date=release_date
+                )
+                source = await SourceModel.create(movie=movie, name="IMDB", url=title)
+                created.append(source)
+                if scraped_age is None:
+                    continue
+
+                scraped_at = now - timedelta(hours=scraped_age)
+                await LatestReviewModel.create(
+                    source=source, audience_score=50, scraped_at=scraped_at, changed_at=scraped_at
+                )
+                for score in (40, 50) if changing else (50,):
+                    review = await ReviewModel.create(source=source, audience_score=score)
+                    await ReviewModel.filter(id=review.id).update(created_at=scraped_at)
+    return created
+
+
+@pytest.mark.parametrize("later", [timedelta(0), timedelta(hours=5), timedelta(days=20)])
+async def test_plan_only_reads_sources_that_may_be_due(sources, later):
+    scheduler = ReviewScheduler()
+    now = timezone.now() + later
+    every = await scheduler.plan(now, source_ids=[s.id for s in sources])
+    candidates = await scheduler.plan(now)
+
+    due = {s.source.id for s in every if s.is_due(now)}
+    assert {s.source.id for s in candidates if s.is_due(now)} == due
+    assert len(due) <= len(candidates) <= len(every)
+
+
+async def test_plan_skips_recently_scraped_sources(sources):
+    candidates = {s.source.url for s in await ReviewScheduler().plan()}
+
+    assert "3 None False" in candidates
+    # Scraped within half of even the shortest interval
+    assert not any(url.split()[1] == "2" for url in candidates)
+    assert "900 200 True" not in candidates
+    assert "900 400 False" in candidates
+
+
+async def test_due_sources_within_budget(sources):
+    scheduler = ReviewScheduler(budget=5)
+    never_scraped = {s.id for s in sources if s.url.split()[1] == "None"}
+
+    due = await scheduler.due_sources()
+    assert len(due) == 5
+    # Sources never scraped come first
+    assert {s.id for s in due} <= never_scraped
+    assert await scheduler.due_sources() == []
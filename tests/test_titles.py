@@ -0,0 +1,110 @@
+import pytest
+
+from projects.bot.titles import TitleIndex, best_match, normalize_title
+
+
+@pytest.mark.parametrize(
+    "title, normalized",
+    [
+        ("The Matrix", "matrix"),
+        ("Matrix, The", "matrix"),
+        ("  the   MATRIX ", "matrix"),
+        ("Amélie", "amelie"),
+        ("Spider-Man: No Way Home", "spider man no way home"),
+        ("Fast & Furious", "fast and furious"),
+        ("A Quiet Place", "quiet place"),
+        ("Boy and the Heron, The", "boy and the heron"),
+        # A title that is only an article keeps it
+        ("A", "a"),
+        ("It", "it"),
+    ],
+)
+def test_normalize_title(title, normalized):
+    assert normalize_title(title) == normalized
+
+
+def test_match_ignores_articles_and_punctuation():
+    titles = TitleIndex()
+    entry = titles.add("The Matrix", 1999)
+
+    assert titles.match("Matrix, The", 1999) is entry
+    assert titles.match("the matrix") is entry
+
+
+def test_match_tolerates_a_year_apart():
+    titles = TitleIndex()
+    entry = titles.add("Oppenheimer", 2023)
+
+    assert titles.match("Oppenheimer", 2024) is entry
+    assert titles.match("Oppenheimer", 2025) is None
+
+
+def test_match_prefers_the_same_year():
+    titles = TitleIndex()
+    older = titles.add("Dune", 1984, key="dune")
+    newer = titles.add("Dune", 2021, key="dune 2021")
+
+    assert titles.match("Dune", 1984) is older
+    assert titles.match("Dune", 2021) is newer
+    assert titles.match("Dune", 2022) is newer
+    assert titles.match("Dune", 2000) is None
+
+
+def test_near_match_needs_a_year():
+    titles = TitleIndex()
+    entry = titles.add("Spider-Man: Across the Spider-Verse", 2023)
+
+    assert titles.match("Spiderman: Across the Spiderverse", 2023) is entry
+    assert titles.match("Spiderman: Across the Spiderverse") is None
+
+
+@pytest.mark.parametrize(
+    "stored, scraped",
+    [
+        ("Rocky II", "Rocky III"),
+        ("Toy Story 3", "Toy Story 4"),
+        ("Dune", "Dune: Part Two"),
+    ],
+)
+def test_sequels_do_not_match(stored, scraped):
+    titles = TitleIndex(min_similarity=0.5)
+    titles.add(stored, 2020)
+
+    assert titles.match(scraped, 2020) is None
+
+
+def test_resolve_keys_a_remake_with_its_year():
+    titles = TitleIndex()
+    original = titles.resolve("Dune", 1984)
+    remake = titles.resolve("Dune", 2021)
+
+    assert (original.key, remake.key) == ("dune", "dune 2021")
+    assert titles.resolve("Dune", 2021) is remake
+    assert len(titles) == 2
+
+
+def test_resolve_numbers_a_key_taken_by_another_title():
+    titles = TitleIndex()
+    titles.resolve("Dune", 1984)
+    titled_with_year = titles.resolve("Dune 2021", None)
+    remake = titles.resolve("Dune", 2021)
+
+    assert titled_with_year.key == "dune 2021"
+    assert remake.key == "dune 2021 #2"
+    assert titles.get("dune 2021") is titled_with_year
+    assert len(titles) == 3
+
+
+def test_resolve_without_a_year_matches_any_year():
+    titles = TitleIndex()
+    entry = titles.resolve("Barbie", 2023)
+
+    assert titles.resolve("Barbie", None) is entry
+
+
+def test_best_match():
+    candidates = [("Dune", 1984), ("Dune", 2021), ("Dune: Part Two", 2024)]
+
+    assert best_match("Dune", 2021, candidates) == 1
+    assert best_match("Dune: Part Two", 2024, candidates) == 2
+    assert best_match("Arrival", 2016, candidates) is None